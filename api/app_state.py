@@ -1,5 +1,7 @@
 nominative_service = None
 gisn_service = None
+risk_table = None
+warmup = None
 
 def set_services(nominative, gisn):
     global nominative_service, gisn_service
@@ -11,3 +13,22 @@ def get_nominative_service():
 
 def get_gisn_service():
     return gisn_service
+
+def set_risk_table(table):
+    global risk_table
+    risk_table = table
+
+def get_risk_table():
+    return risk_table
+
+def set_warmup(state):
+    global warmup
+    warmup = state
+
+def get_warmup():
+    return warmup
+
+def close_services():
+    for service in (nominative_service, gisn_service):
+        if service is not None:
+            service.close()
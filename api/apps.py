@@ -1,21 +1,174 @@
+import atexit
+
 from django.apps import AppConfig
 from django.conf import settings
 from api.services import RealNominativeQuery, MockNominativeQuery
 from api.services import RealGISNQuery, MockGISNQuery
-from api import app_state
+from api.services import CachedNominativeQuery, GeocodeCache
+from api.services import CachedGISNQuery, GISNResultCache, ReplicaGISNQuery
+from api.services import CachedTileGISNQuery, RiskTable, TileCache
+from api.services import SingleFlightGISNQuery, SingleFlightNominativeQuery
+from api.services import RateLimitedNominativeQuery, SharedTokenBucket
+from api.services import (
+    CircuitBreaker,
+    CircuitBreakerGISNQuery,
+    CircuitBreakerNominativeQuery,
+)
+from api.services import LayerChangeDetector, LayerChangePoller
+from api import app_state, metrics
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
     def ready(self):
-        """Register the appropriate API service."""
+        """Register the appropriate API service and configure metrics.
+
+        Real services own pooled HTTP clients; any previously registered
+        services are closed, and the current ones are closed at exit.
+        """
         use_mock_nominative = getattr(settings, "USE_MOCK_NOMINATIVE", False)
         use_mock_gisn = getattr(settings, "USE_MOCK_GISN", False)
-        nominative_class = MockNominativeQuery if use_mock_nominative else RealNominativeQuery
-        gisn_class = MockGISNQuery if use_mock_gisn else RealGISNQuery
 
-        nominative_service = nominative_class()
-        gisn_service = gisn_class()
+        nominative_service = (
+            MockNominativeQuery() if use_mock_nominative
+            else self._real_nominative_service()
+        )
+        gisn_service = (
+            MockGISNQuery() if use_mock_gisn else self._real_gisn_service()
+        )
 
+        app_state.close_services()
         app_state.set_services(nominative_service, gisn_service)
+        app_state.set_risk_table(
+            RiskTable(
+                settings.RISK_TABLE_PATH,
+                max_age=settings.RISK_TABLE_MAX_AGE,
+            )
+            if getattr(settings, "RISK_TABLE_ENABLED", False) else None
+        )
+        atexit.register(app_state.close_services)
+
+        metrics.configure(
+            getattr(settings, "METRICS_DIR", None),
+            flush_interval=getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0),
+        )
+
+    @staticmethod
+    def _real_nominative_service():
+        """Build the Nominatim service with its caching layers.
+
+        Requests pass through the geocode cache first, then single-flight
+        coalescing, the circuit breaker and the rate limiter, and only
+        then reach Nominatim.
+        """
+        service = RealNominativeQuery(
+            timeout=getattr(settings, "NOMINATIM_TIMEOUT", 5.0),
+        )
+        if getattr(settings, "NOMINATIM_MIN_INTERVAL", 0) > 0:
+            service = RateLimitedNominativeQuery(
+                service,
+                SharedTokenBucket(
+                    settings.NOMINATIM_RATE_LIMIT_PATH,
+                    rate=1 / settings.NOMINATIM_MIN_INTERVAL,
+                    burst=settings.NOMINATIM_RATE_LIMIT_BURST,
+                    max_wait=settings.NOMINATIM_MAX_QUEUE_WAIT,
+                ),
+            )
+        if getattr(settings, "CIRCUIT_BREAKER_ENABLED", False):
+            service = CircuitBreakerNominativeQuery(
+                service, ApiConfig._circuit_breaker("nominatim")
+            )
+        if getattr(settings, "SINGLE_FLIGHT_ENABLED", False):
+            service = SingleFlightNominativeQuery(service)
+        if getattr(settings, "GEOCODE_CACHE_ENABLED", False):
+            service = CachedNominativeQuery(
+                service,
+                GeocodeCache(
+                    settings.GEOCODE_CACHE_PATH,
+                    ttl=settings.GEOCODE_CACHE_TTL,
+                    max_entries=settings.GEOCODE_CACHE_MAX_ENTRIES,
+                    stale_ttl=settings.GEOCODE_CACHE_STALE_TTL,
+                ),
+            )
+        return service
+
+    @staticmethod
+    def _real_gisn_service():
+        """Build the GISN service with its caching layers.
+
+        Requests are answered from the local replica when enabled; the
+        live path goes through the tile and result caches, then
+        single-flight coalescing and the circuit breaker, and only then
+        reaches GISN.
+        """
+        service = RealGISNQuery(
+            payload_profile=getattr(settings, "GISN_PAYLOAD_PROFILE", "full"),
+            two_phase=getattr(settings, "GISN_TWO_PHASE", False),
+            page_size=getattr(settings, "GISN_PAGE_SIZE", 1000),
+            page_parallelism=getattr(settings, "GISN_PAGE_PARALLELISM", 4),
+            timeout=getattr(settings, "GISN_TIMEOUT", 10.0),
+        )
+        if getattr(settings, "CIRCUIT_BREAKER_ENABLED", False):
+            service = CircuitBreakerGISNQuery(
+                service, ApiConfig._circuit_breaker("gisn")
+            )
+        if getattr(settings, "SINGLE_FLIGHT_ENABLED", False):
+            service = SingleFlightGISNQuery(service)
+        if getattr(settings, "GISN_CACHE_ENABLED", False):
+            service = CachedGISNQuery(
+                service,
+                GISNResultCache(
+                    cell_size=settings.GISN_CACHE_CELL_SIZE,
+                    radius_buckets=settings.GISN_CACHE_RADIUS_BUCKETS,
+                    ttl=settings.GISN_CACHE_TTL,
+                    max_entries=settings.GISN_CACHE_MAX_ENTRIES,
+                    max_bytes=settings.GISN_CACHE_MAX_BYTES,
+                    stale_ttl=settings.GISN_CACHE_STALE_TTL,
+                ),
+            )
+        if getattr(settings, "TILE_CACHE_ENABLED", False):
+            service = CachedTileGISNQuery(
+                service,
+                TileCache(
+                    ttl=settings.TILE_CACHE_TTL,
+                    max_entries=settings.TILE_CACHE_MAX_ENTRIES,
+                ),
+            )
+        if getattr(settings, "USE_GISN_REPLICA", False):
+            service = ReplicaGISNQuery(
+                settings.GISN_REPLICA_PATH, fallback=service
+            )
+        return service
+
+    @staticmethod
+    def start_layer_change_poller() -> LayerChangePoller | None:
+        """Start invalidating this process's GISN caches and risk table,
+        and refreshing its replica, on layer edits.
+
+        Called per worker from deploy/gunicorn.conf.py. Returns None when
+        polling is disabled or GISN is mocked.
+        """
+        interval = getattr(settings, "GISN_CHANGE_POLL_INTERVAL", 0)
+        if interval <= 0 or getattr(settings, "USE_MOCK_GISN", False):
+            return None
+        service = app_state.get_gisn_service()
+        poller = LayerChangePoller(
+            LayerChangeDetector(
+                RealGISNQuery(timeout=getattr(settings, "GISN_TIMEOUT", 10.0))
+            ),
+            service,
+            interval,
+            risk_table=app_state.get_risk_table(),
+            replica=service if isinstance(service, ReplicaGISNQuery) else None,
+        )
+        poller.start()
+        return poller
+
+    @staticmethod
+    def _circuit_breaker(upstream: str) -> CircuitBreaker:
+        return CircuitBreaker(
+            upstream,
+            failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_BREAKER_RESET_TIMEOUT,
+        )
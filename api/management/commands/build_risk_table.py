@@ -0,0 +1,77 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services import STANDARD_RADII, GISNLayerReplica, RiskTable
+from api.services.geocode_cache import normalize_street
+from api.services.risk_table import geocoded_addresses, parcel_addresses
+from api.streets import STREETS_PATH, StreetList
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the dangerous parcels around every known address into "
+        "the risk table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.RISK_TABLE_PATH,
+            help="Table file to write (default: RISK_TABLE_PATH).",
+        )
+        parser.add_argument(
+            "--replica",
+            default=settings.GISN_REPLICA_PATH,
+            help="GISN layer replica to read (default: GISN_REPLICA_PATH).",
+        )
+        parser.add_argument(
+            "--geocode-cache",
+            default=settings.GEOCODE_CACHE_PATH,
+            help=(
+                "Geocode cache whose coordinates are preferred over parcel "
+                "centers (default: GEOCODE_CACHE_PATH)."
+            ),
+        )
+        parser.add_argument(
+            "--radii",
+            default=",".join(str(radius) for radius in STANDARD_RADII),
+            help="Comma separated radii in meters (default: 50,100,200,500).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            replica = GISNLayerReplica.load(options["replica"])
+        except FileNotFoundError as e:
+            raise CommandError(
+                f"No GISN replica at {options['replica']}, "
+                "run sync_gisn_layer first"
+            ) from e
+        try:
+            radii = [int(radius) for radius in options["radii"].split(",")]
+        except ValueError as e:
+            raise CommandError(f"Invalid --radii: {options['radii']}") from e
+
+        addresses = parcel_addresses(replica)
+        try:
+            # Geocoded coordinates are the ones the live path would use
+            addresses.update(geocoded_addresses(options["geocode_cache"]))
+        except sqlite3.Error as e:
+            self.stderr.write(f"Skipping geocode cache: {e!s}")
+
+        streets = {
+            normalize_street(name)
+            for name in StreetList.load(STREETS_PATH).names
+        }
+        addresses = {
+            key: coordinate for key, coordinate in addresses.items()
+            if key.rpartition("|")[0] in streets
+        }
+
+        count = RiskTable.build(
+            options["output"], replica, addresses, radii=radii
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {count} addresses to {options['output']}"
+        ))
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services import GISNLayerReplica, RealGISNQuery
+
+
+class Command(BaseCommand):
+    help = "Download the full GISN layer 772 into the local replica file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=1000,
+            help="Features requested per page (default: 1000).",
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.GISN_REPLICA_PATH,
+            help="Replica file to write (default: GISN_REPLICA_PATH).",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Only download the features edited since the existing "
+                "replica was synced, if the layer records edit times."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        service = RealGISNQuery()
+        try:
+            if options["incremental"] and self._refresh(service, options):
+                return
+            replica = GISNLayerReplica.sync(
+                service, page_size=options["page_size"]
+            )
+        except Exception as e:
+            raise CommandError(f"GISN layer sync failed: {e!s}") from e
+        finally:
+            service.close()
+
+        replica.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {len(replica)} features to {options['output']}"
+        ))
+
+    def _refresh(self, service, options) -> bool:
+        """Update the existing replica in place, False if a full sync is needed."""
+        try:
+            replica = GISNLayerReplica.load(options["output"])
+        except FileNotFoundError:
+            return False
+        changed = replica.refresh(service)
+        if changed is None:
+            self.stdout.write("Edits cannot be listed, syncing the full layer")
+            return False
+        if changed:
+            replica.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {changed} features in {options['output']}"
+        ))
+        return True
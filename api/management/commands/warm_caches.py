@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.warmup import (
+    popular_coordinates,
+    read_addresses,
+    warm_caches,
+    warm_server,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocode hot addresses into the shared geocode cache and, with "
+        "--url, request their analyses from a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--addresses",
+            default=settings.WARMUP_ADDRESSES_PATH,
+            help=(
+                "Hot-address list, one 'street number' per line "
+                "(default: WARMUP_ADDRESSES_PATH)."
+            ),
+        )
+        parser.add_argument(
+            "--history",
+            type=int,
+            default=settings.WARMUP_HISTORY,
+            help=(
+                "Number of most requested cached geocodes to warm "
+                "(default: WARMUP_HISTORY)."
+            ),
+        )
+        parser.add_argument(
+            "--url",
+            help=(
+                "Base URL of a running server, e.g. http://127.0.0.1:8080, "
+                "whose nginx and worker caches to warm."
+            ),
+        )
+        parser.add_argument(
+            "--radius",
+            type=int,
+            default=settings.WARMUP_RADIUS,
+            help="Search radius in meters (default: WARMUP_RADIUS).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.WARMUP_CONCURRENCY,
+            help="Requests in flight (default: WARMUP_CONCURRENCY).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.WARMUP_INTERVAL,
+            help=(
+                "Minimum seconds between requests (default: "
+                "WARMUP_INTERVAL). Nominatim keeps its own rate limit."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        addresses = []
+        if options["addresses"]:
+            try:
+                addresses = read_addresses(options["addresses"])
+            except OSError as e:
+                raise CommandError(
+                    f"Cannot read {options['addresses']}: {e!s}"
+                ) from e
+        coordinates = []
+        if getattr(settings, "GEOCODE_CACHE_ENABLED", False):
+            coordinates = popular_coordinates(
+                settings.GEOCODE_CACHE_PATH, options["history"]
+            )
+        limits = {
+            "concurrency": options["concurrency"],
+            "interval": options["interval"],
+        }
+
+        # GISN caches live in each worker, so only the geocodes are useful
+        # from this process
+        stats = warm_caches(addresses, gisn=False, **limits)
+        self.stdout.write(
+            f"Geocoded {stats['done']} addresses ({stats['failed']} failed)"
+        )
+        if options["url"]:
+            stats = warm_server(
+                options["url"], addresses, coordinates,
+                radius=options["radius"], **limits,
+            )
+            self.stdout.write(
+                f"Requested {stats['done']} analyses from {options['url']} "
+                f"({stats['failed']} failed)"
+            )
+        self.stdout.write(self.style.SUCCESS("Caches warmed"))
@@ -0,0 +1,386 @@
+"""Prometheus-format metrics, aggregated across worker processes.
+
+Each process keeps its metrics in memory and, when a metrics directory
+is configured, periodically writes a snapshot to ``metrics-<pid>.json``
+in it. Rendering merges the local values with the other processes'
+snapshots: counters and histograms are summed over all files, including
+those of exited workers, while gauges only count live processes.
+"""
+
+import atexit
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()
+    )
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(
+        self, registry: "MetricsRegistry", name: str, documentation: str,
+        labelnames=(),
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, "
+                f"got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self, self._key(labels), amount)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self, self._key(labels), amount)
+
+    def dec(self, amount: float = 1, **labels):
+        self.registry._add(self, self._key(labels), -amount)
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels):
+        """Count the enclosed block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        self.registry._observe(self, self._key(labels), value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsRegistry:
+    """Holds the metrics of this process and renders all processes.
+
+    Args:
+        directory: Directory shared by the worker processes. Without it,
+            only this process's metrics are rendered.
+        flush_interval: Seconds between snapshot writes.
+    """
+
+    def __init__(
+        self, directory: str | Path | None = None,
+        flush_interval: float = 1.0,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        # {metric name: {label values: value or [bucket counts..., sum]}}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+        self._pid = None
+
+    # Registration
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        self._values[metric.name] = {}
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(
+            self, name, documentation, labelnames, buckets=buckets
+        ))
+
+    # Updates
+
+    def _add(self, metric, key, amount):
+        with self._lock:
+            values = self._values[metric.name]
+            values[key] = values.get(key, 0) + amount
+            self._touch()
+
+    def _observe(self, metric, key, value):
+        with self._lock:
+            values = self._values[metric.name]
+            counts = values.get(key)
+            if counts is None:
+                counts = values[key] = [0] * (len(metric.buckets) + 2)
+            for index, bound in enumerate(metric.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(metric.buckets)] += 1
+            counts[-1] += value
+            self._touch()
+
+    def _touch(self):
+        self._dirty = True
+        if self.directory is None:
+            return
+        pid = os.getpid()
+        if self._pid != pid:
+            # First update in this (possibly forked) process
+            self._pid = pid
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    # Snapshots
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in self._values.items()
+            }
+
+    def flush(self):
+        """Write this process's snapshot to the metrics directory."""
+        if self.directory is None:
+            return
+        self._dirty = False
+        snapshot = self._snapshot()
+        path = self.directory / f"metrics-{os.getpid()}.json"
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(snapshot))
+            tmp_path.replace(path)
+        except OSError:
+            logger.exception("Failed to write metrics snapshot %s", path)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _other_snapshots(self):
+        """Yield (pid, snapshot) for the other processes' files."""
+        if self.directory is None or not self.directory.exists():
+            return
+        for path in self.directory.glob("metrics-*.json"):
+            try:
+                pid = int(path.stem.removeprefix("metrics-"))
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                yield pid, json.loads(path.read_text())
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable metrics file %s", path)
+
+    def collect(self) -> dict:
+        """Return the values of every metric summed over all processes."""
+        merged = {
+            name: {
+                tuple(key): value for key, value in values
+            }
+            for name, values in self._snapshot().items()
+        }
+        for pid, snapshot in self._other_snapshots():
+            alive = None
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                if metric.type_name == "gauge":
+                    if alive is None:
+                        alive = _pid_alive(pid)
+                    if not alive:
+                        continue
+                target = merged[name]
+                for key, value in values:
+                    key = tuple(key)
+                    if isinstance(value, list):
+                        current = target.get(key)
+                        target[key] = (
+                            value if current is None
+                            else [a + b for a, b in zip(
+                                current, value, strict=True
+                            )]
+                        )
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            for key, value in sorted(values.items()):
+                labels = dict(zip(metric.labelnames, key, strict=True))
+                if metric.type_name != "histogram":
+                    lines.append(
+                        f"{name}{_format_labels(labels)} "
+                        f"{_format_value(value)}"
+                    )
+                    continue
+                cumulative = 0
+                for bound, count in zip(
+                    (*metric.buckets, math.inf), value[:-1], strict=True
+                ):
+                    cumulative += count
+                    bucket_labels = {**labels, "le": _format_value(bound)}
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} "
+                        f"{_format_value(cumulative)}"
+                    )
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} "
+                    f"{_format_value(value[-1])}"
+                )
+                lines.append(
+                    f"{name}_count{_format_labels(labels)} "
+                    f"{_format_value(cumulative)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def configure(directory: str | Path | None, flush_interval: float = 1.0):
+    """Point the process registry at the shared metrics directory."""
+    registry.directory = Path(directory) if directory else None
+    registry.flush_interval = flush_interval
+
+
+STAGE_DURATION = registry.histogram(
+    "tamaod_stage_duration_seconds",
+    "Time spent in each stage of an analyze request.",
+    ["stage"],
+)
+UPSTREAM_REQUESTS = registry.counter(
+    "tamaod_upstream_requests_total",
+    "Requests sent to upstream services, by response status.",
+    ["upstream", "status"],
+)
+REQUEST_DURATION = registry.histogram(
+    "tamaod_request_duration_seconds",
+    "Time to produce a response, by endpoint.",
+    ["endpoint"],
+)
+RESPONSE_SIZE = registry.histogram(
+    "tamaod_response_size_bytes",
+    "Size of response bodies, by endpoint.",
+    ["endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+IN_FLIGHT = registry.gauge(
+    "tamaod_in_flight_requests",
+    "Requests currently being handled, by endpoint.",
+    ["endpoint"],
+)
+NOMINATIM_QUEUE = registry.gauge(
+    "tamaod_nominatim_queue_depth",
+    "Geocodes waiting for a Nominatim rate limit slot.",
+)
+NOMINATIM_QUEUE_WAIT = registry.histogram(
+    "tamaod_nominatim_queue_wait_seconds",
+    "Time geocodes waited for a Nominatim rate limit slot.",
+)
+CIRCUIT_OPEN = registry.gauge(
+    "tamaod_circuit_open",
+    "Workers whose circuit breaker for an upstream is not closed.",
+    ["upstream"],
+)
+CIRCUIT_REJECTED = registry.counter(
+    "tamaod_circuit_rejected_total",
+    "Upstream calls refused because the circuit breaker was open.",
+    ["upstream"],
+)
+STALE_RESPONSES = registry.counter(
+    "tamaod_stale_responses_total",
+    "Cached upstream results served after they expired.",
+    ["upstream"],
+)
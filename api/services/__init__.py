@@ -1,14 +1,91 @@
 from .real import RealNominativeQuery, RealGISNQuery
 from .mock import MockNominativeQuery, MockGISNQuery
-from .services import handle_address, risk_assessment
-from .base import DataRetrievalError
+from .services import (
+    handle_address,
+    handle_address_async,
+    handle_bbox_async,
+    handle_coordinate,
+    handle_coordinate_async,
+    handle_tile_async,
+    in_tel_aviv,
+    iter_risk_assessment,
+    risk_assessment,
+    stream_address_async,
+    stream_coordinate_async,
+)
+from .base import DataRetrievalError, UpstreamError, track_staleness
+from .deadline import DeadlineExceededError, deadline
+from .breaker import (
+    CircuitBreaker,
+    CircuitBreakerGISNQuery,
+    CircuitBreakerNominativeQuery,
+    CircuitOpenError,
+)
+from .batch import analyze_batch_async
+from .ratelimit import (
+    IntervalRateLimiter,
+    RateLimitedNominativeQuery,
+    SharedTokenBucket,
+)
+from .gisn_cache import CachedGISNQuery, GISNResultCache
+from .tile_cache import CachedTileGISNQuery, TileCache
+from .replica import GISNLayerReplica, ReplicaGISNQuery
+from .layer_changes import LayerChangeDetector, LayerChangePoller
+from .risk_table import STANDARD_RADII, RiskTable
+from .singleflight import (
+    SingleFlight,
+    SingleFlightGISNQuery,
+    SingleFlightNominativeQuery,
+)
+from .geocode_cache import (
+    CachedNominativeQuery,
+    GeocodeCache,
+    normalize_address,
+)
 
 __all__ = [
+    "STANDARD_RADII",
+    "CachedGISNQuery",
+    "CachedNominativeQuery",
+    "CachedTileGISNQuery",
+    "CircuitBreaker",
+    "CircuitBreakerGISNQuery",
+    "CircuitBreakerNominativeQuery",
+    "CircuitOpenError",
     "DataRetrievalError",
+    "DeadlineExceededError",
+    "GISNLayerReplica",
+    "GISNResultCache",
+    "GeocodeCache",
+    "IntervalRateLimiter",
+    "LayerChangeDetector",
+    "LayerChangePoller",
     "MockGISNQuery",
     "MockNominativeQuery",
+    "RateLimitedNominativeQuery",
     "RealGISNQuery",
     "RealNominativeQuery",
+    "ReplicaGISNQuery",
+    "RiskTable",
+    "SharedTokenBucket",
+    "SingleFlight",
+    "SingleFlightGISNQuery",
+    "SingleFlightNominativeQuery",
+    "TileCache",
+    "UpstreamError",
+    "analyze_batch_async",
+    "deadline",
     "handle_address",
+    "handle_address_async",
+    "handle_bbox_async",
+    "handle_coordinate",
+    "handle_coordinate_async",
+    "handle_tile_async",
+    "in_tel_aviv",
+    "iter_risk_assessment",
+    "normalize_address",
     "risk_assessment",
+    "stream_address_async",
+    "stream_coordinate_async",
+    "track_staleness",
 ]
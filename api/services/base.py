@@ -1,4 +1,43 @@
+import contextvars
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+
+# Building stages of GISN parcels that are reported as dangerous.
+DANGEROUS_STAGES = ("בבניה",)
+
+# Object id attribute of GISN features, unless the layer metadata names
+# another one
+DEFAULT_OBJECT_ID_FIELD = "OBJECTID"
+
+# (min_lon, min_lat, max_lon, max_lat) around Tel Aviv-Yafo, the area GISN
+# covers.
+TEL_AVIV_BBOX = (34.73, 32.02, 34.86, 32.15)
+
+_staleness = contextvars.ContextVar("staleness", default=None)
+
+
+@contextmanager
+def track_staleness():
+    """Note whether any result used in the enclosed block was stale.
+
+    Yields a dict whose ``"stale"`` entry becomes True once a service
+    calls ``mark_stale`` within the block (in the same context).
+    """
+    state = {"stale": False}
+    token = _staleness.set(state)
+    try:
+        yield state
+    finally:
+        _staleness.reset(token)
+
+
+def mark_stale():
+    """Flag the current request's result as served from stale data."""
+    state = _staleness.get()
+    if state is not None:
+        state["stale"] = True
 
 
 class DataRetrievalError(Exception):
@@ -19,9 +58,24 @@ class DataRetrievalError(Exception):
         self.status_code = status_code
 
 
+class UpstreamError(DataRetrievalError):
+    """Exception raised when an upstream service fails or is unreachable.
+
+    Unlike other retrieval errors (e.g. an address that cannot be
+    located), these say something about the health of the upstream.
+    """
+
+
 class BaseNominativeQuery(ABC):
     """Abstract base class for API services."""
 
+    def close(self):  # noqa: B027
+        """Release resources such as pooled HTTP connections."""
+
+    def stats(self) -> dict:
+        """Return service statistics, keyed by component name."""
+        return {}
+
     @abstractmethod
     def fetch_data(
         self, street: str, house_number: int
@@ -39,10 +93,72 @@ class BaseNominativeQuery(ABC):
             DataRetrievalError: If the data retrieval fails.
         """
 
+    async def fetch_data_async(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        """Async variant of fetch_data.
+
+        Runs ``fetch_data`` in a worker thread by default; services with
+        an async HTTP client override this to avoid blocking a thread.
+        """
+        return await sync_to_async(self.fetch_data, thread_sensitive=False)(
+            street, house_number
+        )
+
 
 class BaseGISNQuery(ABC):
     """Abstract base class for API services."""
 
+    def close(self):  # noqa: B027
+        """Release resources such as pooled HTTP connections."""
+
+    def stats(self) -> dict:
+        """Return service statistics, keyed by component name."""
+        return {}
+
+    @property
+    def object_id_field(self) -> str:
+        """Name of the attribute holding each feature's object id."""
+        return DEFAULT_OBJECT_ID_FIELD
+
+    def invalidate(self, envelopes=None):  # noqa: B027
+        """Drop cached results that may have changed upstream.
+
+        Args:
+            envelopes: (min_lon, min_lat, max_lon, max_lat) envelopes of
+                the changed parcels, or None to drop every cached result.
+        """
+
     @abstractmethod
     def fetch_data(self, coordinate, radius: int):
         """Fetch data from the API."""
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        """Async variant of fetch_data.
+
+        Runs ``fetch_data`` in a worker thread by default; services with
+        an async HTTP client override this to avoid blocking a thread.
+        """
+        return await sync_to_async(self.fetch_data, thread_sensitive=False)(
+            coordinate, radius
+        )
+
+    def fetch_envelope(self, envelope):
+        """Fetch the dangerous places intersecting an envelope.
+
+        Args:
+            envelope: (min_lon, min_lat, max_lon, max_lat) in degrees.
+
+        Returns:
+            Features whose building stage is in DANGEROUS_STAGES, in the
+            shape returned by ``fetch_data``.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support envelope queries"
+        )
+
+    async def fetch_envelope_async(self, envelope):
+        """Async variant of fetch_envelope, see fetch_data_async."""
+        return await sync_to_async(
+            self.fetch_envelope, thread_sensitive=False
+        )(envelope)
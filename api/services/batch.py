@@ -0,0 +1,162 @@
+import asyncio
+import math
+from collections import defaultdict
+
+from api import app_state
+from api.services.base import DataRetrievalError
+from api.services.deadline import deadline
+from api.services.deadline import enforce as enforce_deadline
+from api.services.geocode_cache import normalize_address
+from api.services.services import (
+    _places_async,
+    _precomputed,
+    _validate_coordinate,
+    risk_assessment,
+)
+from api.services.spatial import (
+    distance_meters,
+    feature_rings,
+    filter_features_within,
+    grid_cell,
+    grid_cell_center,
+)
+
+
+def _error(e: DataRetrievalError) -> dict:
+    return {"error": f"Service error: {e.message}", "status": e.status_code}
+
+
+async def analyze_batch_async(
+    items, geocode_concurrency: int = 1, gisn_concurrency: int = 4,
+    cluster_size: float = 250, timeout: float | None = None,
+    item_timeout: float | None = None,
+):
+    """Analyze many addresses with shared geocodes and GISN queries.
+
+    Items found in the precomputed risk table are answered from it, as in
+    handle_address. Identical addresses (after normalization) among the
+    others are geocoded once, with at most ``geocode_concurrency``
+    geocodes in flight. Addresses are then grouped into grid cells of
+    ``cluster_size`` meters. Each group is answered by one GISN query
+    around the cell center, large enough to cover every member's radius,
+    and filtered locally per address. A group whose answer holds features
+    without geometry, which cannot be measured locally, is queried per
+    address instead, so that every item gets the same places as a single
+    analysis.
+
+    Args:
+        items: List of (street, house_number, radius) tuples.
+        geocode_concurrency: Maximum concurrent geocodes.
+        gisn_concurrency: Maximum concurrent GISN queries.
+        cluster_size: Grid cell size in meters used to group addresses.
+        timeout: Seconds the whole batch may take; items still waiting
+            on an upstream then fail with status 504. None for no
+            deadline.
+        item_timeout: Seconds each geocode and GISN query may take from
+            the moment it starts, so that items queued behind the
+            Nominatim rate limit do not share one analysis' budget.
+
+    Returns:
+        One dict per item, in input order: ``{"result": [...]}`` with the
+        dangerous places, or ``{"error": ..., "status": ...}``.
+    """
+    with deadline(timeout):
+        return await _analyze_batch(
+            items, geocode_concurrency, gisn_concurrency, cluster_size,
+            item_timeout,
+        )
+
+
+async def _analyze_batch(
+    items, geocode_concurrency, gisn_concurrency, cluster_size, item_timeout
+):
+    nominative_service = app_state.get_nominative_service()
+    gisn_service = app_state.get_gisn_service()
+
+    results = [None] * len(items)
+    pending = []
+    addresses = {}
+    for index, (street, house_number, radius) in enumerate(items):
+        precomputed = _precomputed(street, house_number, radius)
+        if precomputed is not None:
+            results[index] = {"result": risk_assessment(precomputed[1])}
+            continue
+        pending.append(index)
+        addresses.setdefault(
+            normalize_address(street, house_number), (street, house_number)
+        )
+
+    geocode_slots = asyncio.Semaphore(geocode_concurrency)
+
+    async def geocode(street, house_number):
+        async with geocode_slots:
+            try:
+                with deadline(item_timeout):
+                    async with enforce_deadline():
+                        coordinate = await nominative_service.fetch_data_async(
+                            street, house_number
+                        )
+                _validate_coordinate(coordinate)
+            except DataRetrievalError as e:
+                return e
+            return coordinate
+
+    keys = list(addresses)
+    coordinates = dict(zip(keys, await asyncio.gather(
+        *(geocode(*addresses[key]) for key in keys)
+    ), strict=True))
+
+    groups = defaultdict(list)
+    for index in pending:
+        street, house_number, radius = items[index]
+        coordinate = coordinates[normalize_address(street, house_number)]
+        if isinstance(coordinate, DataRetrievalError):
+            results[index] = _error(coordinate)
+        else:
+            groups[grid_cell(coordinate, cluster_size)].append(
+                (index, coordinate, radius)
+            )
+
+    gisn_slots = asyncio.Semaphore(gisn_concurrency)
+
+    async def query(members, center, radius):
+        """Query GISN, or record the error for ``members`` and return None."""
+        async with gisn_slots:
+            try:
+                with deadline(item_timeout):
+                    return await _places_async(gisn_service, center, radius)
+            except DataRetrievalError as e:
+                for index, _, _ in members:
+                    results[index] = _error(e)
+                return None
+
+    async def analyze_alone(member):
+        index, coordinate, radius = member
+        features = await query([member], coordinate, radius)
+        if features is not None:
+            results[index] = {"result": risk_assessment(features)}
+
+    async def analyze_group(cell, members):
+        if len(members) == 1:
+            # A lone address is queried exactly, without local filtering.
+            await analyze_alone(members[0])
+            return
+        center = grid_cell_center(cell, cluster_size)
+        query_radius = math.ceil(max(
+            distance_meters(center, coordinate) + radius
+            for _, coordinate, radius in members
+        ))
+        features = await query(members, center, query_radius)
+        if features is None:
+            return
+        if not all(feature_rings(feature) for feature in features):
+            await asyncio.gather(*(analyze_alone(m) for m in members))
+            return
+        for index, coordinate, radius in members:
+            places = filter_features_within(features, coordinate, radius)
+            results[index] = {"result": risk_assessment(places)}
+
+    await asyncio.gather(*(
+        analyze_group(cell, members) for cell, members in groups.items()
+    ))
+    return results
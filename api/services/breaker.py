@@ -0,0 +1,238 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from api.metrics import CIRCUIT_OPEN, CIRCUIT_REJECTED
+from api.services.base import (
+    BaseGISNQuery,
+    BaseNominativeQuery,
+    DataRetrievalError,
+    UpstreamError,
+)
+from api.services.deadline import DeadlineExceededError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(DataRetrievalError):
+    """Exception raised instead of calling an upstream that is failing."""
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Return True if ``error`` means the upstream itself is unhealthy.
+
+    Transport errors, timeouts, 5xx and 429 answers count; client errors
+    and results that merely hold no data do not.
+    """
+    if not isinstance(error, UpstreamError):
+        return False
+    status = error.status_code
+    return status is None or status >= 500 or status == 429
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures, per process.
+
+    Closed, calls go through and consecutive failures are counted. After
+    ``failure_threshold`` of them the circuit opens and calls fail at
+    once for ``reset_timeout`` seconds. It is then half-open: up to
+    ``half_open_max_calls`` trial calls go through, and the first result
+    closes the circuit again or reopens it.
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = 5,
+        reset_timeout: float = 30.0, half_open_max_calls: int = 1,
+    ):
+        """Initialize the breaker.
+
+        Args:
+            name: Upstream name, used in errors and metrics.
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout: Seconds the circuit stays open before trial
+                calls are let through.
+            half_open_max_calls: Concurrent trial calls while half-open.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if (
+            self._state == OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def before_call(self):
+        """Admit a call, or raise CircuitOpenError.
+
+        Every admitted call must be followed by ``record_success``,
+        ``record_failure`` or ``release``; ``call`` does this.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._trials < self.half_open_max_calls:
+                self._trials += 1
+                return
+            self.rejected += 1
+        CIRCUIT_REJECTED.inc(upstream=self.name)
+        raise CircuitOpenError(
+            f"{self.name} is unavailable, try again later",
+            status_code=503,
+        )
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                CIRCUIT_OPEN.dec(upstream=self.name)
+            self._state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED
+                and self.failures >= self.failure_threshold
+            ):
+                if self._state == CLOSED:
+                    CIRCUIT_OPEN.inc(upstream=self.name)
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def release(self):
+        """Give back the slot of an admitted call that did not complete."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    @contextmanager
+    def call(self):
+        """Admit the enclosed call and record its outcome.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        self.before_call()
+        try:
+            yield
+        except DeadlineExceededError:
+            # Out of our own time budget: says nothing about the upstream
+            self.release()
+            raise
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.record_failure()
+            elif isinstance(e, UpstreamError):
+                # The upstream answered, if only with a client error
+                self.record_success()
+            else:
+                # Failed on our side (a full rate limit queue, an address
+                # that cannot be located), so the upstream's health is
+                # unknown
+                self.release()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by a deadline
+            self.release()
+            raise
+        else:
+            self.record_success()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class CircuitBreakerNominativeQuery(BaseNominativeQuery):
+    """Fail fast while Nominatim is failing, see CircuitBreaker."""
+
+    def __init__(self, inner: BaseNominativeQuery, breaker: CircuitBreaker):
+        self.inner = inner
+        self.breaker = breaker
+
+    def fetch_data(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        with self.breaker.call():
+            return self.inner.fetch_data(street, house_number)
+
+    async def fetch_data_async(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        with self.breaker.call():
+            return await self.inner.fetch_data_async(
+                street, house_number
+            )
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.inner.stats(),
+            "nominatim_circuit": self.breaker.stats(),
+        }
+
+
+class CircuitBreakerGISNQuery(BaseGISNQuery):
+    """Fail fast while GISN is failing, see CircuitBreaker."""
+
+    def __init__(self, inner: BaseGISNQuery, breaker: CircuitBreaker):
+        self.inner = inner
+        self.breaker = breaker
+
+    def fetch_data(self, coordinate, radius: int):
+        with self.breaker.call():
+            return self.inner.fetch_data(coordinate, radius)
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        with self.breaker.call():
+            return await self.inner.fetch_data_async(coordinate, radius)
+
+    def fetch_envelope(self, envelope):
+        with self.breaker.call():
+            return self.inner.fetch_envelope(envelope)
+
+    async def fetch_envelope_async(self, envelope):
+        with self.breaker.call():
+            return await self.inner.fetch_envelope_async(envelope)
+
+    @property
+    def object_id_field(self) -> str:
+        return self.inner.object_id_field
+
+    def invalidate(self, envelopes=None):
+        self.inner.invalidate(envelopes)
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "gisn_circuit": self.breaker.stats()}
@@ -0,0 +1,115 @@
+"""Request deadlines shared by every upstream call of an analysis.
+
+A deadline is set once per request with ``deadline(seconds)`` and read
+from a context variable, so the service layers between the view and the
+HTTP clients need no extra arguments. Upstream calls take their timeouts
+from the remaining budget (``upstream_timeout``), and async code can be
+cancelled when the budget runs out (``enforce``).
+"""
+
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+
+from api.services.base import DataRetrievalError
+
+# Longest time to wait for a TCP/TLS connection, within the budget.
+CONNECT_TIMEOUT = 3.0
+
+_expires_at = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(DataRetrievalError):
+    """Exception raised when a request runs out of its time budget."""
+
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message, status_code=504)
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """Limit the enclosed block to ``seconds`` from now.
+
+    Nested deadlines can only shorten the budget. ``None`` keeps the
+    current one.
+    """
+    if seconds is None:
+        yield
+        return
+    expires_at = time.monotonic() + seconds
+    current = _expires_at.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _expires_at.set(expires_at)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+@contextmanager
+def without_deadline():
+    """Lift the deadline for the enclosed block, e.g. for work shared by
+    several requests that must not end with the first one's budget."""
+    token = _expires_at.set(None)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+def remaining() -> float | None:
+    """Return the seconds left before the deadline, None without one."""
+    expires_at = _expires_at.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+
+def expired() -> bool:
+    budget = remaining()
+    return budget is not None and budget <= 0
+
+
+def check():
+    """Raise DeadlineExceededError if the deadline has passed."""
+    if expired():
+        raise DeadlineExceededError()
+
+
+def upstream_timeout(default: float) -> httpx.Timeout:
+    """Return httpx timeouts for an upstream call within the budget.
+
+    Every phase (pool, connect, read, write) is limited to the remaining
+    budget or ``default``, whichever is shorter, and connecting to at
+    most ``CONNECT_TIMEOUT``.
+
+    Raises:
+        DeadlineExceededError: If no budget is left.
+    """
+    budget = remaining()
+    if budget is not None and budget <= 0:
+        raise DeadlineExceededError()
+    seconds = default if budget is None else min(default, budget)
+    return httpx.Timeout(seconds, connect=min(seconds, CONNECT_TIMEOUT))
+
+
+@asynccontextmanager
+async def enforce():
+    """Cancel the enclosed block when the deadline passes.
+
+    Raises:
+        DeadlineExceededError: If the block was cancelled for the deadline.
+    """
+    budget = remaining()
+    if budget is None:
+        yield
+        return
+    try:
+        async with asyncio.timeout(max(budget, 0)):
+            yield
+    except TimeoutError as e:
+        raise DeadlineExceededError() from e
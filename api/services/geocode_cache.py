@@ -0,0 +1,329 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+
+from api.metrics import STALE_RESPONSES
+from api.services.base import (
+    BaseNominativeQuery,
+    DataRetrievalError,
+    mark_stale,
+)
+
+logger = logging.getLogger(__name__)
+
+# Geresh/gershayim and ASCII quotes are dropped outright so that e.g.
+# "ז'בוטינסקי" and "זבוטינסקי" share a key; other punctuation (maqaf,
+# hyphens, dots, commas) separates words and becomes whitespace.
+_DROPPED_CHARS = re.compile("[׳״'\"`‘’“”]")
+_WORD_SEPARATORS = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_street(street: str) -> str:
+    """Normalize a street name for use in cache keys.
+
+    Strips niqqud and cantillation marks, bidi/format control characters
+    and punctuation, and collapses all whitespace variants to a single
+    space.
+
+    Args:
+        street: Street name as typed by the user.
+
+    Returns:
+        The normalized street name.
+    """
+    decomposed = unicodedata.normalize("NFKD", street)
+    stripped = "".join(
+        char for char in decomposed
+        if unicodedata.category(char) not in ("Mn", "Cf")
+    )
+    stripped = _DROPPED_CHARS.sub("", stripped)
+    stripped = _WORD_SEPARATORS.sub(" ", stripped).replace("_", " ")
+    return _WHITESPACE.sub(" ", stripped).strip().casefold()
+
+
+def normalize_address(street: str, house_number: int) -> str:
+    """Build the cache key for a street and house number."""
+    return f"{normalize_street(street)}|{int(house_number)}"
+
+
+class GeocodeCache:
+    """SQLite-backed geocode store shared by all worker processes.
+
+    Entries expire after ``ttl`` seconds, but are kept ``stale_ttl``
+    seconds longer as a fallback for when Nominatim fails (see
+    ``get_stale``). The least recently used entries are evicted once the
+    store holds more than ``max_entries``, checked every
+    ``EVICTION_CHECK_INTERVAL`` writes of a process since counting the
+    entries scans the table. Hit and miss counters are kept per process.
+    """
+
+    EVICTION_CHECK_INTERVAL = 100
+
+    _SCHEMA = (
+        (
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            " key TEXT PRIMARY KEY,"
+            " lon REAL NOT NULL,"
+            " lat REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        ),
+        (
+            "CREATE INDEX IF NOT EXISTS geocode_accessed_at "
+            "ON geocode (accessed_at)"
+        ),
+    )
+
+    def __init__(
+        self, path: str | Path, ttl: int = 30 * 24 * 3600,
+        max_entries: int = 50000, stale_ttl: int = 0,
+    ):
+        """Initialize the cache.
+
+        Args:
+            path: Location of the SQLite database file.
+            ttl: Seconds an entry stays valid after it was stored.
+            max_entries: Maximum number of entries kept in the store.
+            stale_ttl: Seconds an expired entry is kept for ``get_stale``.
+                0 drops entries as soon as they expire.
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            for statement in self._SCHEMA:
+                connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> tuple[float, float] | None:
+        """Return the cached (longitude, latitude) for ``key``, if fresh."""
+        now = time.time()
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT lon, lat, created_at FROM geocode WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                if row is not None and now - row[2] > self.ttl + self.stale_ttl:
+                    connection.execute(
+                        "DELETE FROM geocode WHERE key = ?", (key,)
+                    )
+                self._count(hit=False)
+                return None
+            connection.execute(
+                "UPDATE geocode SET accessed_at = ?, hits = hits + 1 "
+                "WHERE key = ?",
+                (now, key),
+            )
+        self._count(hit=True)
+        return (row[0], row[1])
+
+    def get_stale(self, key: str) -> tuple[float, float] | None:
+        """Return the coordinate of ``key`` even if it expired.
+
+        Entries past their stale period are not returned. Counted as a
+        stale hit; misses are not counted, ``get`` already did.
+        """
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT lon, lat FROM geocode WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl - self.stale_ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self.stale_hits += 1
+        return (row[0], row[1])
+
+    def set(self, key: str, coordinate: tuple[float, float]):
+        """Store a (longitude, latitude) pair and evict old entries.
+
+        A refreshed entry keeps its hit count, which ranks ``popular``.
+        """
+        now = time.time()
+        lon, lat = coordinate
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.EVICTION_CHECK_INTERVAL == 0
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO geocode (key, lon, lat, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET lon = excluded.lon,"
+                " lat = excluded.lat, created_at = excluded.created_at,"
+                " accessed_at = excluded.accessed_at",
+                (key, float(lon), float(lat), now, now),
+            )
+            if not evict:
+                return
+            connection.execute(
+                "DELETE FROM geocode WHERE created_at < ?",
+                (now - self.ttl - self.stale_ttl,),
+            )
+            (size,) = connection.execute(
+                "SELECT COUNT(*) FROM geocode"
+            ).fetchone()
+            if size > self.max_entries:
+                connection.execute(
+                    "DELETE FROM geocode WHERE key IN ("
+                    " SELECT key FROM geocode"
+                    " ORDER BY accessed_at ASC LIMIT ?)",
+                    (size - self.max_entries,),
+                )
+
+    def popular(self, limit: int) -> list[tuple[str, tuple[float, float]]]:
+        """Return the ``limit`` most requested fresh entries.
+
+        Entries are ranked by hits, then by last access, and returned as
+        (key, (longitude, latitude)) pairs. Counters are not touched.
+        """
+        with self._connection() as connection:
+            rows = connection.execute(
+                "SELECT key, lon, lat FROM geocode WHERE created_at >= ?"
+                " ORDER BY hits DESC, accessed_at DESC LIMIT ?",
+                (time.time() - self.ttl, limit),
+            ).fetchall()
+        return [(key, (lon, lat)) for key, lon, lat in rows]
+
+    def clear(self):
+        """Remove every entry from the store."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM geocode")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current store size."""
+        with self._connection() as connection:
+            (size,) = connection.execute(
+                "SELECT COUNT(*) FROM geocode"
+            ).fetchone()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            stale_hits = self.stale_hits
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "stale_hits": stale_hits,
+            "hit_ratio": hits / total if total else 0.0,
+            "size": size,
+            "max_entries": self.max_entries,
+        }
+
+
+class CachedNominativeQuery(BaseNominativeQuery):
+    """Serve geocodes from a GeocodeCache before asking another service.
+
+    Cache failures are logged and never fail the request; the wrapped
+    service is used instead. If the wrapped service fails, an expired
+    entry still in its stale period is served instead, marked stale (see
+    ``mark_stale``).
+    """
+
+    def __init__(self, inner: BaseNominativeQuery, cache: GeocodeCache):
+        self.inner = inner
+        self.cache = cache
+
+    def _lookup(self, key: str) -> tuple[float, float] | None:
+        try:
+            return self.cache.get(key)
+        except sqlite3.Error:
+            logger.exception("Geocode cache lookup failed")
+            return None
+
+    def _lookup_stale(self, key: str) -> tuple[float, float] | None:
+        try:
+            coordinate = self.cache.get_stale(key)
+        except sqlite3.Error:
+            logger.exception("Geocode cache lookup failed")
+            return None
+        if coordinate is not None:
+            mark_stale()
+            STALE_RESPONSES.inc(upstream="nominatim")
+        return coordinate
+
+    def _store(self, key: str, coordinate: tuple[float, float]):
+        try:
+            self.cache.set(key, coordinate)
+        except sqlite3.Error:
+            logger.exception("Geocode cache store failed")
+
+    def fetch_data(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        key = normalize_address(street, house_number)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        try:
+            coordinate = self.inner.fetch_data(street, house_number)
+        except DataRetrievalError:
+            stale = self._lookup_stale(key)
+            if stale is None:
+                raise
+            return stale
+        self._store(key, coordinate)
+        return coordinate
+
+    async def fetch_data_async(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        # SQLite calls may wait on another worker's write lock, so keep
+        # them off the event loop.
+        key = normalize_address(street, house_number)
+        cached = await sync_to_async(self._lookup, thread_sensitive=False)(key)
+        if cached is not None:
+            return cached
+
+        try:
+            coordinate = await self.inner.fetch_data_async(
+                street, house_number
+            )
+        except DataRetrievalError:
+            stale = await sync_to_async(
+                self._lookup_stale, thread_sensitive=False
+            )(key)
+            if stale is None:
+                raise
+            return stale
+        await sync_to_async(self._store, thread_sensitive=False)(
+            key, coordinate
+        )
+        return coordinate
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "geocode_cache": self.cache.stats()}
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from api.metrics import STALE_RESPONSES
+from api.services.base import (
+    BaseGISNQuery,
+    DataRetrievalError,
+    mark_stale,
+    track_staleness,
+)
+from api.services.deadline import without_deadline
+from api.services.spatial import (
+    circle_envelope,
+    distance_meters,
+    envelopes_intersect,
+    filter_features_within,
+    grid_cell,
+    grid_cell_center,
+)
+
+# The point's own cell first, then the eight cells around it.
+_NEIGHBOURHOOD = [(0, 0)] + [
+    (dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)
+]
+
+logger = logging.getLogger(__name__)
+
+
+class GISNResultCache:
+    """Bounded in-memory cache of GISN radius queries per grid cell.
+
+    Each cache entry holds the features around the center of one grid cell
+    for a canonical radius. That radius is the smallest configured bucket
+    that fits the request, plus the cell's half diagonal. Any request from
+    a point inside the cell with a radius up to the bucket can be answered
+    by filtering the entry locally, so neighbours and repeat visitors share
+    one upstream query. Points near a cell border are also served from a
+    neighbouring cell's entry when it still covers the requested circle.
+
+    Entries expire after ``ttl`` seconds but may still be served, as
+    stale, for another ``stale_ttl`` seconds while they are refreshed. The
+    least recently used entries are evicted when the entry count or the
+    approximate payload size exceeds its bound.
+    """
+
+    def __init__(
+        self, cell_size: float = 100, radius_buckets=(100, 250, 500, 1000),
+        ttl: float = 600, max_entries: int = 2000,
+        max_bytes: int = 64 * 1024 * 1024, stale_ttl: float = 0,
+    ):
+        """Initialize the cache.
+
+        Args:
+            cell_size: Grid cell size in meters.
+            radius_buckets: Canonical radii in meters. Requests above the
+                largest bucket bypass the cache.
+            ttl: Seconds an entry stays valid.
+            max_entries: Maximum number of cached cells.
+            max_bytes: Maximum approximate size of all cached payloads.
+            stale_ttl: Seconds an expired entry may still be served while
+                it is refreshed. 0 disables stale entries.
+        """
+        self.cell_size = cell_size
+        self.radius_buckets = sorted(radius_buckets)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cell(self, coordinate) -> tuple[int, int]:
+        """Return the grid cell containing a (longitude, latitude) point."""
+        return grid_cell(coordinate, self.cell_size)
+
+    def canonical_query(self, coordinate, radius: float):
+        """Return the (center, radius) to fetch for a cacheable request.
+
+        Returns None when the radius exceeds the largest bucket.
+        """
+        bucket = next((b for b in self.radius_buckets if b >= radius), None)
+        if bucket is None:
+            return None
+        half_diagonal = self.cell_size * math.sqrt(2) / 2
+        return (
+            grid_cell_center(self.cell(coordinate), self.cell_size),
+            math.ceil(bucket + half_diagonal),
+        )
+
+    def get(self, coordinate, radius: float) -> list | None:
+        """Return cached features within ``radius`` of ``coordinate``.
+
+        Stale entries count; use ``lookup`` to tell them apart.
+        """
+        found = self.lookup(coordinate, radius)
+        return None if found is None else found[0]
+
+    def lookup(self, coordinate, radius: float):
+        """Find cached features within ``radius`` of ``coordinate``.
+
+        The point's own cell is tried first, then its neighbours, since a
+        neighbouring superset often still covers a point near the border.
+        Fresh entries are preferred over stale ones.
+
+        Returns:
+            None on a miss, else a (features, refresh) tuple where
+            ``refresh`` is None for a fresh entry and the (center, radius)
+            query to refresh a stale one with.
+        """
+        column, row = self.cell(coordinate)
+        now = time.monotonic()
+        stale = None
+        with self._lock:
+            for dx, dy in _NEIGHBOURHOOD:
+                key = (column + dx, row + dy)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry["expires_at"] + self.stale_ttl <= now:
+                    self._remove(key)
+                    continue
+                if (
+                    distance_meters(coordinate, entry["center"]) + radius
+                    > entry["radius"]
+                ):
+                    continue
+                if entry["expires_at"] <= now:
+                    stale = stale or (key, entry)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                features, refresh = entry["features"], None
+                break
+            else:
+                if stale is None:
+                    self.misses += 1
+                    return None
+                key, entry = stale
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                features = entry["features"]
+                refresh = (entry["center"], entry["radius"])
+        return filter_features_within(features, coordinate, radius), refresh
+
+    def set(self, center, radius: float, features: list):
+        """Store the features fetched around a cell center."""
+        size = len(json.dumps(features, ensure_ascii=False).encode())
+        if size > self.max_bytes:
+            return
+        key = self.cell(center)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "center": center,
+                "radius": radius,
+                "features": features,
+                "size": size,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self.bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self.bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry["size"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def invalidate(self, envelopes=None) -> int:
+        """Drop the entries whose circle meets any of ``envelopes``.
+
+        None drops every entry. Returns the number of entries dropped.
+        """
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if envelopes is None or any(
+                    envelopes_intersect(
+                        circle_envelope(entry["center"], entry["radius"]),
+                        envelope,
+                    )
+                    for envelope in envelopes
+                )
+            ]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class CachedGISNQuery(BaseGISNQuery):
+    """Serve GISN radius queries from a GISNResultCache when possible.
+
+    On a miss the wrapped service is asked for the canonical superset
+    around the cell center, which is cached and filtered down to the
+    requested radius. A stale entry is served at once, marked stale (see
+    ``mark_stale``), and refreshed in the background; if the refresh
+    fails, the entry keeps being served until its stale period ends.
+    """
+
+    def __init__(self, inner: BaseGISNQuery, cache: GISNResultCache):
+        self.inner = inner
+        self.cache = cache
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def _serve(self, found):
+        """Return the features of a cache lookup, marking stale ones.
+
+        Returns the refresh query if a refresh should be started.
+        """
+        features, refresh = found
+        if refresh is None:
+            return features, None
+        mark_stale()
+        STALE_RESPONSES.inc(upstream="gisn")
+        key = self.cache.cell(refresh[0])
+        with self._lock:
+            if key in self._refreshing:
+                return features, None
+            self._refreshing.add(key)
+        return features, refresh
+
+    def _refresh(self, center, radius: float):
+        try:
+            features = self.inner.fetch_data(center, radius)
+        except DataRetrievalError as e:
+            self._finish_refresh(center, error=e)
+        except BaseException as e:
+            # A bug, or the refresh was cancelled: free the cell for later
+            # refreshes and let it surface
+            self._finish_refresh(center, error=e)
+            raise
+        else:
+            self._finish_refresh(center, radius, features)
+
+    async def _refresh_async(self, center, radius: float):
+        try:
+            # The task copied the context of the request that found the
+            # stale entry, whose deadline must not cut the refresh short
+            with without_deadline(), track_staleness():
+                features = await self.inner.fetch_data_async(center, radius)
+        except DataRetrievalError as e:
+            self._finish_refresh(center, error=e)
+        except BaseException as e:
+            self._finish_refresh(center, error=e)
+            raise
+        else:
+            self._finish_refresh(center, radius, features)
+
+    def _finish_refresh(self, center, radius=None, features=None, error=None):
+        with self._lock:
+            self._refreshing.discard(self.cache.cell(center))
+            if error is None:
+                self.refreshes += 1
+            else:
+                self.refresh_failures += 1
+        if error is None:
+            self.cache.set(center, radius, features)
+        else:
+            logger.warning("GISN cache refresh failed: %s", error)
+
+    def fetch_data(self, coordinate, radius: int):
+        found = self.cache.lookup(coordinate, radius)
+        if found is not None:
+            features, refresh = self._serve(found)
+            if refresh is not None:
+                threading.Thread(
+                    target=self._refresh, args=refresh, daemon=True
+                ).start()
+            return features
+        query = self.cache.canonical_query(coordinate, radius)
+        if query is None:
+            return self.inner.fetch_data(coordinate, radius)
+        center, fetch_radius = query
+        features = self.inner.fetch_data(center, fetch_radius)
+        self.cache.set(center, fetch_radius, features)
+        return filter_features_within(features, coordinate, radius)
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        found = self.cache.lookup(coordinate, radius)
+        if found is not None:
+            features, refresh = self._serve(found)
+            if refresh is not None:
+                task = asyncio.create_task(self._refresh_async(*refresh))
+                # Keep a reference until the task is done
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return features
+        query = self.cache.canonical_query(coordinate, radius)
+        if query is None:
+            return await self.inner.fetch_data_async(coordinate, radius)
+        center, fetch_radius = query
+        features = await self.inner.fetch_data_async(center, fetch_radius)
+        self.cache.set(center, fetch_radius, features)
+        return filter_features_within(features, coordinate, radius)
+
+    def fetch_envelope(self, envelope):
+        # Envelopes are cached per tile, see CachedTileGISNQuery
+        return self.inner.fetch_envelope(envelope)
+
+    async def fetch_envelope_async(self, envelope):
+        return await self.inner.fetch_envelope_async(envelope)
+
+    @property
+    def object_id_field(self) -> str:
+        return self.inner.object_id_field
+
+    def invalidate(self, envelopes=None):
+        self.cache.invalidate(envelopes)
+        self.inner.invalidate(envelopes)
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            refresh_stats = {
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "refreshing": len(self._refreshing),
+            }
+        return {
+            **self.inner.stats(),
+            "gisn_cache": {**self.cache.stats(), **refresh_stats},
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def http2_available() -> bool:
+    """Return True if the optional ``h2`` package is installed."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def upstream_client_options(upstream: str) -> dict:
+    """Build httpx client keyword arguments for an upstream from settings.
+
+    Each upstream service owns its own client, so the per-client
+    ``<UPSTREAM>_MAX_CONNECTIONS`` setting is effectively a per-host cap.
+
+    Args:
+        upstream: Upstream name used as the settings prefix, e.g.
+            ``"nominatim"`` reads ``NOMINATIM_MAX_CONNECTIONS`` and
+            ``NOMINATIM_HTTP2``.
+
+    Returns:
+        Keyword arguments for ``httpx.Client``/``httpx.AsyncClient``.
+    """
+    prefix = upstream.upper()
+    max_connections = getattr(settings, f"{prefix}_MAX_CONNECTIONS", 10)
+    max_keepalive = min(
+        getattr(settings, "HTTP_MAX_KEEPALIVE_CONNECTIONS", 10),
+        max_connections,
+    )
+    http2 = getattr(settings, f"{prefix}_HTTP2", False)
+    if http2 and not http2_available():
+        logger.warning(
+            "%s_HTTP2 is enabled but the 'h2' package is not installed; "
+            "falling back to HTTP/1.1",
+            prefix,
+        )
+        http2 = False
+    return {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=getattr(settings, "HTTP_KEEPALIVE_EXPIRY", 30.0),
+        ),
+        "http2": http2,
+    }
+
+
+def pool_stats(client: httpx.Client | httpx.AsyncClient) -> dict:
+    """Return connection pool statistics for an httpx client.
+
+    httpx has no public pool API, so the transport's httpcore pool is
+    looked up defensively: the counts stay 0 when there is none (e.g. a
+    mock transport) or its layout changed. HTTP/2 connections are told
+    apart by the connection's public ``info()``.
+    """
+    stats = {"connections": 0, "active": 0, "idle": 0, "http2": 0}
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return stats
+    try:
+        connections = list(pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        http2 = sum(
+            1 for connection in connections
+            if ", HTTP/2, " in connection.info()
+        )
+    except (AttributeError, TypeError):
+        logger.debug("Cannot read the connection pool of %r", client)
+        return stats
+    stats.update(
+        connections=len(connections), active=len(connections) - idle,
+        idle=idle, http2=http2,
+    )
+    for name in ("max_connections", "max_keepalive_connections"):
+        value = getattr(pool, f"_{name}", None)
+        if isinstance(value, int):
+            stats[name] = value
+    return stats
+
+
+class LoopLocalAsyncClient:
+    """Hand out one pooled ``httpx.AsyncClient`` per running event loop.
+
+    Async clients are bound to the event loop they were first used on.
+    Under ASGI there is a single long-lived loop per worker, so this is a
+    single shared client; when async code is driven from a sync context
+    (e.g. ``async_to_sync`` under WSGI) each loop gets its own client.
+
+    Each client is closed on its own loop: by ``aclose``, by ``close``, or
+    when the loop ends, since ``asyncio.run`` (used by uvicorn and
+    asgiref) cancels the task that holds it.
+    """
+
+    def __init__(
+        self, upstream: str, client: httpx.AsyncClient | None = None
+    ):
+        """Initialize the holder.
+
+        Args:
+            upstream: Upstream name used to read the pool settings.
+            client: Optional client to hand out on every loop instead of
+                creating pooled clients, mainly for tests.
+        """
+        self.upstream = upstream
+        self._client = client
+        # Event loop -> (client, task closing it once cancelled)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> httpx.AsyncClient:
+        """Return the client for the currently running event loop."""
+        if self._client is not None:
+            return self._client
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                self._forget_closed_loops()
+                client = httpx.AsyncClient(
+                    **upstream_client_options(self.upstream)
+                )
+                entry = self._clients[loop] = (
+                    client, loop.create_task(self._hold(loop, client)),
+                )
+        return entry[0]
+
+    def _forget_closed_loops(self):
+        # Loops closed without cancelling their tasks: nothing left to close on
+        for loop in [loop for loop in self._clients if loop.is_closed()]:
+            del self._clients[loop]
+
+    async def _hold(self, loop, client: httpx.AsyncClient):
+        """Wait until cancelled, then close ``client``."""
+        try:
+            await loop.create_future()
+        finally:
+            with self._lock:
+                if self._clients.get(loop, (None,))[0] is client:
+                    del self._clients[loop]
+            await client.aclose()
+
+    async def aclose(self):
+        """Close the client of the running event loop."""
+        with self._lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            client, holder = entry
+            holder.cancel()
+            await client.aclose()
+
+    def close(self):
+        """Close the clients of all event loops, each on its own loop.
+
+        Clients of loops that are not running are closed when the loop
+        runs again or ends.
+        """
+        with self._lock:
+            self._forget_closed_loops()
+            entries = list(self._clients.items())
+        for loop, (_, holder) in entries:
+            loop.call_soon_threadsafe(holder.cancel)
+
+    def stats(self) -> dict:
+        """Return pool statistics summed over all live clients."""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+        if self._client is not None:
+            clients.append(self._client)
+        totals = {"clients": len(clients)}
+        for client in clients:
+            for key, value in pool_stats(client).items():
+                if key.startswith("max_"):
+                    totals[key] = value
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
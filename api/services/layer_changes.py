@@ -0,0 +1,228 @@
+import datetime
+import logging
+import threading
+import time
+
+from api.services.base import DEFAULT_OBJECT_ID_FIELD, DataRetrievalError
+from api.services.spatial import feature_rings, rings_envelope
+
+logger = logging.getLogger(__name__)
+
+
+def object_id_field(metadata: dict) -> str:
+    """Return the object id field name from a GISN layer description."""
+    for field in metadata.get("fields") or []:
+        if field.get("type") == "esriFieldTypeOID":
+            return field["name"]
+    return metadata.get("objectIdField") or DEFAULT_OBJECT_ID_FIELD
+
+
+def last_edit_date(metadata: dict) -> int | None:
+    """Return the layer's last edit time in epoch milliseconds, if known.
+
+    ``dataLastEditDate`` only moves with data edits, so it is preferred
+    over ``lastEditDate``, which schema changes move too.
+    """
+    info = metadata.get("editingInfo") or {}
+    return info.get("dataLastEditDate") or info.get("lastEditDate")
+
+
+def edit_date_field(metadata: dict) -> str | None:
+    """Return the attribute holding each feature's last edit time."""
+    return (metadata.get("editFieldsInfo") or {}).get("editDateField")
+
+
+def edited_since(field: str, edited_at: int) -> str:
+    """Build a where clause for the features edited at or after a time.
+
+    Args:
+        field: The layer's edit date field.
+        edited_at: Epoch milliseconds, as in ``editingInfo``.
+    """
+    moment = datetime.datetime.fromtimestamp(edited_at / 1000, tz=datetime.UTC)
+    return f"{field} >= timestamp '{moment:%Y-%m-%d %H:%M:%S}'"
+
+
+def fetch_changes(
+    service, metadata: dict, since: int, known_ids: set,
+    oid_field: str = DEFAULT_OBJECT_ID_FIELD,
+):
+    """List the edits of the layer since a point in time.
+
+    Args:
+        service: RealGISNQuery to ask.
+        metadata: Current layer description.
+        since: Epoch milliseconds of the last known edit.
+        known_ids: Object ids of the features known at ``since``.
+        oid_field: Name of the layer's object id field.
+
+    Returns:
+        None if the layer does not record per-feature edit times, else an
+        (object ids, deleted ids, features) tuple with the layer's current
+        object ids, the known ids no longer in the layer, and the features
+        edited or added since ``since``.
+    """
+    field = edit_date_field(metadata)
+    if field is None:
+        return None
+    object_ids = set(service.fetch_object_ids(oid_field))
+    edited = set(service.fetch_object_ids(oid_field, edited_since(field, since)))
+    features = service.fetch_features(
+        oid_field, sorted(edited | (object_ids - known_ids))
+    )
+    return object_ids, known_ids - object_ids, features
+
+
+class LayerChangeDetector:
+    """Detect edits of the GISN layer from its metadata.
+
+    Each poll reads the small layer description. Only when its last edit
+    date moves are the changed features listed, so that cached results
+    can be invalidated where the layer changed instead of on a timer.
+    """
+
+    def __init__(self, service):
+        """Initialize the detector.
+
+        Args:
+            service: RealGISNQuery used for metadata and change queries.
+        """
+        self.service = service
+        self.edited_at = None
+        self.object_ids = None
+        self.oid_field = None
+        self.supported = None
+
+    def poll(self):
+        """Return where the layer changed since the previous poll.
+
+        The first poll records the current state and reports no changes.
+
+        Returns:
+            A list of (xmin, ymin, xmax, ymax) envelopes of the edited and
+            added parcels, empty when nothing changed, or None when the
+            changes cannot be located (deleted parcels, or no per-feature
+            edit times) and every cached result is suspect.
+        """
+        metadata = self.service.fetch_layer_metadata()
+        edited_at = last_edit_date(metadata)
+        self.supported = edited_at is not None
+        if edited_at is None or edited_at == self.edited_at:
+            return []
+        if self.edited_at is None:
+            self.oid_field = object_id_field(metadata)
+            self.object_ids = set(self.service.fetch_object_ids(self.oid_field))
+            self.edited_at = edited_at
+            return []
+
+        changes = fetch_changes(
+            self.service, metadata, self.edited_at, self.object_ids,
+            self.oid_field,
+        )
+        self.edited_at = edited_at
+        if changes is None:
+            return None
+        self.object_ids, deleted, features = changes
+        if deleted:
+            return None
+        return [
+            rings_envelope(rings) for feature in features
+            if (rings := feature_rings(feature))
+        ]
+
+
+class LayerChangePoller:
+    """Invalidate a GISN service's caches as the layer changes.
+
+    Polls a LayerChangeDetector every ``interval`` seconds in a daemon
+    thread and passes what changed to the ``invalidate`` of the service
+    and, if given, of the RiskTable. A given ReplicaGISNQuery is brought
+    up to the layer's last edit first.
+    """
+
+    def __init__(
+        self, detector: LayerChangeDetector, service, interval,
+        risk_table=None, replica=None,
+    ):
+        self.detector = detector
+        self.service = service
+        self.interval = interval
+        self.risk_table = risk_table
+        self.replica = replica
+        self.polls = 0
+        self.failures = 0
+        self.invalidations = 0
+        self.full_invalidations = 0
+        self.replica_updates = 0
+        self._unlisted_at = None
+        self._thread = None
+
+    def poll_once(self):
+        try:
+            envelopes = self.detector.poll()
+        except Exception:
+            self.failures += 1
+            logger.exception("GISN layer change poll failed")
+            return
+        self.polls += 1
+        if self.replica is not None and self.detector.supported:
+            self._refresh_replica()
+        if envelopes is None:
+            self.full_invalidations += 1
+            logger.info("GISN layer changed, invalidating all cached results")
+            self._invalidate(None)
+        elif envelopes:
+            self.invalidations += 1
+            logger.info("GISN layer changed in %d places", len(envelopes))
+            self._invalidate(envelopes)
+
+    def _refresh_replica(self):
+        try:
+            changed = self.replica.refresh(
+                self.detector.service, edited_at=self.detector.edited_at
+            )
+        except DataRetrievalError:
+            self.failures += 1
+            logger.exception("GISN replica refresh failed")
+            return
+        if changed is None and self.replica.replica is not None:
+            # Warn once per layer edit, not on every poll
+            if self._unlisted_at != self.detector.edited_at:
+                self._unlisted_at = self.detector.edited_at
+                logger.warning(
+                    "GISN replica edits cannot be listed, run sync_gisn_layer"
+                )
+        elif changed:
+            self.replica_updates += 1
+            logger.info("Applied %d GISN layer edits to the replica", changed)
+
+    def _invalidate(self, envelopes):
+        self.service.invalidate(envelopes)
+        if self.risk_table is not None:
+            self.risk_table.invalidate(envelopes)
+
+    def _run(self):
+        while True:
+            self.poll_once()
+            time.sleep(self.interval)
+
+    def start(self):
+        """Poll in the background, the first poll recording the layer's
+        current state.
+
+        Returns at once, so that a slow or failing GISN does not delay
+        the worker's boot.
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stats(self) -> dict:
+        return {
+            "supported": self.detector.supported,
+            "edited_at": self.detector.edited_at,
+            "polls": self.polls,
+            "failures": self.failures,
+            "invalidations": self.invalidations,
+            "full_invalidations": self.full_invalidations,
+            "replica_updates": self.replica_updates,
+        }
@@ -1,5 +1,9 @@
 import json
-from api.services.base import BaseNominativeQuery, BaseGISNQuery
+from api.services.base import (
+    DANGEROUS_STAGES,
+    BaseGISNQuery,
+    BaseNominativeQuery,
+)
 
 
 class MockNominativeQuery(BaseNominativeQuery):
@@ -74,3 +78,10 @@ class MockGISNQuery(BaseGISNQuery):
             '"building_stage": "בתהליך היתר", "sw_tama_38": "לא"}}]'
         )
         return json.loads(places_in_radius)
+
+    def fetch_envelope(self, envelope):
+        center = ((envelope[0] + envelope[2]) / 2, (envelope[1] + envelope[3]) / 2)
+        return [
+            place for place in self.fetch_data(center, 0)
+            if place["attributes"]["building_stage"] in DANGEROUS_STAGES
+        ]
@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+
+from api.metrics import NOMINATIM_QUEUE, NOMINATIM_QUEUE_WAIT
+from api.services.base import BaseNominativeQuery, DataRetrievalError
+from api.services.deadline import DeadlineExceededError, remaining
+
+logger = logging.getLogger(__name__)
+
+# Pause after a 429 without a usable Retry-After header, in seconds.
+DEFAULT_BACKOFF = 10.0
+
+
+class IntervalRateLimiter:
+    """Space calls at least ``interval`` seconds apart within a process.
+
+    Each caller reserves the next free slot and sleeps until it, so
+    callers are served in arrival order and bursts queue up instead of
+    reaching the upstream together.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.acquired = 0
+        self.total_wait = 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Reserve the next slot and return the seconds to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            self.acquired += 1
+            self.total_wait += slot - now
+            return slot - now
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+    def backoff(self, seconds: float):
+        """Hand out no slot for the next ``seconds`` seconds."""
+        with self._lock:
+            self._next_slot = max(
+                self._next_slot, time.monotonic() + seconds
+            )
+
+    async def backoff_async(self, seconds: float):
+        self.backoff(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = max(0.0, self._next_slot - time.monotonic())
+            return {
+                "acquired": self.acquired,
+                "queue_depth": math.ceil(pending / self.interval)
+                if self.interval else 0,
+                "average_wait": self.total_wait / self.acquired
+                if self.acquired else 0.0,
+            }
+
+
+class SharedTokenBucket:
+    """Token bucket shared by all worker processes on the host.
+
+    The bucket state is a single "theoretical arrival time" row in a
+    SQLite file (the generic cell rate algorithm): each caller reserves
+    the next slot under a write lock and sleeps until it, so callers of
+    every worker are served in arrival order at ``rate`` per second, with
+    bursts of up to ``burst`` calls after idle periods.
+
+    A caller whose slot is more than ``max_wait`` seconds away fails
+    with a 503 instead of queueing, and one whose slot is beyond its
+    request deadline fails with a 504. Wait statistics are kept per
+    process.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS bucket ("
+        " name TEXT PRIMARY KEY,"
+        " tat REAL NOT NULL)"
+    )
+
+    def __init__(
+        self, path: str | Path, rate: float, burst: int = 1,
+        max_wait: float = 10.0, name: str = "nominatim",
+    ):
+        """Initialize the bucket.
+
+        Args:
+            path: Location of the SQLite database file.
+            rate: Calls per second.
+            burst: Calls allowed back to back after an idle period.
+            max_wait: Longest queueing time in seconds before failing.
+            name: Bucket name, so that one file can hold several buckets.
+        """
+        self.path = Path(path)
+        self.interval = 1 / rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.name = name
+        self.acquired = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.longest_wait = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(self._SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _update(self, fn):
+        """Apply ``fn(tat, now)`` to the bucket under a write lock.
+
+        ``fn`` returns the new arrival time (None to keep it) and a
+        result, which is returned.
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = connection.execute(
+                "SELECT tat FROM bucket WHERE name = ?", (self.name,)
+            ).fetchone()
+            tat, result = fn(max(row[0], now) if row else now, now)
+            if tat is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO bucket (name, tat) VALUES (?, ?)",
+                    (self.name, tat),
+                )
+        return result
+
+    def reserve(self) -> float:
+        """Reserve the next slot and return the seconds to wait for it.
+
+        Raises:
+            DataRetrievalError: If the slot is more than ``max_wait``
+                seconds away.
+            DeadlineExceededError: If the slot is beyond the request deadline.
+        """
+        budget = remaining()
+        max_wait = self.max_wait if budget is None else min(
+            self.max_wait, budget
+        )
+
+        def take(tat, now):
+            wait = max(0.0, tat - (self.burst - 1) * self.interval - now)
+            if wait > max_wait:
+                return None, None
+            return tat + self.interval, wait
+
+        wait = self._update(take)
+        with self._lock:
+            if wait is None:
+                self.rejected += 1
+            else:
+                self.acquired += 1
+                self.total_wait += wait
+                self.longest_wait = max(self.longest_wait, wait)
+        if wait is None and max_wait < self.max_wait:
+            raise DeadlineExceededError(
+                "No Nominatim rate limit slot within the request deadline"
+            )
+        if wait is None:
+            raise DataRetrievalError(
+                "Nominatim request queue is full, try again later",
+                status_code=503,
+            )
+        return wait
+
+    def _sleep(self, wait: float):
+        with self._lock:
+            self.waiting += 1
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def acquire(self):
+        self._sleep(self.reserve())
+
+    async def acquire_async(self):
+        # The reservation may wait on another worker's write lock, so
+        # keep it off the event loop.
+        wait = await sync_to_async(self.reserve, thread_sensitive=False)()
+        with self._lock:
+            self.waiting += 1
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def backoff(self, seconds: float):
+        """Hand out no slot, in any worker, for the next ``seconds``."""
+        self._update(
+            lambda tat, now: (max(tat, now + seconds), None)
+        )
+
+    async def backoff_async(self, seconds: float):
+        await sync_to_async(self.backoff, thread_sensitive=False)(seconds)
+
+    def stats(self) -> dict:
+        """Return wait statistics and the host-wide queue depth."""
+        try:
+            row = self._connection().execute(
+                "SELECT tat FROM bucket WHERE name = ?", (self.name,)
+            ).fetchone()
+        except sqlite3.Error:
+            logger.exception("Failed to read the rate limit bucket")
+            row = None
+        pending = max(0.0, row[0] - time.time()) if row else 0.0
+        with self._lock:
+            return {
+                "rate": 1 / self.interval,
+                "burst": self.burst,
+                "acquired": self.acquired,
+                "rejected": self.rejected,
+                "waiting": self.waiting,
+                "queue_depth": max(
+                    0, math.ceil(pending / self.interval) - self.burst
+                ),
+                "average_wait": self.total_wait / self.acquired
+                if self.acquired else 0.0,
+                "longest_wait": self.longest_wait,
+            }
+
+
+def _retry_after(error: DataRetrievalError) -> float:
+    """Return the Retry-After delay of a 429 response, in seconds."""
+    response = getattr(error.__cause__, "response", None)
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, ValueError):
+        return DEFAULT_BACKOFF
+
+
+class RateLimitedNominativeQuery(BaseNominativeQuery):
+    """Throttle upstream geocodes to Nominatim's usage policy.
+
+    Placed directly above the real service, so cache hits and coalesced
+    requests never consume a slot. A 429 answer pauses the limiter for
+    the Retry-After delay.
+    """
+
+    def __init__(self, inner: BaseNominativeQuery, limiter):
+        self.inner = inner
+        self.limiter = limiter
+
+    def fetch_data(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        with NOMINATIM_QUEUE.track_inprogress(), NOMINATIM_QUEUE_WAIT.time():
+            self.limiter.acquire()
+        try:
+            return self.inner.fetch_data(street, house_number)
+        except DataRetrievalError as e:
+            if e.status_code == 429:
+                self.limiter.backoff(_retry_after(e))
+            raise
+
+    async def fetch_data_async(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        with NOMINATIM_QUEUE.track_inprogress(), NOMINATIM_QUEUE_WAIT.time():
+            await self.limiter.acquire_async()
+        try:
+            return await self.inner.fetch_data_async(street, house_number)
+        except DataRetrievalError as e:
+            if e.status_code == 429:
+                await self.limiter.backoff_async(_retry_after(e))
+            raise
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.inner.stats(),
+            "nominatim_rate_limit": self.limiter.stats(),
+        }
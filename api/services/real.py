@@ -1,21 +1,150 @@
+import asyncio
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import httpx
+from django.conf import settings
 from api.services.base import (
+    DANGEROUS_STAGES,
+    DEFAULT_OBJECT_ID_FIELD,
     BaseNominativeQuery,
     BaseGISNQuery,
     DataRetrievalError,
+    UpstreamError,
+)
+from api.services.deadline import (
+    DeadlineExceededError,
+    expired,
+    upstream_timeout,
 )
+from api.services.http import (
+    LoopLocalAsyncClient,
+    pool_stats,
+    upstream_client_options,
+)
+from api.services.layer_changes import object_id_field as layer_object_id_field
+from api.metrics import UPSTREAM_REQUESTS
 from httpx import HTTPStatusError, RequestError
 
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+GISN_LAYER_URL = (
+    "https://gisn.tel-aviv.gov.il/arcgis/rest/services/WM/IView2WM/MapServer/772"
+)
+GISN_OUT_FIELDS = ["addresses", "building_stage", "sw_tama_38"]
+
+# Geometry parameters per payload profile. Coordinates are in degrees
+# (outSR=4326): 6 decimals is about 10 cm, and an allowable offset of
+# 0.000005 generalizes rings by about half a meter, which is invisible on
+# the map at street zoom.
+GISN_PAYLOAD_PROFILES = {
+    "full": {},
+    "display": {
+        "geometryPrecision": "6",
+        "maxAllowableOffset": "0.000005",
+    },
+}
+
+
+def _count_response(upstream: str, response: httpx.Response):
+    UPSTREAM_REQUESTS.inc(upstream=upstream, status=str(response.status_code))
+
+
+@contextmanager
+def _nominatim_errors():
+    """Translate httpx and JSON errors into DataRetrievalError."""
+    try:
+        yield
+    except HTTPStatusError as e:
+        raise UpstreamError(
+            (
+                f"Nominatim API error: {e.response.status_code} "
+                f"{e.response.reason_phrase}"
+            ),
+            status_code=e.response.status_code,
+        ) from e
+    except RequestError as e:
+        UPSTREAM_REQUESTS.inc(upstream="nominatim", status="error")
+        if isinstance(e, httpx.TimeoutException) and expired():
+            raise DeadlineExceededError(
+                "Nominatim did not answer within the request deadline"
+            ) from e
+        raise UpstreamError(
+            "Nominatim request failed",
+            status_code=500,
+        ) from e
+    except (ValueError, TypeError) as e:
+        raise UpstreamError(
+            "Invalid JSON response from Nominatim",
+            status_code=500,
+        ) from e
+
+
+@contextmanager
+def _gisn_errors():
+    """Translate httpx and JSON errors into GISN service errors."""
+    try:
+        yield
+    except httpx.RequestError as e:
+        UPSTREAM_REQUESTS.inc(upstream="gisn", status="error")
+        if isinstance(e, httpx.TimeoutException) and expired():
+            raise DeadlineExceededError(
+                "GISN did not answer within the request deadline"
+            ) from e
+        raise UpstreamError(
+            f"GISN API request failed: {e!s}",
+            status_code=502,
+        ) from e
+    except (ValueError, TypeError) as e:
+        raise UpstreamError(
+            f"Invalid JSON response from GISN API: {e!s}",
+            status_code=502,
+        ) from e
+
 
 class RealNominativeQuery(BaseNominativeQuery):
 
-    def fetch_data(
-        self, street: str, house_number: int
-    ) -> tuple[float, float]:
+    def __init__(
+        self,
+        client: httpx.Client | None = None,
+        async_client: httpx.AsyncClient | None = None,
+        url: str | None = None,
+        timeout: float = 5.0,
+    ):
+        """Initialize the service.
+
+        Args:
+            client: HTTP client to use. Defaults to a pooled keep-alive
+                client configured from the ``NOMINATIM_*`` settings.
+            async_client: Async HTTP client to use. Defaults to one pooled
+                client per event loop, configured the same way.
+            url: Search endpoint. Defaults to the ``NOMINATIM_URL``
+                setting.
+            timeout: Longest wait for a Nominatim request, further
+                limited by the request deadline (see
+                ``api.services.deadline``).
+        """
+        self.client = client or httpx.Client(
+            **upstream_client_options("nominatim")
+        )
+        self.url = url or getattr(settings, "NOMINATIM_URL", NOMINATIM_URL)
+        self.timeout = timeout
+        self.async_clients = LoopLocalAsyncClient("nominatim", async_client)
+
+    def close(self):
+        self.client.close()
+        self.async_clients.close()
+
+    def stats(self) -> dict:
+        return {
+            "nominatim_pool": pool_stats(self.client),
+            "nominatim_async_pool": self.async_clients.stats(),
+        }
+
+    def _request(self, street: str, house_number: int) -> dict:
+        """Build the keyword arguments for the Nominatim search request."""
         query_string = " ".join([street, str(house_number), "תל", "אביב"])
-        url = "https://nominatim.openstreetmap.org/search"
         params = {
             "q": query_string,
             "format": "json",
@@ -36,34 +165,37 @@ class RealNominativeQuery(BaseNominativeQuery):
         if referer:
             headers["Referer"] = referer
 
-        try:
-            response = httpx.get(
-                url,
-                params=params,
-                headers=headers,
-                timeout=5,
-            )
+        return {
+            "url": self.url,
+            "params": params,
+            "headers": headers,
+            "timeout": upstream_timeout(self.timeout),
+        }
+
+    def fetch_data(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        with _nominatim_errors():
+            response = self.client.get(**self._request(street, house_number))
+            _count_response("nominatim", response)
             response.raise_for_status()
             data = response.json()
-        except HTTPStatusError as e:
-            raise DataRetrievalError(
-                (
-                    f"Nominatim API error: {e.response.status_code} "
-                    f"{e.response.reason_phrase}"
-                ),
-                status_code=e.response.status_code,
-            ) from e
-        except RequestError as e:
-            raise DataRetrievalError(
-                "Nominatim request failed",
-                status_code=500,
-            ) from e
-        except (ValueError, TypeError) as e:
-            raise DataRetrievalError(
-                "Invalid JSON response from Nominatim",
-                status_code=500,
-            ) from e
+        return self._parse(data)
+
+    async def fetch_data_async(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        client = self.async_clients.get()
+        with _nominatim_errors():
+            response = await client.get(**self._request(street, house_number))
+            _count_response("nominatim", response)
+            response.raise_for_status()
+            data = response.json()
+        return self._parse(data)
 
+    @staticmethod
+    def _parse(data) -> tuple[float, float]:
+        """Extract the first (longitude, latitude) from a search result."""
         if not data:
             raise DataRetrievalError(
                 "could not locate address",
@@ -91,20 +223,83 @@ class RealNominativeQuery(BaseNominativeQuery):
 class RealGISNQuery(BaseGISNQuery):
     """Real API implementation."""
 
-    def fetch_data(
-        self, coordinate, radius: int
+    def __init__(
+        self,
+        client: httpx.Client | None = None,
+        async_client: httpx.AsyncClient | None = None,
+        payload_profile: str = "full",
+        two_phase: bool = False,
+        page_size: int = 1000,
+        page_parallelism: int = 4,
+        layer_url: str | None = None,
+        timeout: float = 10.0,
+        object_id_field: str | None = None,
     ):
+        """Initialize the service.
 
-        url = (
-            "https://gisn.tel-aviv.gov.il/arcgis/rest/services/WM/IView2WM/MapServer/772/query"
+        Args:
+            client: HTTP client to use. Defaults to a pooled keep-alive
+                client configured from the ``GISN_*`` settings.
+            async_client: Async HTTP client to use. Defaults to one pooled
+                client per event loop, configured the same way.
+            payload_profile: Name of a ``GISN_PAYLOAD_PROFILES`` entry
+                controlling geometry precision and generalization.
+            two_phase: Query attributes only first, and fetch geometry
+                just for the dangerous parcels.
+            page_size: Object ids fetched per request when a query
+                exceeds GISN's transfer limit.
+            page_parallelism: Maximum pages fetched concurrently.
+            layer_url: Layer endpoint. Defaults to the ``GISN_LAYER_URL``
+                setting.
+            timeout: Longest wait for a GISN request, further limited by
+                the request deadline (see ``api.services.deadline``).
+            object_id_field: The layer's object id field. Read from the
+                layer metadata on first use by default.
+        """
+        if payload_profile not in GISN_PAYLOAD_PROFILES:
+            raise ValueError(f"Unknown GISN payload profile: {payload_profile}")
+        self.client = client or httpx.Client(**upstream_client_options("gisn"))
+        self.async_clients = LoopLocalAsyncClient("gisn", async_client)
+        self.layer_url = layer_url or getattr(
+            settings, "GISN_LAYER_URL", GISN_LAYER_URL
         )
+        self.payload_profile = payload_profile
+        self.two_phase = two_phase
+        self.page_size = page_size
+        self.page_parallelism = page_parallelism
+        self.timeout = timeout
+        self._object_id_field = object_id_field
+        self.paged_queries = 0
+        self.responses = 0
+        self.response_bytes = 0
+
+    def close(self):
+        self.client.close()
+        self.async_clients.close()
+
+    def stats(self) -> dict:
+        return {
+            "gisn_pool": pool_stats(self.client),
+            "gisn_async_pool": self.async_clients.stats(),
+            "gisn_payload": {
+                "profile": self.payload_profile,
+                "two_phase": self.two_phase,
+                "responses": self.responses,
+                "response_bytes": self.response_bytes,
+                "paged_queries": self.paged_queries,
+            },
+        }
+
+    def _request(self, coordinate, radius: int) -> dict:
+        """Build the keyword arguments for the GISN layer query."""
+        url = f"{self.layer_url}/query"
 
         geometry = {
             "x": float(coordinate[0]),
             "y": float(coordinate[1]),
         }
 
-        out_fields = ",".join(["addresses", "building_stage", "sw_tama_38"])
+        out_fields = ",".join(GISN_OUT_FIELDS)
 
         # Note: inSR and outSR use EPSG:4326 (WGS84), the standard projection
         # used by OpenStreetMap.
@@ -148,6 +343,7 @@ class RealGISNQuery(BaseGISNQuery):
             "quantizationParameters": "",
             "featureEncoding": "esriDefault",
             "f": "pjson",
+            **GISN_PAYLOAD_PROFILES[self.payload_profile],
         }
 
         # Define headers
@@ -156,22 +352,313 @@ class RealGISNQuery(BaseGISNQuery):
             "Accept-Language": "en-US,en;q=0.9",
         }
 
-        try:
-            response = httpx.get(url, params=params, headers=headers)
+        return {
+            "url": url,
+            "params": params,
+            "headers": headers,
+            "timeout": upstream_timeout(self.timeout),
+        }
 
-            if response.status_code != 200:
-                raise Exception(
-                    f"GISN API error: {response.status_code} {response.text}"
-                )
+    def _envelope_request(self, envelope, oid_field: str) -> dict:
+        """Build the query for the dangerous parcels within an envelope.
 
-            data = response.json()
+        The building stage is filtered by GISN, so only the parcels that
+        are shown come back.
+        """
+        request = self._request((0, 0), 0)
+        xmin, ymin, xmax, ymax = (float(value) for value in envelope)
+        stages = ",".join(
+            "'{}'".format(stage.replace("'", "''"))
+            for stage in DANGEROUS_STAGES
+        )
+        request["params"].update({
+            "where": f"building_stage IN ({stages})",
+            "geometry": json.dumps({
+                "xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax,
+                "spatialReference": {"wkid": 4326},
+            }),
+            "geometryType": "esriGeometryEnvelope",
+            "distance": "",
+            "units": "",
+            "outFields": ",".join([oid_field, *GISN_OUT_FIELDS]),
+        })
+        return request
+
+    def _attributes_request(
+        self, coordinate, radius: int, oid_field: str
+    ) -> dict:
+        """Build the first two-phase request: attributes only, no rings."""
+        request = self._request(coordinate, radius)
+        request["params"].update({
+            "outFields": ",".join([oid_field, *GISN_OUT_FIELDS]),
+            "returnGeometry": "false",
+        })
+        return request
+
+    @staticmethod
+    def _ids_request(request: dict) -> dict:
+        """Turn a query into one returning only the matching object ids."""
+        return {
+            **request,
+            "params": {
+                **request["params"],
+                "returnIdsOnly": "true",
+                "returnGeometry": "false",
+                "outFields": "",
+            },
+        }
+
+    @staticmethod
+    def _page_request(request: dict, object_ids) -> dict:
+        """Turn a query into a POST for the given object ids only.
+
+        The ids already satisfy the spatial filter, so it is dropped. POST
+        keeps long id lists out of the URL.
+        """
+        return {
+            "url": request["url"],
+            "headers": request["headers"],
+            "timeout": request["timeout"],
+            "data": {
+                **request["params"],
+                "objectIds": ",".join(str(object_id) for object_id in object_ids),
+                "geometry": "",
+                "geometryType": "",
+                "distance": "",
+                "units": "",
+            },
+        }
+
+    def _pages(self, request: dict, object_ids) -> list:
+        """Split ``object_ids`` into page requests of ``page_size`` ids."""
+        return [
+            self._page_request(request, object_ids[i:i + self.page_size])
+            for i in range(0, len(object_ids), self.page_size)
+        ]
+
+    @staticmethod
+    def _dangerous_ids(features, oid_field: str) -> list:
+        """Return the object ids of the dangerous parcels, in order.
+
+        Parcels without an object id cannot be fetched and are skipped.
+        """
+        return [
+            object_id
+            for feature in features
+            if (attributes := feature.get("attributes") or {}).get(
+                "building_stage"
+            ) in DANGEROUS_STAGES
+            and (object_id := attributes.get(oid_field)) is not None
+        ]
+
+    def _json(self, response: httpx.Response) -> dict:
+        """Return the decoded body of a successful GISN response."""
+        _count_response("gisn", response)
+        if response.status_code != 200:
+            raise UpstreamError(
+                f"GISN API error: {response.status_code} {response.text}",
+                status_code=response.status_code,
+            )
+
+        self.responses += 1
+        self.response_bytes += len(response.content)
+        return response.json()
+
+    def _query(self, request: dict) -> list:
+        """Run a query, paging by object id if GISN truncates it."""
+        data = self._json(self.client.get(**request))
+        if not data.get("exceededTransferLimit"):
             return data.get("features", [])
 
-        except httpx.RequestError as e:
-            raise Exception(
-                f"GISN API request failed: {e!s}"
-            ) from e
-        except (ValueError, TypeError) as e:
-            raise Exception(
-                f"Invalid JSON response from GISN API: {e!s}"
-            ) from e
+        self.paged_queries += 1
+        response = self.client.get(**self._ids_request(request))
+        object_ids = self._json(response).get("objectIds") or []
+        return self._fetch_pages(request, object_ids)
+
+    def _fetch_pages(self, request: dict, object_ids) -> list:
+        """Fetch features by id, ``page_parallelism`` pages at a time.
+
+        Pages are merged in the order of ``object_ids``.
+        """
+        def fetch(page):
+            return self._json(self.client.post(**page)).get("features", [])
+
+        pages = self._pages(request, object_ids)
+        if len(pages) <= 1:
+            return [feature for page in pages for feature in fetch(page)]
+        with ThreadPoolExecutor(
+            max_workers=min(self.page_parallelism, len(pages))
+        ) as pool:
+            return [
+                feature
+                for features in pool.map(fetch, pages)
+                for feature in features
+            ]
+
+    async def _query_async(self, client, request: dict) -> list:
+        data = self._json(await client.get(**request))
+        if not data.get("exceededTransferLimit"):
+            return data.get("features", [])
+
+        self.paged_queries += 1
+        response = await client.get(**self._ids_request(request))
+        object_ids = self._json(response).get("objectIds") or []
+        return await self._fetch_pages_async(client, request, object_ids)
+
+    async def _fetch_pages_async(self, client, request: dict, object_ids):
+        slots = asyncio.Semaphore(self.page_parallelism)
+
+        async def fetch(page):
+            async with slots:
+                response = await client.post(**page)
+            return self._json(response).get("features", [])
+
+        pages = await asyncio.gather(
+            *(fetch(page) for page in self._pages(request, object_ids))
+        )
+        return [feature for features in pages for feature in features]
+
+    def fetch_data(
+        self, coordinate, radius: int
+    ):
+        with _gisn_errors():
+            if not self.two_phase:
+                return self._query(self._request(coordinate, radius))
+
+            oid_field = self._oid_field()
+            object_ids = self._dangerous_ids(
+                self._query(
+                    self._attributes_request(coordinate, radius, oid_field)
+                ),
+                oid_field,
+            )
+            return self._fetch_pages(
+                self._request(coordinate, radius), object_ids
+            )
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        client = self.async_clients.get()
+        with _gisn_errors():
+            if not self.two_phase:
+                return await self._query_async(
+                    client, self._request(coordinate, radius)
+                )
+
+            oid_field = await self._oid_field_async(client)
+            object_ids = self._dangerous_ids(
+                await self._query_async(
+                    client,
+                    self._attributes_request(coordinate, radius, oid_field),
+                ),
+                oid_field,
+            )
+            return await self._fetch_pages_async(
+                client, self._request(coordinate, radius), object_ids
+            )
+
+    def fetch_envelope(self, envelope):
+        with _gisn_errors():
+            return self._query(
+                self._envelope_request(envelope, self._oid_field())
+            )
+
+    async def fetch_envelope_async(self, envelope):
+        client = self.async_clients.get()
+        with _gisn_errors():
+            return await self._query_async(
+                client,
+                self._envelope_request(
+                    envelope, await self._oid_field_async(client)
+                ),
+            )
+
+    def _metadata_request(self) -> dict:
+        return {
+            "url": self.layer_url,
+            "params": {"f": "json"},
+            "headers": {"Accept": "application/json"},
+            "timeout": upstream_timeout(self.timeout),
+        }
+
+    def fetch_layer_metadata(self) -> dict:
+        """Return the layer description (fields, edit info, limits)."""
+        with _gisn_errors():
+            return self._json(self.client.get(**self._metadata_request()))
+
+    @property
+    def object_id_field(self) -> str:
+        return self._object_id_field or DEFAULT_OBJECT_ID_FIELD
+
+    def _oid_field(self) -> str:
+        """Return the layer's object id field, reading it once."""
+        if self._object_id_field is None:
+            metadata = self._json(self.client.get(**self._metadata_request()))
+            self._object_id_field = layer_object_id_field(metadata)
+        return self._object_id_field
+
+    async def _oid_field_async(self, client) -> str:
+        if self._object_id_field is None:
+            response = await client.get(**self._metadata_request())
+            self._object_id_field = layer_object_id_field(self._json(response))
+        return self._object_id_field
+
+    def _layer_request(self, object_id_field: str, where: str = "1=1"):
+        """Build a query over the whole layer, without a spatial filter."""
+        request = self._request((0, 0), 0)
+        request["params"].update({
+            "where": where,
+            "geometry": "",
+            "geometryType": "",
+            "distance": "",
+            "units": "",
+            "outFields": ",".join([object_id_field, *GISN_OUT_FIELDS]),
+        })
+        return request
+
+    def fetch_object_ids(
+        self, object_id_field: str, where: str = "1=1"
+    ) -> list:
+        """Return the object ids of the layer's features matching ``where``.
+
+        Id queries are not capped by the layer's ``maxRecordCount``.
+        """
+        request = self._ids_request(
+            self._layer_request(object_id_field, where)
+        )
+        with _gisn_errors():
+            return self._json(self.client.get(**request)).get("objectIds") or []
+
+    def fetch_features(self, object_id_field: str, object_ids) -> list:
+        """Return the features with the given object ids, in that order."""
+        with _gisn_errors():
+            return self._fetch_pages(
+                self._layer_request(object_id_field), list(object_ids)
+            )
+
+    def fetch_layer(self, object_id_field: str, page_size: int = 1000):
+        """Yield every feature of the layer, paging with resultOffset.
+
+        Pages are ordered by ``object_id_field`` so that offsets stay
+        stable while paging.
+
+        Args:
+            object_id_field: Name of the layer's object id field.
+            page_size: Features requested per page; GISN caps this at the
+                layer's ``maxRecordCount``.
+        """
+        offset = 0
+        while True:
+            request = self._layer_request(object_id_field)
+            request["params"].update({
+                "orderByFields": object_id_field,
+                "resultOffset": str(offset),
+                "resultRecordCount": str(page_size),
+            })
+            with _gisn_errors():
+                data = self._json(self.client.get(**request))
+            features = data.get("features", [])
+            exceeded = data.get("exceededTransferLimit", False)
+            yield from features
+            if not features or (len(features) < page_size and not exceeded):
+                return
+            offset += len(features)
@@ -0,0 +1,333 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+
+from api.services.base import (
+    DANGEROUS_STAGES,
+    DEFAULT_OBJECT_ID_FIELD,
+    BaseGISNQuery,
+    DataRetrievalError,
+)
+from api.services.layer_changes import (
+    fetch_changes,
+    last_edit_date,
+    object_id_field,
+)
+from api.services.spatial import (
+    GridIndex,
+    circle_envelope,
+    feature_rings,
+    polygon_distance_meters,
+    rings_envelope,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class GISNLayerReplica:
+    """In-memory copy of GISN layer 772 with a spatial index.
+
+    Features keep the exact shape returned by the GISN query endpoint, so
+    radius query results can be passed to ``risk_assessment`` unchanged.
+    """
+
+    def __init__(
+        self, features, object_id_field: str = DEFAULT_OBJECT_ID_FIELD,
+        synced_at: float | None = None, cell_size: float = 0.002,
+        edited_at: int | None = None,
+    ):
+        """Initialize the replica.
+
+        Args:
+            features: GISN features with attributes and polygon geometry.
+            object_id_field: Attribute holding each feature's object id.
+            synced_at: Unix time of the sync that produced the features.
+            cell_size: Spatial index cell size in degrees.
+            edited_at: The layer's last edit time (epoch milliseconds)
+                when the features were fetched, if it publishes one.
+        """
+        self.object_id_field = object_id_field
+        self.synced_at = synced_at
+        self.edited_at = edited_at
+        self.features = {}
+        self.index = GridIndex(cell_size)
+        for feature in features:
+            self.add(feature)
+
+    def __len__(self):
+        return len(self.features)
+
+    def add(self, feature):
+        """Add or replace a feature, indexing it when it has polygon geometry."""
+        object_id = feature["attributes"][self.object_id_field]
+        self.features[object_id] = feature
+        rings = feature_rings(feature)
+        if rings:
+            self.index.insert(object_id, rings_envelope(rings))
+        else:
+            self.index.remove(object_id)
+
+    def remove(self, object_id):
+        """Remove a feature, returning it, or None if it is unknown."""
+        self.index.remove(object_id)
+        return self.features.pop(object_id, None)
+
+    def query_radius(self, coordinate, radius: float) -> list:
+        """Return features within ``radius`` meters of a coordinate.
+
+        Candidates come from the envelope index and are then filtered by
+        exact point-to-polygon distance, matching GISN's point + distance
+        intersection query.
+        """
+        coordinate = (float(coordinate[0]), float(coordinate[1]))
+        candidates = sorted(
+            self.index.query(circle_envelope(coordinate, radius))
+        )
+        return [
+            self.features[object_id] for object_id in candidates
+            if polygon_distance_meters(
+                coordinate, self.features[object_id]["geometry"]["rings"]
+            ) <= radius
+        ]
+
+    def query_envelope(self, envelope, stages) -> list:
+        """Return features in ``stages`` whose envelope meets ``envelope``."""
+        return [
+            self.features[object_id]
+            for object_id in sorted(self.index.query(envelope))
+            if self.features[object_id]["attributes"].get("building_stage")
+            in stages
+        ]
+
+    @classmethod
+    def sync(cls, service, page_size: int = 1000) -> "GISNLayerReplica":
+        """Download the full layer through a RealGISNQuery service."""
+        metadata = service.fetch_layer_metadata()
+        oid_field = object_id_field(metadata)
+        features = list(service.fetch_layer(oid_field, page_size=page_size))
+        return cls(
+            features, object_id_field=oid_field, synced_at=time.time(),
+            edited_at=last_edit_date(metadata),
+        )
+
+    def refresh(self, service) -> int | None:
+        """Apply the layer's edits since the sync, in place.
+
+        Only the features edited or added since ``edited_at`` are
+        downloaded, along with the list of object ids to find deletions.
+
+        Returns:
+            The number of features added, replaced or removed, or None
+            when the edits cannot be listed and a full sync is needed.
+        """
+        metadata = service.fetch_layer_metadata()
+        edited_at = last_edit_date(metadata)
+        if edited_at is None or self.edited_at is None:
+            return None
+        if edited_at == self.edited_at:
+            return 0
+        changes = fetch_changes(
+            service, metadata, self.edited_at, set(self.features),
+            self.object_id_field,
+        )
+        if changes is None:
+            return None
+        _, deleted, features = changes
+        for object_id in deleted:
+            self.remove(object_id)
+        for feature in features:
+            self.add(feature)
+        self.edited_at = edited_at
+        self.synced_at = time.time()
+        return len(deleted) + len(features)
+
+    def copy(self) -> "GISNLayerReplica":
+        """Return a copy that can be refreshed while this one is queried."""
+        return GISNLayerReplica(
+            self.features.values(),
+            object_id_field=self.object_id_field,
+            synced_at=self.synced_at,
+            cell_size=self.index.cell_size,
+            edited_at=self.edited_at,
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "GISNLayerReplica":
+        with Path(path).open(encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            data["features"],
+            object_id_field=data["object_id_field"],
+            synced_at=data.get("synced_at"),
+            edited_at=data.get("edited_at"),
+        )
+
+    def save(self, path: str | Path):
+        """Write the replica atomically, so readers never see a partial file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with temporary.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "object_id_field": self.object_id_field,
+                    "synced_at": self.synced_at,
+                    "edited_at": self.edited_at,
+                    "features": list(self.features.values()),
+                },
+                f,
+                ensure_ascii=False,
+            )
+        temporary.replace(path)
+
+
+class ReplicaGISNQuery(BaseGISNQuery):
+    """Answer GISN radius queries from a local replica of the layer.
+
+    The replica file is loaded on first use and reloaded when the sync job
+    replaces it. While no replica is available, queries go to the optional
+    fallback service.
+    """
+
+    RELOAD_CHECK_INTERVAL = 5.0
+
+    def __init__(
+        self, path: str | Path, fallback: BaseGISNQuery | None = None
+    ):
+        self.path = Path(path)
+        self.fallback = fallback
+        self.replica = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_replica(self) -> GISNLayerReplica | None:
+        now = time.monotonic()
+        if now - self._checked_at < self.RELOAD_CHECK_INTERVAL:
+            return self.replica
+        with self._lock:
+            if now - self._checked_at < self.RELOAD_CHECK_INTERVAL:
+                return self.replica
+            try:
+                mtime = self.path.stat().st_mtime
+                if mtime != self._mtime:
+                    self.replica = GISNLayerReplica.load(self.path)
+                    self._mtime = mtime
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError):
+                logger.exception("Failed to load GISN replica %s", self.path)
+            self._checked_at = time.monotonic()
+        return self.replica
+
+    def _unavailable(self):
+        return DataRetrievalError(
+            "GISN replica is not available", status_code=503
+        )
+
+    def fetch_data(self, coordinate, radius: int):
+        replica = self._current_replica()
+        if replica is not None:
+            return replica.query_radius(coordinate, radius)
+        if self.fallback is None:
+            raise self._unavailable()
+        return self.fallback.fetch_data(coordinate, radius)
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        replica = self.replica
+        if time.monotonic() - self._checked_at >= self.RELOAD_CHECK_INTERVAL:
+            # Loading the replica file can take a while; keep it off the loop.
+            replica = await sync_to_async(
+                self._current_replica, thread_sensitive=False
+            )()
+        if replica is not None:
+            return replica.query_radius(coordinate, radius)
+        if self.fallback is None:
+            raise self._unavailable()
+        return await self.fallback.fetch_data_async(coordinate, radius)
+
+    def fetch_envelope(self, envelope):
+        replica = self._current_replica()
+        if replica is not None:
+            return replica.query_envelope(envelope, DANGEROUS_STAGES)
+        if self.fallback is None:
+            raise self._unavailable()
+        return self.fallback.fetch_envelope(envelope)
+
+    async def fetch_envelope_async(self, envelope):
+        replica = self.replica
+        if time.monotonic() - self._checked_at >= self.RELOAD_CHECK_INTERVAL:
+            replica = await sync_to_async(
+                self._current_replica, thread_sensitive=False
+            )()
+        if replica is not None:
+            return replica.query_envelope(envelope, DANGEROUS_STAGES)
+        if self.fallback is None:
+            raise self._unavailable()
+        return await self.fallback.fetch_envelope_async(envelope)
+
+    def refresh(self, service, edited_at: int | None = None) -> int | None:
+        """Apply the layer's edits to the loaded replica.
+
+        The edits are applied to a copy, see GISNLayerReplica.refresh,
+        which then replaces the replica, so that queries see either the
+        old or the new layer. A replica file written by the sync job
+        later still replaces it.
+
+        Args:
+            service: RealGISNQuery to ask for the edits.
+            edited_at: The layer's last edit time if already known; a
+                replica that is that recent is left alone without asking.
+
+        Returns:
+            The number of features changed, or None when no replica is
+            loaded or the edits cannot be listed.
+        """
+        replica = self._current_replica()
+        if replica is None:
+            return None
+        if edited_at is not None and edited_at == replica.edited_at:
+            return 0
+        updated = replica.copy()
+        changed = updated.refresh(service)
+        # Swapped in even when no feature changed, so that its edit time
+        # moves on and the edits are not listed again on the next poll
+        if changed is not None:
+            with self._lock:
+                if self.replica is replica:
+                    self.replica = updated
+        return changed
+
+    @property
+    def object_id_field(self) -> str:
+        replica = self.replica
+        if replica is not None:
+            return replica.object_id_field
+        if self.fallback is not None:
+            return self.fallback.object_id_field
+        return DEFAULT_OBJECT_ID_FIELD
+
+    def invalidate(self, envelopes=None):
+        # The replica itself is refreshed by the layer change poller and
+        # replaced by the sync job, see refresh and _current_replica
+        if self.fallback is not None:
+            self.fallback.invalidate(envelopes)
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def stats(self) -> dict:
+        replica = self.replica
+        stats = self.fallback.stats() if self.fallback is not None else {}
+        stats["gisn_replica"] = {
+            "loaded": replica is not None,
+            "features": len(replica) if replica is not None else 0,
+            "synced_at": replica.synced_at if replica is not None else None,
+        }
+        return stats
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from api.services.base import DANGEROUS_STAGES
+from api.services.geocode_cache import normalize_address
+from api.services.spatial import (
+    GridIndex,
+    circle_envelope,
+    envelopes_intersect,
+    feature_rings,
+    polygon_distance_meters,
+    rings_envelope,
+)
+
+logger = logging.getLogger(__name__)
+
+# Radii (meters) that the table is built for; others are queried live.
+STANDARD_RADII = (50, 100, 200, 500)
+
+# "הרצל 7" in GISN's comma separated ``addresses`` attribute. Numbers with
+# a letter (10א) cannot be asked for, so they are left out.
+_ADDRESS = re.compile(r"^(?P<street>.*\D)\s+(?P<number>\d+)$")
+
+
+def parse_addresses(text: str | None) -> list[tuple[str, int]]:
+    """Split a GISN ``addresses`` attribute into (street, number) pairs."""
+    addresses = []
+    for part in (text or "").split(","):
+        match = _ADDRESS.match(part.strip())
+        if match:
+            addresses.append(
+                (match["street"].strip(), int(match["number"]))
+            )
+    return addresses
+
+
+def parcel_addresses(replica) -> dict[str, tuple[float, float]]:
+    """Return the addresses of a GISNLayerReplica's parcels.
+
+    Keys are ``normalize_address`` keys, values the center of the parcel
+    carrying the address.
+    """
+    addresses = {}
+    for feature in replica.features.values():
+        rings = feature_rings(feature)
+        if not rings:
+            continue
+        xmin, ymin, xmax, ymax = rings_envelope(rings)
+        center = ((xmin + xmax) / 2, (ymin + ymax) / 2)
+        for street, number in parse_addresses(
+            feature["attributes"].get("addresses")
+        ):
+            addresses.setdefault(normalize_address(street, number), center)
+    return addresses
+
+
+def geocoded_addresses(path: str | Path) -> dict[str, tuple[float, float]]:
+    """Return the addresses stored in a GeocodeCache file."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = connection.execute("SELECT key, lon, lat FROM geocode")
+        return {key: (lon, lat) for key, lon, lat in rows}
+    finally:
+        connection.close()
+
+
+class RiskTable:
+    """Precomputed dangerous parcels around every known address.
+
+    A read-only SQLite file written by ``manage.py build_risk_table``. For
+    each address (a ``normalize_address`` key) and each of the standard
+    radii it holds the ids of the dangerous parcels within that radius,
+    next to the parcels themselves, so that an analysis is one keyed read.
+    The file is reopened when the build job replaces it.
+
+    Entries are not served once the table's data is older than
+    ``max_age``, nor around layer edits reported through ``invalidate``
+    until a table built from a later sync replaces it.
+    """
+
+    RELOAD_CHECK_INTERVAL = 5.0
+
+    _SCHEMA = (
+        "CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)",
+        (
+            "CREATE TABLE address ("
+            " key TEXT PRIMARY KEY,"
+            " lon REAL NOT NULL,"
+            " lat REAL NOT NULL) WITHOUT ROWID"
+        ),
+        (
+            "CREATE TABLE risk ("
+            " key TEXT NOT NULL,"
+            " radius INTEGER NOT NULL,"
+            " object_ids TEXT NOT NULL,"
+            " PRIMARY KEY (key, radius)) WITHOUT ROWID"
+        ),
+        (
+            "CREATE TABLE parcel ("
+            " object_id INTEGER PRIMARY KEY,"
+            " feature TEXT NOT NULL)"
+        ),
+    )
+
+    def __init__(self, path: str | Path, max_age: float = 0):
+        """Initialize the table.
+
+        Args:
+            path: Table file written by ``build``.
+            max_age: Seconds after the replica sync the table was built
+                from (its build, if unknown) that it is served for. 0
+                serves it regardless of age.
+        """
+        self.path = Path(path)
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        # (time, envelopes) of the layer edits reported to invalidate
+        self._edits = []
+        self._local = threading.local()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls, path: str | Path, replica, addresses: dict,
+        radii=STANDARD_RADII,
+    ) -> int:
+        """Write the table for ``addresses`` from a GISNLayerReplica.
+
+        The file is written next to ``path`` and moved into place, so
+        readers never see a partial table.
+
+        Args:
+            path: Table file to write.
+            replica: GISNLayerReplica holding the whole layer.
+            addresses: ``normalize_address`` keys mapped to (lon, lat).
+            radii: Radii in meters to precompute.
+
+        Returns:
+            The number of addresses written.
+        """
+        dangerous = {
+            object_id: feature
+            for object_id, feature in replica.features.items()
+            if feature["attributes"].get("building_stage") in DANGEROUS_STAGES
+            and feature_rings(feature)
+        }
+        index = GridIndex()
+        for object_id, feature in dangerous.items():
+            index.insert(object_id, rings_envelope(feature_rings(feature)))
+        radii = sorted(radii)
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary.unlink(missing_ok=True)
+        connection = sqlite3.connect(temporary)
+        try:
+            for statement in cls._SCHEMA:
+                connection.execute(statement)
+            connection.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [
+                    ("built_at", str(time.time())),
+                    ("synced_at", str(replica.synced_at)),
+                    ("radii", json.dumps(radii)),
+                ],
+            )
+            connection.executemany(
+                "INSERT INTO parcel VALUES (?, ?)",
+                (
+                    (object_id, json.dumps(feature, ensure_ascii=False))
+                    for object_id, feature in dangerous.items()
+                ),
+            )
+            for key, coordinate in addresses.items():
+                connection.execute(
+                    "INSERT INTO address VALUES (?, ?, ?)",
+                    (key, *coordinate),
+                )
+                # One index query for the largest radius, bucketed by
+                # distance into the smaller ones
+                within = {radius: [] for radius in radii}
+                for object_id in sorted(
+                    index.query(circle_envelope(coordinate, radii[-1]))
+                ):
+                    distance = polygon_distance_meters(
+                        coordinate, feature_rings(dangerous[object_id])
+                    )
+                    for radius in radii:
+                        if distance <= radius:
+                            within[radius].append(object_id)
+                connection.executemany(
+                    "INSERT INTO risk VALUES (?, ?, ?)",
+                    (
+                        (key, radius, json.dumps(object_ids))
+                        for radius, object_ids in within.items()
+                    ),
+                )
+            connection.commit()
+        finally:
+            connection.close()
+        temporary.replace(path)
+        return len(addresses)
+
+    def _connection(self) -> sqlite3.Connection | None:
+        """Return this thread's connection, reopened after a rebuild."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.RELOAD_CHECK_INTERVAL:
+            with self._lock:
+                try:
+                    self._mtime = self.path.stat().st_mtime
+                except FileNotFoundError:
+                    self._mtime = None
+                self._checked_at = now
+        mtime = self._mtime
+        if mtime is None:
+            return None
+        local = self._local
+        if getattr(local, "mtime", None) != mtime:
+            if getattr(local, "connection", None) is not None:
+                local.connection.close()
+            local.connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True,
+                check_same_thread=False,
+            )
+            local.meta = self._read_meta(local.connection)
+            local.mtime = mtime
+            with self._lock:
+                self._edits = [
+                    edit for edit in self._edits
+                    if edit[0] > local.meta["synced_at"]
+                ]
+        return local.connection
+
+    @staticmethod
+    def _read_meta(connection: sqlite3.Connection) -> dict:
+        meta = dict(connection.execute("SELECT name, value FROM meta"))
+        built_at = float(meta["built_at"])
+        try:
+            synced_at = float(meta["synced_at"])
+        except (KeyError, ValueError):
+            synced_at = built_at
+        return {
+            "built_at": built_at,
+            "synced_at": synced_at,
+            "radii": frozenset(json.loads(meta["radii"])),
+        }
+
+    def _outdated(self, meta: dict, coordinate, radius: int) -> bool:
+        """Return True if an entry may not reflect the layer any more."""
+        synced_at = meta["synced_at"]
+        if self.max_age and time.time() - synced_at > self.max_age:
+            return True
+        area = circle_envelope(coordinate, radius)
+        with self._lock:
+            edits = list(self._edits)
+        return any(
+            edited_at > synced_at and (
+                envelopes is None
+                or any(envelopes_intersect(area, e) for e in envelopes)
+            )
+            for edited_at, envelopes in edits
+        )
+
+    def invalidate(self, envelopes=None):
+        """Stop serving entries near layer edits until the next rebuild.
+
+        Args:
+            envelopes: (xmin, ymin, xmax, ymax) envelopes of the edited
+                parcels, or None to stop serving the whole table.
+        """
+        with self._lock:
+            if envelopes is None:
+                self._edits.clear()
+            self._edits.append(
+                (time.time(), None if envelopes is None else list(envelopes))
+            )
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, street: str, house_number: int, radius: int):
+        """Return the precomputed analysis of an address.
+
+        Returns:
+            A ((lon, lat), features) tuple, or None if the address or the
+            radius is not in the table, or the entry is outdated. Features
+            are raw GISN features, as returned by
+            ``BaseGISNQuery.fetch_data``.
+        """
+        key = normalize_address(street, house_number)
+        try:
+            connection = self._connection()
+            if connection is None:
+                self._count(hit=False)
+                return None
+            meta = self._local.meta
+            if radius not in meta["radii"]:
+                return None
+            row = connection.execute(
+                "SELECT lon, lat, object_ids FROM address"
+                " JOIN risk USING (key) WHERE key = ? AND radius = ?",
+                (key, radius),
+            ).fetchone()
+            if not row:
+                self._count(hit=False)
+                return None
+            if self._outdated(meta, (row[0], row[1]), radius):
+                with self._lock:
+                    self.stale += 1
+                return None
+            object_ids = json.loads(row[2])
+            features = dict(connection.execute(
+                "SELECT object_id, feature FROM parcel WHERE object_id IN"
+                f" ({','.join('?' * len(object_ids))})",
+                object_ids,
+            ).fetchall()) if object_ids else {}
+        except (sqlite3.Error, KeyError, ValueError):
+            logger.exception("Risk table lookup failed")
+            self._count(hit=False)
+            return None
+        self._count(hit=True)
+        return (
+            (row[0], row[1]),
+            [json.loads(features[object_id]) for object_id in object_ids],
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "loaded": self._mtime is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
@@ -1,53 +1,311 @@
+import asyncio
+import time
+
 from api import app_state
-from api.services.base import DataRetrievalError
+from api.metrics import STAGE_DURATION
+from api.services.base import (
+    DANGEROUS_STAGES,
+    TEL_AVIV_BBOX,
+    DataRetrievalError,
+    UpstreamError,
+    track_staleness,
+)
+from api.services.deadline import (
+    DeadlineExceededError,
+    deadline,
+)
+from api.services.deadline import check as check_deadline
+from api.services.deadline import enforce as enforce_deadline
+from api.services.spatial import (
+    envelopes_intersect,
+    tile_envelope,
+    tiles_covering,
+)
+
+# Zoom of the tiles that bounding box queries are answered from.
+BBOX_TILE_ZOOM = 16
 
 
-def handle_address(street, house_number, radius):
+def handle_address(street, house_number, radius, timeout=None):
     """
     Returns dangerous places near a given address.
 
-    Uses Nominatim to get coordinates and GISN to find nearby places,
-    then filters them through a risk assessment function.
+    Addresses and radii found in the precomputed risk table are answered
+    from it. Otherwise Nominatim is used to get coordinates and GISN to
+    find nearby places, which are then filtered through a risk assessment
+    function.
 
     Args:
         street: Street name.
         house_number: House number.
         radius: Search radius in meters.
+        timeout: Seconds the whole analysis may take. Each upstream call
+            only gets the remaining budget. None for no deadline.
 
     Returns:
         List of dangerous places with their attributes and geometry.
 
     Raises:
         DataRetrievalError: If data retrieval from Nominatim service fails.
+        DeadlineExceededError: If the analysis cannot finish within ``timeout``.
         Exception: If coordinate format is invalid or GISN service fails.
     """
+    precomputed = _precomputed(street, house_number, radius)
+    if precomputed is not None:
+        with STAGE_DURATION.time(stage="risk_assessment"):
+            return risk_assessment(precomputed[1])
     nominative_service = app_state.get_nominative_service()
+
+    with deadline(timeout):
+        try:
+            with STAGE_DURATION.time(stage="geocode"):
+                address_coordinate = nominative_service.fetch_data(
+                    street, house_number
+                )
+        except DataRetrievalError as e:
+            raise _nominatim_error(e) from e
+
+        _validate_coordinate(address_coordinate)
+
+        check_deadline()
+        return handle_coordinate(address_coordinate, radius)
+
+
+def handle_coordinate(coordinate, radius, timeout=None):
+    """Returns dangerous places near a known coordinate.
+
+    Same as handle_address without the geocoding, for callers that already
+    have a (lon, lat) coordinate, e.g. from a click on the map.
+    """
     gisn_service = app_state.get_gisn_service()
 
+    with deadline(timeout), STAGE_DURATION.time(stage="gisn"):
+        places_in_radius = gisn_service.fetch_data(coordinate, radius)
+    with STAGE_DURATION.time(stage="risk_assessment"):
+        return risk_assessment(places_in_radius)
+
+
+def in_tel_aviv(coordinate):
+    """Return True if a (lon, lat) coordinate lies in TEL_AVIV_BBOX."""
+    lon, lat = coordinate
+    min_lon, min_lat, max_lon, max_lat = TEL_AVIV_BBOX
+    return min_lon <= lon <= max_lon and min_lat <= lat <= max_lat
+
+
+def _precomputed(street, house_number, radius):
+    """Look an address up in the risk table, if one is configured.
+
+    Returns:
+        A ((lon, lat), features) tuple, or None to analyze it live.
+    """
+    risk_table = app_state.get_risk_table()
+    if risk_table is None:
+        return None
+    # A keyed read of a local file, cheap enough for the event loop too
+    with STAGE_DURATION.time(stage="risk_table"):
+        return risk_table.lookup(street, house_number, radius)
+
+
+def _nominatim_error(error):
+    """Re-raise a Nominatim error with more context."""
+    if isinstance(error, DeadlineExceededError):
+        return error
+    return DataRetrievalError(
+        f"Nominatim error: {error.message}",
+        status_code=error.status_code,
+    )
+
+
+async def _geocode_async(nominative_service, street, house_number):
+    """Geocode an address and validate the resulting coordinate."""
     try:
-        address_coordinate = nominative_service.fetch_data(
-            street, house_number
-        )
+        with STAGE_DURATION.time(stage="geocode"):
+            async with enforce_deadline():
+                address_coordinate = await nominative_service.fetch_data_async(
+                    street, house_number
+                )
     except DataRetrievalError as e:
-        # Re-raise with more context
-        raise DataRetrievalError(
-            f"Nominatim error: {e.message}",
-            status_code=e.status_code,
-        ) from e
+        raise _nominatim_error(e) from e
+
+    _validate_coordinate(address_coordinate)
+    return address_coordinate
+
+
+async def _places_async(gisn_service, address_coordinate, radius):
+    """Query GISN for the places around a coordinate."""
+    check_deadline()
+    with STAGE_DURATION.time(stage="gisn"):
+        async with enforce_deadline():
+            return await gisn_service.fetch_data_async(
+                address_coordinate, radius
+            )
+
+
+async def handle_address_async(street, house_number, radius, timeout=None):
+    """Async variant of handle_address.
+
+    Awaits the services' ``fetch_data_async`` so that the upstream round
+    trips do not occupy a worker thread. Upstream calls still running at
+    the deadline are cancelled.
+    """
+    precomputed = _precomputed(street, house_number, radius)
+    if precomputed is not None:
+        with STAGE_DURATION.time(stage="risk_assessment"):
+            return risk_assessment(precomputed[1])
+    nominative_service = app_state.get_nominative_service()
+
+    with deadline(timeout):
+        address_coordinate = await _geocode_async(
+            nominative_service, street, house_number
+        )
+        return await handle_coordinate_async(address_coordinate, radius)
+
+
+async def handle_coordinate_async(coordinate, radius, timeout=None):
+    """Async variant of handle_coordinate."""
+    gisn_service = app_state.get_gisn_service()
+
+    with deadline(timeout):
+        places_in_radius = await _places_async(
+            gisn_service, coordinate, radius
+        )
+    with STAGE_DURATION.time(stage="risk_assessment"):
+        return risk_assessment(places_in_radius)
 
+
+async def stream_address_async(street, house_number, radius, timeout=None):
+    """Yield the analysis of an address as a sequence of events.
+
+    The resolved coordinate is yielded as soon as geocoding completes, so
+    a client can draw the search area before GISN answers. Dangerous
+    places follow one by one, then a closing event with their count:
+
+        {"type": "coordinate", "lon": ..., "lat": ..., "radius": ...}
+        {"type": "feature", "feature": {...}}
+        {"type": "done", "count": ..., "stale": ...}
+
+    ``stale`` is true when the places come from an expired cache entry
+    that is being refreshed. ``timeout`` bounds the time until the last
+    upstream answer, as in handle_address.
+
+    Raises:
+        DataRetrievalError: If data retrieval from Nominatim service fails.
+        DeadlineExceededError: If the analysis cannot finish within ``timeout``.
+        Exception: If coordinate format is invalid or GISN service fails.
+    """
+    precomputed = _precomputed(street, house_number, radius)
+    if precomputed is not None:
+        coordinate, places = precomputed
+        yield {
+            "type": "coordinate",
+            "lon": coordinate[0],
+            "lat": coordinate[1],
+            "radius": radius,
+        }
+        for event in _place_events(places, stale=False):
+            yield event
+        return
+    nominative_service = app_state.get_nominative_service()
+    expires_at = None if timeout is None else time.monotonic() + timeout
+
+    with deadline(timeout):
+        address_coordinate = await _geocode_async(
+            nominative_service, street, house_number
+        )
+    # The deadline cannot span a yield, so the rest gets what is left
+    events = stream_coordinate_async(
+        address_coordinate, radius,
+        None if expires_at is None else expires_at - time.monotonic(),
+    )
+    async for event in events:
+        yield event
+
+
+async def stream_coordinate_async(coordinate, radius, timeout=None):
+    """Yield the analysis of a known coordinate, see stream_address_async.
+
+    The coordinate event comes first, without waiting for GISN.
+    """
+    gisn_service = app_state.get_gisn_service()
+    expires_at = None if timeout is None else time.monotonic() + timeout
+    yield {
+        "type": "coordinate",
+        "lon": float(coordinate[0]),
+        "lat": float(coordinate[1]),
+        "radius": radius,
+    }
+
+    budget = None if expires_at is None else expires_at - time.monotonic()
+    with deadline(budget), track_staleness() as staleness:
+        places_in_radius = await _places_async(
+            gisn_service, coordinate, radius
+        )
+    for event in _place_events(places_in_radius, staleness["stale"]):
+        yield event
+
+
+def _place_events(places, stale):
+    """Yield the feature events of the dangerous places, then "done"."""
+    count = 0
+    for place in iter_risk_assessment(places):
+        count += 1
+        yield {"type": "feature", "feature": place}
+    yield {"type": "done", "count": count, "stale": stale}
+
+
+async def handle_tile_async(z, x, y, timeout=None):
+    """Returns the dangerous places of a web mercator map tile.
+
+    Tiles outside Tel Aviv are empty without asking GISN.
+    """
+    envelope = tile_envelope(z, x, y)
+    if not envelopes_intersect(envelope, TEL_AVIV_BBOX):
+        return []
+    gisn_service = app_state.get_gisn_service()
+
+    with deadline(timeout), STAGE_DURATION.time(stage="gisn"):
+        async with enforce_deadline():
+            places = await gisn_service.fetch_envelope_async(envelope)
+    with STAGE_DURATION.time(stage="risk_assessment"):
+        return risk_assessment(places)
+
+
+async def handle_bbox_async(envelope, timeout=None, zoom=BBOX_TILE_ZOOM):
+    """Returns the dangerous places of the tiles covering an envelope.
+
+    The box is answered tile by tile, so that it shares cache entries
+    with tile requests. Places spanning several tiles are returned once.
+    """
+    tiles = tiles_covering(envelope, zoom)
+    with deadline(timeout):
+        results = await asyncio.gather(
+            *(handle_tile_async(zoom, x, y) for x, y in tiles)
+        )
+    oid_field = app_state.get_gisn_service().object_id_field
+    places = []
+    seen = set()
+    for place in (place for result in results for place in result):
+        object_id = place["attributes"].get(oid_field)
+        if object_id is not None:
+            if object_id in seen:
+                continue
+            seen.add(object_id)
+        places.append(place)
+    return places
+
+
+def _validate_coordinate(address_coordinate):
     # Verify coordinate is a tuple or list with 2 elements
     if (
         not isinstance(address_coordinate, tuple | list)
         or len(address_coordinate) != 2
     ):
-        raise Exception(
+        raise UpstreamError(
             f"Invalid coordinate format from Nominatim: "
-            f"{address_coordinate}"
+            f"{address_coordinate}",
+            status_code=500,
         )
 
-    places_in_radius = gisn_service.fetch_data(address_coordinate, radius)
-    return risk_assessment(places_in_radius)
-
 
 def convert_rings_to_leaflet_format(rings):
     return [
@@ -59,9 +317,11 @@ def convert_rings_to_leaflet_format(rings):
 
 def risk_assessment(dangerous_places):
     """Filter dangerous places, convert geometry, return relevant data."""
-    dangerous_results = []
-    dangerous_stage = ["בבניה"]
+    return list(iter_risk_assessment(dangerous_places))
+
 
+def iter_risk_assessment(dangerous_places):
+    """Yield the dangerous places one by one, see risk_assessment."""
     for place in dangerous_places:
         # Handle both full place objects and attributes-only objects
         if isinstance(place, dict) and "attributes" in place:
@@ -70,23 +330,22 @@ def risk_assessment(dangerous_places):
             # If place is already just attributes, use it directly
             attributes = place
 
-        if attributes.get("building_stage") in dangerous_stage:
+        if attributes.get("building_stage") in DANGEROUS_STAGES:
             geometry = place.get("geometry") if isinstance(place, dict) else None
             if geometry and "rings" in geometry:
                 # For real API data with geometry
                 rings = geometry["rings"]
                 converted_rings = convert_rings_to_leaflet_format(rings)
-                dangerous_results.append({
+                yield {
                     "attributes": attributes,
                     "geometry": {
                         "rings": converted_rings
                     }
-                })
+                }
             else:
                 # For test data without geometry, return consistent structure
                 # Create a simple point geometry so the frontend can display it
-                dangerous_results.append({
+                yield {
                     "attributes": attributes,
                     "geometry": None  # No geometry available
-                })
-    return dangerous_results
+                }
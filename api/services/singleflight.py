@@ -0,0 +1,213 @@
+import asyncio
+import threading
+import weakref
+
+from api.services.base import (
+    BaseGISNQuery,
+    BaseNominativeQuery,
+    mark_stale,
+    track_staleness,
+)
+from api.services.deadline import (
+    DeadlineExceededError,
+    remaining,
+    without_deadline,
+)
+from api.services.deadline import enforce as enforce_deadline
+from api.services.geocode_cache import normalize_address
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    Threads calling ``do`` with a key that is already in flight wait for
+    the running call and receive its result (or exception). ``do_async``
+    does the same for coroutines on the same event loop. Results are
+    shared between callers and must not be mutated.
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._tasks = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run ``fn()`` unless a call for ``key`` is already in flight.
+
+        Waiting callers stop waiting at their own deadline.
+
+        Raises:
+            DeadlineExceededError: If the deadline passes while waiting.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            budget = remaining()
+            if not call.done.wait(None if budget is None else max(budget, 0)):
+                raise DeadlineExceededError()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, coroutine_fn):
+        """Await ``coroutine_fn()`` unless ``key`` is already in flight.
+
+        The shared call runs as its own task, so a cancelled caller does
+        not cancel the upstream request for the others. It runs without
+        the deadline of the caller that started it, which would otherwise
+        fail it for callers with more time left; each caller stops waiting
+        at its own deadline instead. Callers are told when the shared
+        result was stale (see ``mark_stale``).
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            if task is None:
+                task = tasks[key] = loop.create_task(
+                    self._shared(coroutine_fn)
+                )
+                task.add_done_callback(lambda _: tasks.pop(key, None))
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        async with enforce_deadline():
+            result, stale = await asyncio.shield(task)
+        if stale:
+            mark_stale()
+        return result
+
+    @staticmethod
+    async def _shared(coroutine_fn):
+        with without_deadline(), track_staleness() as staleness:
+            result = await coroutine_fn()
+        return result, staleness["stale"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls) + sum(
+                len(tasks) for tasks in self._tasks.values()
+            )
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": in_flight,
+            }
+
+
+class SingleFlightNominativeQuery(BaseNominativeQuery):
+    """Share one upstream geocode between concurrent identical requests."""
+
+    def __init__(
+        self, inner: BaseNominativeQuery, flight: SingleFlight | None = None
+    ):
+        self.inner = inner
+        self.flight = flight or SingleFlight()
+
+    def fetch_data(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        return self.flight.do(
+            normalize_address(street, house_number),
+            lambda: self.inner.fetch_data(street, house_number),
+        )
+
+    async def fetch_data_async(
+        self, street: str, house_number: int
+    ) -> tuple[float, float]:
+        return await self.flight.do_async(
+            normalize_address(street, house_number),
+            lambda: self.inner.fetch_data_async(street, house_number),
+        )
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {
+            **self.inner.stats(),
+            "nominatim_singleflight": self.flight.stats(),
+        }
+
+
+class SingleFlightGISNQuery(BaseGISNQuery):
+    """Share one upstream GISN query between concurrent identical requests."""
+
+    def __init__(
+        self, inner: BaseGISNQuery, flight: SingleFlight | None = None
+    ):
+        self.inner = inner
+        self.flight = flight or SingleFlight()
+
+    @staticmethod
+    def _key(coordinate, radius):
+        # ~1 cm precision; GISN cannot resolve closer points differently.
+        return (
+            round(float(coordinate[0]), 7),
+            round(float(coordinate[1]), 7),
+            radius,
+        )
+
+    def fetch_data(self, coordinate, radius: int):
+        return self.flight.do(
+            self._key(coordinate, radius),
+            lambda: self.inner.fetch_data(coordinate, radius),
+        )
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        return await self.flight.do_async(
+            self._key(coordinate, radius),
+            lambda: self.inner.fetch_data_async(coordinate, radius),
+        )
+
+    def fetch_envelope(self, envelope):
+        return self.flight.do(
+            ("envelope", *envelope),
+            lambda: self.inner.fetch_envelope(envelope),
+        )
+
+    async def fetch_envelope_async(self, envelope):
+        return await self.flight.do_async(
+            ("envelope", *envelope),
+            lambda: self.inner.fetch_envelope_async(envelope),
+        )
+
+    @property
+    def object_id_field(self) -> str:
+        return self.inner.object_id_field
+
+    def invalidate(self, envelopes=None):
+        self.inner.invalidate(envelopes)
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "gisn_singleflight": self.flight.stats()}
@@ -0,0 +1,242 @@
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+
+def meters_to_degrees(meters: float, latitude: float) -> tuple[float, float]:
+    """Convert a distance to (longitude, latitude) degree offsets.
+
+    Uses a local equirectangular approximation, which is accurate to well
+    under a meter at city scale.
+    """
+    lat_degrees = meters / METERS_PER_DEGREE
+    lon_degrees = lat_degrees / max(math.cos(math.radians(latitude)), 1e-9)
+    return lon_degrees, lat_degrees
+
+
+def distance_meters(a, b) -> float:
+    """Approximate distance between two (longitude, latitude) points."""
+    scale = math.cos(math.radians((a[1] + b[1]) / 2))
+    dx = (b[0] - a[0]) * scale
+    dy = b[1] - a[1]
+    return math.hypot(dx, dy) * METERS_PER_DEGREE
+
+
+def grid_cell(coordinate, cell_size: float) -> tuple[int, int]:
+    """Return the (column, row) of a grid of ``cell_size`` meter cells."""
+    lat_size = cell_size / METERS_PER_DEGREE
+    row = math.floor(coordinate[1] / lat_size)
+    lon_size, _ = meters_to_degrees(cell_size, (row + 0.5) * lat_size)
+    return math.floor(coordinate[0] / lon_size), row
+
+
+def grid_cell_center(cell, cell_size: float) -> tuple[float, float]:
+    """Return the (longitude, latitude) center of a grid_cell."""
+    lat_size = cell_size / METERS_PER_DEGREE
+    latitude = (cell[1] + 0.5) * lat_size
+    lon_size, _ = meters_to_degrees(cell_size, latitude)
+    return (cell[0] + 0.5) * lon_size, latitude
+
+
+def rings_envelope(rings) -> tuple[float, float, float, float]:
+    """Return the (xmin, ymin, xmax, ymax) envelope of polygon rings."""
+    xs = [point[0] for ring in rings for point in ring]
+    ys = [point[1] for ring in rings for point in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def circle_envelope(coordinate, radius: float):
+    """Return the envelope of a circle of ``radius`` meters."""
+    lon_offset, lat_offset = meters_to_degrees(radius, coordinate[1])
+    return (
+        coordinate[0] - lon_offset,
+        coordinate[1] - lat_offset,
+        coordinate[0] + lon_offset,
+        coordinate[1] + lat_offset,
+    )
+
+
+def envelopes_intersect(a, b) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def tile_envelope(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Return the (xmin, ymin, xmax, ymax) envelope of a web mercator tile.
+
+    Tiles are numbered as in the OpenStreetMap slippy map scheme, with
+    y growing southwards.
+    """
+    n = 2 ** z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def tile_of(coordinate, z: int) -> tuple[int, int]:
+    """Return the (x, y) of the zoom ``z`` tile holding a coordinate."""
+    n = 2 ** z
+    latitude = math.radians(coordinate[1])
+    x = math.floor((coordinate[0] + 180) / 360 * n)
+    y = math.floor(
+        (1 - math.asinh(math.tan(latitude)) / math.pi) / 2 * n
+    )
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_covering(envelope, z: int) -> list[tuple[int, int]]:
+    """Return the (x, y) of the zoom ``z`` tiles covering an envelope."""
+    min_x, max_y = tile_of((envelope[0], envelope[1]), z)
+    max_x, min_y = tile_of((envelope[2], envelope[3]), z)
+    return [
+        (x, y)
+        for y in range(min_y, max_y + 1)
+        for x in range(min_x, max_x + 1)
+    ]
+
+
+def _point_in_rings(x: float, y: float, rings) -> bool:
+    """Even-odd test over all rings, so holes are handled correctly."""
+    inside = False
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1], strict=True):
+            if (y1 > y) != (y2 > y):
+                cross_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                if x < cross_x:
+                    inside = not inside
+    return inside
+
+
+def _segment_distance(px, py, x1, y1, x2, y2) -> float:
+    dx = x2 - x1
+    dy = y2 - y1
+    length = dx * dx + dy * dy
+    if length == 0:
+        return math.hypot(px - x1, py - y1)
+    t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def polygon_distance_meters(coordinate, rings) -> float:
+    """Distance in meters from a point to a polygon, 0 if inside.
+
+    Args:
+        coordinate: (longitude, latitude) of the point.
+        rings: Polygon rings as lists of [longitude, latitude] pairs, as
+            returned by GISN with ``outSR=4326``.
+    """
+    scale = math.cos(math.radians(coordinate[1]))
+    px = coordinate[0] * scale
+    py = coordinate[1]
+    projected = [
+        [(point[0] * scale, point[1]) for point in ring] for ring in rings
+    ]
+    projected = [ring for ring in projected if ring]
+    if not projected:
+        return math.inf
+    if _point_in_rings(px, py, projected):
+        return 0.0
+    best = math.inf
+    for ring in projected:
+        for (x1, y1), (x2, y2) in zip(
+            ring, ring[1:] + ring[:1], strict=True
+        ):
+            best = min(best, _segment_distance(px, py, x1, y1, x2, y2))
+    return best * METERS_PER_DEGREE
+
+
+def feature_rings(feature):
+    """Return the polygon rings of a GISN feature, or None."""
+    geometry = feature.get("geometry") if isinstance(feature, dict) else None
+    if geometry and geometry.get("rings"):
+        return geometry["rings"]
+    return None
+
+
+def filter_features_within(features, coordinate, radius: float) -> list:
+    """Keep the features whose polygon lies within ``radius`` meters.
+
+    Features without geometry cannot be measured and are dropped.
+    """
+    return [
+        feature for feature in features
+        if (rings := feature_rings(feature)) is not None
+        and polygon_distance_meters(coordinate, rings) <= radius
+    ]
+
+
+class GridIndex:
+    """Uniform grid over envelopes, answering envelope intersection queries.
+
+    Building parcels are small and evenly spread across the city, so a
+    fixed-size grid performs as well as an R-tree at a fraction of the
+    code.
+    """
+
+    def __init__(self, cell_size: float = 0.002):
+        """Initialize the index.
+
+        Args:
+            cell_size: Grid cell size in degrees (0.002 is about 200 m).
+        """
+        self.cell_size = cell_size
+        self._cells = defaultdict(list)
+        self._envelopes = {}
+
+    def __len__(self):
+        return len(self._envelopes)
+
+    def _cell_range(self, envelope):
+        size = self.cell_size
+        return (
+            range(math.floor(envelope[0] / size),
+                  math.floor(envelope[2] / size) + 1),
+            range(math.floor(envelope[1] / size),
+                  math.floor(envelope[3] / size) + 1),
+        )
+
+    def insert(self, item_id, envelope):
+        """Add an item with its (xmin, ymin, xmax, ymax) envelope.
+
+        An item already in the index is moved to the new envelope.
+        """
+        self.remove(item_id)
+        self._envelopes[item_id] = envelope
+        columns, rows = self._cell_range(envelope)
+        for column in columns:
+            for row in rows:
+                self._cells[(column, row)].append(item_id)
+
+    def remove(self, item_id) -> bool:
+        """Remove an item, returning False if it was not indexed."""
+        envelope = self._envelopes.pop(item_id, None)
+        if envelope is None:
+            return False
+        columns, rows = self._cell_range(envelope)
+        for column in columns:
+            for row in rows:
+                cell = self._cells[(column, row)]
+                cell.remove(item_id)
+                if not cell:
+                    del self._cells[(column, row)]
+        return True
+
+    def query(self, envelope) -> list:
+        """Return ids of items whose envelope intersects ``envelope``."""
+        columns, rows = self._cell_range(envelope)
+        seen = set()
+        matches = []
+        for column in columns:
+            for row in rows:
+                for item_id in self._cells.get((column, row), ()):
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                    if envelopes_intersect(
+                        self._envelopes[item_id], envelope
+                    ):
+                        matches.append(item_id)
+        return matches
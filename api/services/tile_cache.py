@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from api.services.base import BaseGISNQuery
+from api.services.spatial import envelopes_intersect
+
+
+class TileCache:
+    """Bounded in-memory cache of GISN envelope queries per map tile.
+
+    Tiles are a fixed key space: every client viewing the same area asks
+    for the same tiles, so after warm-up nearly every pan is a hit.
+    Entries expire after ``ttl`` seconds, and the least recently used ones
+    are evicted when the entry count or approximate payload size exceeds
+    its bound.
+    """
+
+    def __init__(
+        self, ttl: float = 600, max_entries: int = 5000,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        """Initialize the cache.
+
+        Args:
+            ttl: Seconds an entry stays valid.
+            max_entries: Maximum number of cached tiles.
+            max_bytes: Maximum approximate size of all cached payloads.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(envelope) -> tuple:
+        # Tile envelopes are computed the same way every time; rounding
+        # only guards against float noise from other callers.
+        return tuple(round(float(value), 9) for value in envelope)
+
+    def get(self, envelope) -> list | None:
+        key = self.key(envelope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires_at"] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["features"]
+
+    def set(self, envelope, features: list):
+        size = len(json.dumps(features, ensure_ascii=False).encode())
+        if size > self.max_bytes:
+            return
+        key = self.key(envelope)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "features": features,
+                "size": size,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self.bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self.bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry["size"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def invalidate(self, envelopes=None) -> int:
+        """Drop the tiles meeting any of ``envelopes``, or all if None.
+
+        Returns the number of tiles dropped.
+        """
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if envelopes is None or any(
+                    envelopes_intersect(key, envelope)
+                    for envelope in envelopes
+                )
+            ]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class CachedTileGISNQuery(BaseGISNQuery):
+    """Serve GISN envelope queries from a TileCache when possible.
+
+    Radius queries pass through unchanged.
+    """
+
+    def __init__(self, inner: BaseGISNQuery, cache: TileCache):
+        self.inner = inner
+        self.cache = cache
+
+    def fetch_data(self, coordinate, radius: int):
+        return self.inner.fetch_data(coordinate, radius)
+
+    async def fetch_data_async(self, coordinate, radius: int):
+        return await self.inner.fetch_data_async(coordinate, radius)
+
+    def fetch_envelope(self, envelope):
+        features = self.cache.get(envelope)
+        if features is None:
+            features = self.inner.fetch_envelope(envelope)
+            self.cache.set(envelope, features)
+        return features
+
+    async def fetch_envelope_async(self, envelope):
+        features = self.cache.get(envelope)
+        if features is None:
+            features = await self.inner.fetch_envelope_async(envelope)
+            self.cache.set(envelope, features)
+        return features
+
+    @property
+    def object_id_field(self) -> str:
+        return self.inner.object_id_field
+
+    def invalidate(self, envelopes=None):
+        self.cache.invalidate(envelopes)
+        self.inner.invalidate(envelopes)
+
+    def close(self):
+        self.inner.close()
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "gisn_tile_cache": self.cache.stats()}
@@ -0,0 +1,276 @@
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from api.services.geocode_cache import normalize_street
+
+logger = logging.getLogger(__name__)
+
+STREETS_PATH = Path(__file__).resolve().parent / "data" / "streets.json"
+
+
+def brotli_available() -> bool:
+    """Return True if the optional ``brotli`` package is installed."""
+    return importlib.util.find_spec("brotli") is not None
+
+
+def negotiate_coding(accept_encoding: str, codings) -> str:
+    """Pick the best of ``codings`` allowed by an Accept-Encoding header.
+
+    Brotli is preferred over gzip, and ``identity`` is the fallback.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in ("br", "gzip"):
+        if coding in codings and accepted.get(
+            coding, accepted.get("*", 0.0)
+        ) > 0:
+            return coding
+    return "identity"
+
+
+# Street type words that users type but the street list leaves out
+# ("שד' רוטשילד" is listed as "רוטשילד").
+STREET_TYPE_WORDS = ("רחוב", "רח", "שדרות", "שדרת", "שד", "סמטת", "סמ")
+
+
+def _trigrams(text: str) -> set[str]:
+    """Return the trigrams of ``text``, padded to weigh the word start."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []
+
+
+class StreetIndex:
+    """In-memory search index over street names.
+
+    A prefix trie answers "starts with" lookups, and a trigram index finds
+    names containing the query anywhere or resembling it despite typos.
+    Names are compared in their ``normalize_street`` form, so niqqud,
+    geresh and punctuation differences do not matter.
+    """
+
+    # Minimum trigram (Dice) similarity for a fuzzy suggestion
+    MIN_SIMILARITY = 0.5
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.keys = [normalize_street(name) for name in names]
+        self._root = _TrieNode()
+        self._postings = {}
+        self._trigram_counts = []
+        self._exact = {}
+        for name_id, key in enumerate(self.keys):
+            self._exact.setdefault(key, name_id)
+            node = self._root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+                node.ids.append(name_id)
+            trigrams = _trigrams(key)
+            self._trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, []).append(name_id)
+
+    def _prefixed(self, key: str) -> list[int]:
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.ids
+
+    def _similar(self, key: str) -> dict[int, float]:
+        """Return the trigram similarity of every name sharing a trigram."""
+        trigrams = _trigrams(key)
+        shared = Counter(
+            name_id
+            for trigram in trigrams
+            for name_id in self._postings.get(trigram, ())
+        )
+        return {
+            name_id: 2 * count / (len(trigrams) + self._trigram_counts[name_id])
+            for name_id, count in shared.items()
+        }
+
+    def suggest(self, query: str, limit: int = 10) -> list[str]:
+        """Return up to ``limit`` street names matching ``query``.
+
+        Names starting with the query rank first, then names with a word
+        starting with it, then names containing it, then names similar to
+        it. Within each group, closer and shorter names rank higher.
+        """
+        key = normalize_street(query)
+        if not key:
+            return []
+
+        ranks = dict.fromkeys(self._prefixed(key), 0)
+        similarity = self._similar(key)
+        for name_id, score in similarity.items():
+            if name_id in ranks:
+                continue
+            name_key = self.keys[name_id]
+            if f" {key}" in name_key:
+                ranks[name_id] = 1
+            elif key in name_key:
+                ranks[name_id] = 2
+            elif score >= self.MIN_SIMILARITY:
+                ranks[name_id] = 3
+
+        ranked = sorted(ranks, key=lambda name_id: (
+            ranks[name_id],
+            -similarity.get(name_id, 0.0),
+            len(self.keys[name_id]),
+            self.names[name_id],
+        ))
+        return [self.names[name_id] for name_id in ranked[:limit]]
+
+    def match(self, street: str, min_similarity: float) -> str | None:
+        """Return the listed name of ``street``, or None if it is unknown.
+
+        An exact match (after normalization) wins. Otherwise the most
+        similar name is returned if its trigram similarity reaches
+        ``min_similarity``. A leading street type word such as "רחוב" or
+        "שד'" is ignored when needed.
+        """
+        key = normalize_street(street)
+        candidates = [key]
+        first_word, _, rest = key.partition(" ")
+        if rest and first_word in STREET_TYPE_WORDS:
+            candidates.append(rest)
+
+        best_id, best_score = None, 0.0
+        for candidate in candidates:
+            if candidate in self._exact:
+                return self.names[self._exact[candidate]]
+            for name_id, score in self._similar(candidate).items():
+                if score > best_score:
+                    best_id, best_score = name_id, score
+        if best_id is None or best_score < min_similarity:
+            return None
+        return self.names[best_id]
+
+
+class StreetList:
+    """The street names with their response body precomputed.
+
+    ``bodies`` maps a content coding (``identity``, ``gzip`` and, when the
+    ``brotli`` package is installed, ``br``) to the encoded JSON body.
+    Each coding has its own strong ETag, derived from the identity body.
+    ``index`` is a StreetIndex over the names.
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.index = StreetIndex(names)
+        body = json.dumps(
+            {"streets": names}, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        self.bodies = {
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        }
+        if brotli_available():
+            import brotli
+
+            self.bodies["br"] = brotli.compress(body)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {
+            coding: f'"{digest}"' if coding == "identity"
+            else f'"{digest}-{coding}"'
+            for coding in self.bodies
+        }
+
+    @classmethod
+    def load(cls, path: str | Path) -> "StreetList":
+        with Path(path).open(encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("t_rechov_values", []))
+
+
+class StreetCatalog:
+    """Street list loaded once per process and reloaded when it changes.
+
+    The file's mtime is checked at most every ``RELOAD_CHECK_INTERVAL``
+    seconds. If a reload fails, the previously loaded list keeps being
+    served.
+    """
+
+    RELOAD_CHECK_INTERVAL = 5.0
+
+    def __init__(self, path: str | Path = STREETS_PATH):
+        self.path = Path(path)
+        self.streets = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> StreetList:
+        """Return the current street list.
+
+        Raises:
+            FileNotFoundError: If the file is missing and was never loaded.
+            json.JSONDecodeError: If the file is invalid and no previous
+                version was loaded.
+        """
+        now = time.monotonic()
+        if (
+            self.streets is not None
+            and now - self._checked_at < self.RELOAD_CHECK_INTERVAL
+        ):
+            return self.streets
+        with self._lock:
+            if (
+                self.streets is not None
+                and now - self._checked_at < self.RELOAD_CHECK_INTERVAL
+            ):
+                return self.streets
+            try:
+                mtime = self.path.stat().st_mtime
+                if mtime != self._mtime:
+                    self.streets = StreetList.load(self.path)
+                    self._mtime = mtime
+            except (OSError, ValueError):
+                if self.streets is None:
+                    raise
+                logger.exception("Failed to reload streets %s", self.path)
+            self._checked_at = time.monotonic()
+        return self.streets
+
+
+street_catalog = StreetCatalog()
+
+
+def canonical_street(street: str, min_similarity: float) -> str | None:
+    """Map a typed street name to its name in the street list.
+
+    Returns None for unknown streets. If the street list cannot be
+    loaded, the street is returned unchanged rather than rejected.
+    """
+    try:
+        streets = street_catalog.get()
+    except (OSError, ValueError):
+        logger.exception("Street list unavailable, skipping validation")
+        return street
+    return streets.index.match(street, min_similarity)
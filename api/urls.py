@@ -1,8 +1,32 @@
 from django.urls import path
-from .views import analyze_address, get_streets
+from django.views.decorators.cache import never_cache
+
+from .views import (
+    analyze_address,
+    analyze_address_stream,
+    analyze_batch,
+    get_bbox,
+    get_streets,
+    get_tile,
+    readiness,
+    service_stats,
+    suggest_streets,
+)
 
 urlpatterns = [
     path("analyze/", analyze_address, name="analyze_address"),
-    path("streets/", get_streets, name="get_streets")
+    path(
+        "analyze/stream/", analyze_address_stream,
+        name="analyze_address_stream",
+    ),
+    path("analyze/batch/", analyze_batch, name="analyze_batch"),
+    path(
+        "tiles/<int:z>/<int:x>/<int:y>.json", get_tile, name="get_tile",
+    ),
+    path("tiles/bbox/", get_bbox, name="get_bbox"),
+    path("streets/", get_streets, name="get_streets"),
+    path("streets/suggest/", suggest_streets, name="suggest_streets"),
+    path("stats/", service_stats, name="service_stats"),
+    path("ready/", never_cache(readiness), name="readiness"),
 ]
 
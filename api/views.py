@@ -1,69 +1,546 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+    HttpResponsePermanentRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.views.decorators.csrf import csrf_exempt
+from urllib.parse import urlencode
+import hashlib
 import json
-from pathlib import Path
-from api.services import handle_address
+import time
+from api import app_state
+from api.metrics import (
+    IN_FLIGHT,
+    REQUEST_DURATION,
+    RESPONSE_SIZE,
+    STAGE_DURATION,
+    registry,
+)
+from api.streets import canonical_street, negotiate_coding, street_catalog
+from api.services.services import BBOX_TILE_ZOOM
+from api.services.spatial import tiles_covering
+from api.services import (
+    DataRetrievalError,
+    analyze_batch_async,
+    handle_address_async,
+    handle_bbox_async,
+    handle_coordinate_async,
+    handle_tile_async,
+    in_tel_aviv,
+    stream_address_async,
+    stream_coordinate_async,
+    track_staleness,
+)
+
+
+# Analysis functions per mode of _parse_analyze_request
+_ANALYZERS = {
+    "address": handle_address_async,
+    "coordinate": handle_coordinate_async,
+}
+_STREAMERS = {
+    "address": stream_address_async,
+    "coordinate": stream_coordinate_async,
+}
+
+# Highest zoom of /api/tiles/, the map's maximum zoom
+MAX_TILE_ZOOM = 19
+# Most tiles a /api/tiles/bbox/ query may cover
+MAX_BBOX_TILES = 64
+
+
+def _parse_analyze_payload(data):
+    """Validate an analyze request payload.
+
+    Returns:
+        A (street, house_number, radius) tuple, or a JsonResponse
+        describing the validation error.
+    """
+    street = data.get("street")
+    house_number = data.get("houseNumber")
+    radius = data.get("radius")
+
+    if not street:
+        return JsonResponse(
+            {"error": "Missing 'street' field"}, status=400
+        )
+    if not isinstance(street, str):
+        return JsonResponse(
+            {"error": "Invalid 'street' - must be a string"}, status=400
+        )
+    if settings.STREET_VALIDATION_ENABLED:
+        # Unknown streets are rejected before any upstream request, and
+        # known ones are sent upstream under their listed name.
+        canonical = canonical_street(
+            street, settings.STREET_MATCH_THRESHOLD
+        )
+        if canonical is None:
+            return JsonResponse(
+                {"error": f"Unknown street: {street}"}, status=400
+            )
+        street = canonical
+    if not house_number:
+        return JsonResponse(
+            {"error": "Missing 'house number' field"}, status=400
+        )
+
+    # Convert to proper types
+    try:
+        house_number = int(house_number)
+    except (ValueError, TypeError):
+        return JsonResponse(
+            {"error": "Invalid 'houseNumber' - must be a number"}, status=400
+        )
+
+    radius = _parse_radius(radius)
+    if isinstance(radius, JsonResponse):
+        return radius
+
+    return street, house_number, radius
+
+
+def _parse_coordinate_payload(data):
+    """Validate a coordinate analyze payload: ``{lat, lon, radius}``.
+
+    Coordinates are rounded to 6 decimals (about 10 cm), so that clicks on
+    the same spot share cache entries.
+
+    Returns:
+        A ((lon, lat), radius) tuple, or a JsonResponse describing the
+        validation error.
+    """
+    coordinate = []
+    for field in ("lon", "lat"):
+        value = data.get(field)
+        if value is None or value == "":
+            return JsonResponse(
+                {"error": f"Missing '{field}' field"}, status=400
+            )
+        try:
+            coordinate.append(round(float(value), 6))
+        except (ValueError, TypeError):
+            return JsonResponse(
+                {"error": f"Invalid '{field}' - must be a number"},
+                status=400,
+            )
+    coordinate = tuple(coordinate)
+    if not in_tel_aviv(coordinate):
+        return JsonResponse(
+            {"error": "Coordinate is outside Tel Aviv"}, status=400
+        )
+
+    radius = _parse_radius(data.get("radius"))
+    if isinstance(radius, JsonResponse):
+        return radius
+
+    return coordinate, radius
+
+
+def _parse_radius(radius):
+    # Convert radius to int, default to 100 if not provided
+    if radius is None:
+        return 100
+    try:
+        return int(radius)
+    except (ValueError, TypeError):
+        return JsonResponse(
+            {"error": "Invalid 'radius' - must be a number"}, status=400
+        )
+
+
+def _parse_analyze_request(data):
+    """Validate an address or a coordinate analyze payload.
+
+    Payloads with ``lat`` or ``lon`` are analyzed at that coordinate,
+    without geocoding.
+
+    Returns:
+        A (mode, args) tuple, where mode is "address" or "coordinate" and
+        args are the parsed payload, or a JsonResponse describing the
+        validation error.
+    """
+    if "lat" in data or "lon" in data:
+        mode, parsed = "coordinate", _parse_coordinate_payload(data)
+    else:
+        mode, parsed = "address", _parse_analyze_payload(data)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    return mode, parsed
+
+
+def _canonical_query(mode, args):
+    """Return the canonical query string of a GET analysis."""
+    if mode == "coordinate":
+        (lon, lat), radius = args
+        return urlencode({"lat": lat, "lon": lon, "radius": radius})
+    street, house_number, radius = args
+    return urlencode(
+        {"street": street, "houseNumber": house_number, "radius": radius}
+    )
+
+
+def _analyze_timeout(request):
+    """Return the deadline of an analysis in seconds.
+
+    ``ANALYZE_TIMEOUT`` by default. Clients may ask for a shorter one in
+    the ``X-Request-Timeout`` header, never a longer one.
+
+    Returns:
+        The timeout, or a JsonResponse describing an invalid header.
+    """
+    timeout = settings.ANALYZE_TIMEOUT
+    requested = request.headers.get("X-Request-Timeout")
+    if requested is None:
+        return timeout
+    try:
+        requested = float(requested)
+    except ValueError:
+        requested = 0
+    if not requested > 0:
+        return JsonResponse(
+            {"error": "Invalid 'X-Request-Timeout' - must be seconds"},
+            status=400,
+        )
+    return min(requested, timeout)
+
+
+def _service_error(error):
+    """Build the error response for a failed analysis.
+
+    Upstreams that are known to be unavailable (open circuit, full rate
+    limit queue) are reported as 503 so that clients back off, and
+    analyses that ran out of their deadline as 504.
+    """
+    status = 500
+    if error.status_code in (503, 504):
+        status = error.status_code
+    return JsonResponse({"error": f"Service error: {error!s}"}, status=status)
+
+
+def _if_none_match(request):
+    """Return the entity tags of If-None-Match, weak ones made strong."""
+    return {
+        tag.strip().removeprefix("W/")
+        for tag in request.headers.get("If-None-Match", "").split(",")
+    }
+
+
+def _observe_response(endpoint, response, start):
+    """Record the duration and body size of a response."""
+    REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(len(response.content), endpoint=endpoint)
+    return response
 
 
 @csrf_exempt
-def analyze_address(request):
+async def analyze_address(request):
+    """Analyze an address.
+
+    POST takes a JSON ``{street, houseNumber, radius}`` payload, or
+    ``{lat, lon, radius}`` to analyze a coordinate without geocoding it.
+    GET takes the same fields as query parameters and is cacheable: requests are
+    redirected to one canonical URL per analysis, and responses carry a
+    strong ETag derived from the body, answered with 304 on a matching
+    If-None-Match.
+    """
+    start = time.perf_counter()
+    with IN_FLIGHT.track_inprogress(endpoint="analyze"):
+        response = await _analyze_address(request)
+    return _observe_response("analyze", response, start)
+
+
+async def _analyze_address(request):
+    if request.method in ("GET", "HEAD"):
+        return await _analyze_address_get(request)
     if request.method == "POST":
         try:
             data = json.loads(request.body)
-            street = data.get("street")
-            house_number = data.get("houseNumber")
-            radius = data.get("radius")
-
-            if not street:
-                return JsonResponse(
-                    {"error": "Missing 'street' field"}, status=400
-                )
-            if not house_number:
-                return JsonResponse(
-                    {"error": "Missing 'house number' field"}, status=400
-                )
-
-            # Convert to proper types
-            try:
-                house_number = int(house_number)
-            except (ValueError, TypeError):
-                return JsonResponse(
-                    {"error": "Invalid 'houseNumber' - must be a number"}, status=400
-                )
-
-            # Convert radius to int, default to 100 if not provided
-            if radius is None:
-                radius = 100
-            else:
-                try:
-                    radius = int(radius)
-                except (ValueError, TypeError):
-                    return JsonResponse(
-                        {"error": "Invalid 'radius' - must be a number"}, status=400
-                    )
-
-            try:
-                response_data = handle_address(street, house_number, radius)
-                return JsonResponse(response_data, safe=False)
-            except Exception as e:
-                return JsonResponse(
-                    {"error": f"Service error: {e!s}"}, status=500
-                )
-
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON"}, status=400)
-    return JsonResponse({"error": "Only POST requests allowed"}, status=405)
+
+        parsed = _parse_analyze_request(data)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        mode, args = parsed
+        return await _analysis_response(request, _ANALYZERS[mode], *args)
+    return JsonResponse(
+        {"error": "Only GET and POST requests allowed"}, status=405
+    )
+
+
+async def _analyze_address_get(request):
+    parsed = _parse_analyze_request(request.GET)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+
+    # One URL per analysis, so that equivalent queries share cache entries
+    query = _canonical_query(*parsed)
+    if request.META.get("QUERY_STRING") != query:
+        response = HttpResponsePermanentRedirect(f"{request.path}?{query}")
+        response["Cache-Control"] = (
+            f"public, max-age={settings.ANALYZE_CACHE_MAX_AGE}"
+        )
+        return response
+
+    mode, args = parsed
+    response = await _analysis_response(request, _ANALYZERS[mode], *args)
+    return _cacheable(request, response, settings.ANALYZE_CACHE_MAX_AGE)
+
+
+def _cacheable(request, response, max_age):
+    """Make a successful JSON response cacheable, or answer 304.
+
+    The strong ETag is derived from the body. A matching If-None-Match
+    is answered with 304.
+    """
+    if response.status_code != 200:
+        return response
+    etag = f'"{hashlib.sha256(response.content).hexdigest()[:32]}"'
+    if etag in _if_none_match(request):
+        warning = response.get("Warning")
+        response = HttpResponseNotModified()
+        if warning:
+            response["Warning"] = warning
+    response["ETag"] = etag
+    # Stale results may be stored, but not reused without revalidation
+    response["Cache-Control"] = (
+        "no-cache" if response.has_header("Warning")
+        else f"public, max-age={max_age}"
+    )
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+async def _analysis_response(request, analyze, *args):
+    """Run ``analyze(*args)`` and return its JSON response."""
+    timeout = _analyze_timeout(request)
+    if isinstance(timeout, JsonResponse):
+        return timeout
+
+    try:
+        with track_staleness() as staleness:
+            response_data = await analyze(*args, timeout=timeout)
+        with STAGE_DURATION.time(stage="serialize"):
+            response = JsonResponse(response_data, safe=False)
+    except DataRetrievalError as e:
+        return _service_error(e)
+    if staleness["stale"]:
+        response["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
+@csrf_exempt
+async def analyze_address_stream(request):
+    """Analyze an address, streaming the result as NDJSON.
+
+    Takes the same payload as analyze_address. The first line holds the
+    resolved coordinate; each dangerous place follows on its own line,
+    then a ``done`` line. Geocoding errors are returned as a regular JSON
+    error response; later errors end the stream with an ``error`` line.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": "Only POST requests allowed"}, status=405
+        )
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    parsed = _parse_analyze_request(data)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    timeout = _analyze_timeout(request)
+    if isinstance(timeout, JsonResponse):
+        return timeout
+
+    mode, args = parsed
+    events = _STREAMERS[mode](*args, timeout=timeout)
+    try:
+        first = await anext(events)
+    except DataRetrievalError as e:
+        return _service_error(e)
+
+    async def lines():
+        yield json.dumps(first, ensure_ascii=False) + "\n"
+        try:
+            async for event in events:
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except DataRetrievalError as e:
+            yield json.dumps(
+                {"type": "error", "error": f"Service error: {e!s}"},
+                ensure_ascii=False,
+            ) + "\n"
+
+    response = StreamingHttpResponse(
+        lines(), content_type="application/x-ndjson"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Let nginx pass lines through as they are produced
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@csrf_exempt
+async def analyze_batch(request):
+    """Analyze a list of addresses in one request.
+
+    Expects a JSON array of ``{street, houseNumber, radius}`` objects and
+    returns ``{"results": [...]}`` with one entry per item, in order. Each
+    entry holds either ``result`` or ``error`` and ``status``.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": "Only POST requests allowed"}, status=405
+        )
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(data, list):
+        return JsonResponse(
+            {"error": "Expected a JSON array of addresses"}, status=400
+        )
+    item_timeout = _analyze_timeout(request)
+    if isinstance(item_timeout, JsonResponse):
+        return item_timeout
+    if len(data) > settings.BATCH_MAX_ITEMS:
+        return JsonResponse(
+            {"error": f"Too many items (max {settings.BATCH_MAX_ITEMS})"},
+            status=400,
+        )
+
+    results = [None] * len(data)
+    valid_indexes = []
+    valid_items = []
+    for index, item in enumerate(data):
+        parsed = (
+            _parse_analyze_payload(item) if isinstance(item, dict)
+            else JsonResponse({"error": "Invalid item"}, status=400)
+        )
+        if isinstance(parsed, JsonResponse):
+            results[index] = {
+                **json.loads(parsed.content), "status": parsed.status_code,
+            }
+        else:
+            valid_indexes.append(index)
+            valid_items.append(parsed)
+
+    analyzed = await analyze_batch_async(
+        valid_items,
+        geocode_concurrency=settings.BATCH_GEOCODE_CONCURRENCY,
+        gisn_concurrency=settings.BATCH_GISN_CONCURRENCY,
+        cluster_size=settings.BATCH_CLUSTER_SIZE,
+        timeout=settings.BATCH_TIMEOUT,
+        item_timeout=item_timeout,
+    )
+    for index, result in zip(valid_indexes, analyzed, strict=True):
+        results[index] = result
+    return JsonResponse({"results": results})
+
+
+async def get_tile(request, z, x, y):
+    """Return the dangerous places of a web mercator tile, cacheably.
+
+    Tiles are numbered as in the slippy map scheme, from zoom
+    ``TILE_MIN_ZOOM`` to MAX_TILE_ZOOM. Responses carry an ETag and
+    ``Cache-Control`` like GET analyze_address.
+    """
+    start = time.perf_counter()
+    with IN_FLIGHT.track_inprogress(endpoint="tiles"):
+        response = await _get_tile(request, z, x, y)
+    return _observe_response("tiles", response, start)
+
+
+async def _get_tile(request, z, x, y):
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    if not settings.TILE_MIN_ZOOM <= z <= MAX_TILE_ZOOM:
+        return JsonResponse(
+            {"error": f"Zoom must be between {settings.TILE_MIN_ZOOM} "
+                      f"and {MAX_TILE_ZOOM}"},
+            status=400,
+        )
+    if x >= 2 ** z or y >= 2 ** z:
+        return JsonResponse({"error": "Tile out of range"}, status=400)
+
+    response = await _analysis_response(request, handle_tile_async, z, x, y)
+    return _tile_response(request, response)
+
+
+async def get_bbox(request):
+    """Return the dangerous places around a bounding box, cacheably.
+
+    Takes ``bbox=min_lon,min_lat,max_lon,max_lat``. The box is answered
+    from the tiles covering it (see ``handle_bbox_async``), so places
+    slightly outside it may be included.
+    """
+    start = time.perf_counter()
+    with IN_FLIGHT.track_inprogress(endpoint="tiles"):
+        response = await _get_bbox(request)
+    return _observe_response("tiles", response, start)
+
+
+async def _get_bbox(request):
+    if request.method not in ("GET", "HEAD"):
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    try:
+        envelope = tuple(
+            float(value) for value in request.GET.get("bbox", "").split(",")
+        )
+    except ValueError:
+        envelope = ()
+    if len(envelope) != 4 or not (
+        envelope[0] < envelope[2] and envelope[1] < envelope[3]
+    ):
+        return JsonResponse(
+            {"error": "Invalid 'bbox' - must be "
+                      "min_lon,min_lat,max_lon,max_lat"},
+            status=400,
+        )
+    if len(tiles_covering(envelope, BBOX_TILE_ZOOM)) > MAX_BBOX_TILES:
+        return JsonResponse(
+            {"error": "Bounding box too large, zoom in"}, status=400
+        )
+
+    response = await _analysis_response(request, handle_bbox_async, envelope)
+    return _tile_response(request, response)
+
+
+def _tile_response(request, response):
+    """Make a tile response cacheable and name its object id attribute.
+
+    Clients drawing places that span several tiles once key them by the
+    ``X-Object-Id-Field`` attribute, which depends on the GISN layer.
+    """
+    response = _cacheable(request, response, settings.TILE_CACHE_MAX_AGE)
+    response["X-Object-Id-Field"] = (
+        app_state.get_gisn_service().object_id_field
+    )
+    return response
 
 
 @csrf_exempt
 def get_streets(request):
+    """Return the street names, precompressed and cacheable.
+
+    The body is built once per process (see ``api.streets``). Responses
+    carry a strong ETag per content coding, and a matching
+    If-None-Match is answered with 304.
+    """
+    start = time.perf_counter()
+    with IN_FLIGHT.track_inprogress(endpoint="streets"):
+        response = _get_streets(request)
+    return _observe_response("streets", response, start)
+
+
+def _get_streets(request):
     try:
-        data_dir = Path(__file__).resolve().parent / 'data'
-        streets_path = data_dir / 'streets.json'
-        with streets_path.open(encoding='utf-8') as f:
-            street_data = json.load(f)
-        street_names = street_data.get("t_rechov_values", [])
-        return JsonResponse({"streets": street_names})
+        streets = street_catalog.get()
     except FileNotFoundError:
         return JsonResponse(
             {"error": "streets.json not found"}, status=500
@@ -72,3 +549,96 @@ def get_streets(request):
         return JsonResponse(
             {"error": "Invalid streets.json format"}, status=500
         )
+
+    coding = negotiate_coding(
+        request.headers.get("Accept-Encoding", ""), streets.bodies
+    )
+    if_none_match = _if_none_match(request)
+    if "*" in if_none_match or if_none_match & set(streets.etags.values()):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            streets.bodies[coding], content_type="application/json"
+        )
+        if coding != "identity":
+            response["Content-Encoding"] = coding
+    response["ETag"] = streets.etags[coding]
+    response["Cache-Control"] = (
+        f"public, max-age={settings.STREETS_CACHE_MAX_AGE}"
+    )
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def suggest_streets(request):
+    """Return the street names best matching the ``q`` query parameter.
+
+    Accepts an optional ``limit`` (default 10, at most 50).
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return JsonResponse(
+            {"error": "Invalid 'limit' - must be a number"}, status=400
+        )
+    try:
+        streets = street_catalog.get()
+    except (OSError, ValueError):
+        return JsonResponse({"error": "Street list unavailable"}, status=500)
+
+    response = JsonResponse({
+        "suggestions": streets.index.suggest(request.GET.get("q", ""), limit),
+    })
+    response["Cache-Control"] = (
+        f"public, max-age={settings.STREETS_CACHE_MAX_AGE}"
+    )
+    return response
+
+
+def service_stats(request):
+    """Return cache counters and connection pool statistics."""
+    if request.method != "GET":
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    return JsonResponse({
+        "nominative": app_state.get_nominative_service().stats(),
+        "gisn": app_state.get_gisn_service().stats(),
+    })
+
+
+def readiness(request):
+    """Report whether this worker is ready for traffic.
+
+    Workers warm up before accepting requests (see api.warmup.lifespan),
+    so this answers 503 only while a warm-up is still running or when the
+    services or the street list are unavailable.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Only GET requests allowed"}, status=405)
+    warmup = app_state.get_warmup()
+    if warmup is not None and warmup["state"] == "running":
+        return JsonResponse({"ready": False, "warmup": warmup}, status=503)
+    if app_state.get_nominative_service() is None or (
+        app_state.get_gisn_service() is None
+    ):
+        return JsonResponse(
+            {"ready": False, "error": "Services not configured"}, status=503
+        )
+    try:
+        street_catalog.get()
+    except (OSError, ValueError):
+        return JsonResponse(
+            {"ready": False, "error": "Street list unavailable"}, status=503
+        )
+    return JsonResponse({"ready": True, "warmup": warmup})
+
+
+def prometheus_metrics(request):
+    """Return the metrics of all workers in Prometheus text format."""
+    if not settings.METRICS_ENABLED:
+        return JsonResponse({"error": "Metrics are disabled"}, status=404)
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import httpx
+from django.conf import settings
+
+from api import app_state
+from api.services import GeocodeCache, IntervalRateLimiter
+from api.services.risk_table import parse_addresses
+from api.streets import street_catalog
+
+logger = logging.getLogger(__name__)
+
+
+def read_addresses(path: str | Path) -> list[tuple[str, int]]:
+    """Read a hot-address list.
+
+    One or more comma separated "street number" addresses per line, as in
+    GISN's ``addresses`` attribute. Blank lines and lines starting with
+    ``#`` are ignored.
+    """
+    addresses = []
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.lstrip().startswith("#"):
+                addresses.extend(parse_addresses(line))
+    return addresses
+
+
+def popular_coordinates(path: str | Path, limit: int) -> list:
+    """Return the coordinates of the most requested cached geocodes."""
+    if limit <= 0 or not Path(path).exists():
+        return []
+    return [coordinate for _, coordinate in GeocodeCache(path).popular(limit)]
+
+
+def _summary(futures) -> dict:
+    """Count the finished, failed and cancelled warm-up futures."""
+    stats = {"done": 0, "failed": 0, "skipped": 0}
+    for future in futures:
+        if future.cancelled():
+            stats["skipped"] += 1
+        elif future.exception() is not None:
+            stats["failed"] += 1
+            logger.warning("Cache warm-up task failed: %s", future.exception())
+        else:
+            stats["done"] += 1
+    return stats
+
+
+def _run(tasks, concurrency: int, interval: float, timeout: float | None):
+    """Run callables on a thread pool, at most one per ``interval``.
+
+    Tasks still queued after ``timeout`` seconds are dropped; tasks
+    already running are waited for, so none outlive the warm-up. Their
+    upstream calls have timeouts of their own.
+
+    Returns:
+        A dict with the number of tasks ``done``, ``failed`` and
+        ``skipped``.
+    """
+    limiter = IntervalRateLimiter(interval) if interval > 0 else None
+
+    def run(task):
+        if limiter is not None:
+            limiter.acquire()
+        task()
+
+    executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="warmup"
+    )
+    futures = [executor.submit(run, task) for task in tasks]
+    wait(futures, timeout=timeout)
+    executor.shutdown(wait=True, cancel_futures=True)
+    return _summary(futures)
+
+
+async def _run_async(
+    tasks, concurrency: int, interval: float, timeout: float | None
+):
+    """Async variant of ``_run`` for coroutine functions.
+
+    Tasks still queued or running after ``timeout`` seconds are
+    cancelled.
+    """
+    limiter = IntervalRateLimiter(interval) if interval > 0 else None
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(task):
+        async with semaphore:
+            if limiter is not None:
+                await limiter.acquire_async()
+            await task()
+
+    futures = [asyncio.ensure_future(run(task)) for task in tasks]
+    if futures:
+        _, pending = await asyncio.wait(futures, timeout=timeout)
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return _summary(futures)
+
+
+def warm_caches(
+    addresses=(), coordinates=(), radius: int = 100, concurrency: int = 4,
+    interval: float = 0.0, timeout: float | None = None, gisn: bool = True,
+) -> dict:
+    """Warm the registered services' caches of this process.
+
+    Addresses are geocoded, which fills the geocode cache shared by all
+    workers; Nominatim calls stay within its shared rate limit. With
+    ``gisn``, GISN is then queried around each address and coordinate,
+    which fills this process's GISN caches (or loads the replica).
+
+    Args:
+        addresses: (street, house_number) pairs to geocode.
+        coordinates: (lon, lat) pairs already geocoded.
+        radius: Search radius in meters of the GISN queries.
+        concurrency: Maximum tasks in flight.
+        interval: Minimum seconds between task starts, 0 for no limit.
+        timeout: Seconds after which queued tasks are dropped.
+        gisn: Whether to query GISN.
+
+    Returns:
+        Task counts, see ``_run``.
+    """
+    nominative_service = app_state.get_nominative_service()
+    gisn_service = app_state.get_gisn_service()
+
+    def query(coordinate):
+        if gisn:
+            gisn_service.fetch_data(coordinate, radius)
+
+    def address_task(street, house_number):
+        return lambda: query(nominative_service.fetch_data(street, house_number))
+
+    def coordinate_task(coordinate):
+        return lambda: query(coordinate)
+
+    tasks = [address_task(*address) for address in addresses]
+    if gisn:
+        tasks += [coordinate_task(coordinate) for coordinate in coordinates]
+    return _run(tasks, concurrency, interval, timeout)
+
+
+async def warm_caches_async(
+    addresses=(), coordinates=(), radius: int = 100, concurrency: int = 4,
+    interval: float = 0.0, timeout: float | None = None, gisn: bool = True,
+) -> dict:
+    """Async variant of ``warm_caches``, through the services' async path.
+
+    Run on a worker's event loop, this also opens the loop's upstream
+    connection pools (see ``LoopLocalAsyncClient``) for every call that
+    is not answered from a cache.
+    """
+    nominative_service = app_state.get_nominative_service()
+    gisn_service = app_state.get_gisn_service()
+
+    async def query(coordinate):
+        if gisn:
+            await gisn_service.fetch_data_async(coordinate, radius)
+
+    def address_task(street, house_number):
+        async def task():
+            await query(await nominative_service.fetch_data_async(
+                street, house_number
+            ))
+        return task
+
+    def coordinate_task(coordinate):
+        return lambda: query(coordinate)
+
+    tasks = [address_task(*address) for address in addresses]
+    if gisn:
+        tasks += [coordinate_task(coordinate) for coordinate in coordinates]
+    return await _run_async(tasks, concurrency, interval, timeout)
+
+
+def warm_server(
+    url: str, addresses=(), coordinates=(), radius: int = 100,
+    concurrency: int = 4, interval: float = 0.0, timeout: float | None = None,
+) -> dict:
+    """Warm a running server by requesting analyses from it.
+
+    GET /api/analyze/ is used so that the nginx proxy cache is filled
+    along with the caches of whichever workers answer.
+
+    Args:
+        url: Base URL of the server, e.g. ``http://127.0.0.1:8080``.
+
+    See ``warm_caches`` for the other arguments.
+    """
+    client = httpx.Client(
+        base_url=url, follow_redirects=True, timeout=30,
+        limits=httpx.Limits(max_connections=concurrency),
+    )
+
+    def get(params):
+        def task():
+            client.get(
+                "/api/analyze/", params={**params, "radius": radius}
+            ).raise_for_status()
+        return task
+
+    tasks = [
+        get({"street": street, "houseNumber": house_number})
+        for street, house_number in addresses
+    ] + [
+        get({"lat": round(lat, 6), "lon": round(lon, 6)})
+        for lon, lat in coordinates
+    ]
+    try:
+        return _run(tasks, concurrency, interval, timeout)
+    finally:
+        client.close()
+
+
+async def prewarm_worker():
+    """Prepare this worker process before it accepts requests.
+
+    Loads the street list and index, then warms the caches and upstream
+    connection pools with the hot addresses (``WARMUP_ADDRESSES_PATH``)
+    and the most requested cached geocodes (``WARMUP_HISTORY``). Runs on
+    the worker's event loop, see ``lifespan``. The outcome is kept in
+    app_state for the readiness endpoint.
+    """
+    started = time.monotonic()
+    app_state.set_warmup({"state": "running"})
+    try:
+        street_catalog.get()
+    except (OSError, ValueError):
+        logger.exception("Cannot load the street list")
+    stats = {}
+    if getattr(settings, "WARMUP_ENABLED", False):
+        addresses = []
+        if settings.WARMUP_ADDRESSES_PATH:
+            try:
+                addresses = read_addresses(settings.WARMUP_ADDRESSES_PATH)
+            except OSError:
+                logger.exception("Cannot read the hot-address list")
+        coordinates = []
+        if getattr(settings, "GEOCODE_CACHE_ENABLED", False):
+            coordinates = popular_coordinates(
+                settings.GEOCODE_CACHE_PATH, settings.WARMUP_HISTORY
+            )
+        stats = await warm_caches_async(
+            addresses, coordinates,
+            radius=settings.WARMUP_RADIUS,
+            concurrency=settings.WARMUP_CONCURRENCY,
+            interval=settings.WARMUP_INTERVAL,
+            timeout=settings.WARMUP_TIMEOUT,
+        )
+    app_state.set_warmup({
+        "state": "done",
+        "seconds": round(time.monotonic() - started, 3),
+        **stats,
+    })
+    logger.info("Worker warm-up finished: %s", app_state.get_warmup())
+
+
+def lifespan(application):
+    """Wrap an ASGI application to warm each worker on lifespan startup.
+
+    Uvicorn only accepts connections once the startup event is answered,
+    and runs it on the worker's event loop, whose async upstream clients
+    the views then reuse. Django itself does not handle lifespan events.
+    """
+    async def app(scope, receive, send):
+        if scope["type"] != "lifespan":
+            await application(scope, receive, send)
+            return
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await prewarm_worker()
+                except Exception:
+                    logger.exception("Worker warm-up failed")
+                    app_state.set_warmup({"state": "failed"})
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    return app
@@ -0,0 +1,255 @@
+"""Micro-benchmarks for the stages of the analyze hot path.
+
+Each stage runs against synthetic GISN payloads of increasing size and
+is measured for wall time (best of ``--repeat`` runs) and peak Python
+memory (tracemalloc, in a separate run). Results are compared against a
+stored baseline, and any stage slower or larger than the baseline by more
+than the tolerance fails the run.
+
+Usage:
+    pdm run bench
+    pdm run bench --sizes 10,1000 --repeat 3
+    pdm run bench --update-baseline
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+MIN_LOOP_SECONDS = 0.1
+# Tel Aviv, around which synthetic parcels are scattered
+CENTER = (34.7735910, 32.0698820)
+
+
+def synthetic_features(count: int, seed: int = 0) -> list[dict]:
+    """Build ``count`` GISN-like parcel features, half of them dangerous.
+
+    Parcels are rectangles with a few intermediate points per edge, close
+    to the vertex counts of real layer 772 rings.
+    """
+    rng = random.Random(seed)
+    features = []
+    for object_id in range(count):
+        x = CENTER[0] + rng.uniform(-0.01, 0.01)
+        y = CENTER[1] + rng.uniform(-0.01, 0.01)
+        width = rng.uniform(0.0001, 0.0003)
+        height = rng.uniform(0.0001, 0.0003)
+        ring = [
+            [round(x + width * t / 3, 7), round(y, 7)] for t in range(3)
+        ] + [
+            [round(x + width, 7), round(y + height * t / 3, 7)]
+            for t in range(3)
+        ] + [
+            [round(x + width - width * t / 3, 7), round(y + height, 7)]
+            for t in range(3)
+        ] + [
+            [round(x, 7), round(y + height - height * t / 3, 7)]
+            for t in range(3)
+        ]
+        ring.append(ring[0])
+        features.append({
+            "attributes": {
+                "OBJECTID": object_id,
+                "addresses": f"רחוב הבדיקה {object_id}",
+                "building_stage": "בבניה" if object_id % 2 else "קיים היתר",
+                "sw_tama_38": rng.choice(["כן", "לא"]),
+            },
+            "geometry": {"rings": [ring]},
+        })
+    return features
+
+
+def stages(features: list[dict]) -> dict:
+    """Return the benchmarked stages as zero-argument callables."""
+    from django.http import JsonResponse
+
+    from api.services import risk_assessment
+    from api.services.services import convert_rings_to_leaflet_format
+
+    body = json.dumps({"features": features}).encode("utf-8")
+    results = risk_assessment(features)
+    rings = [feature["geometry"]["rings"] for feature in features]
+
+    return {
+        "gisn_json_decode": lambda: json.loads(body),
+        "risk_assessment": lambda: risk_assessment(features),
+        "convert_rings": lambda: [
+            convert_rings_to_leaflet_format(feature_rings)
+            for feature_rings in rings
+        ],
+        "json_response": lambda: JsonResponse(results, safe=False),
+    }
+
+
+def _timed(fn, number: int) -> float:
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def measure(fn, repeat: int) -> dict:
+    """Return the best wall time and the peak traced memory of ``fn``.
+
+    Like ``timeit``, fast stages are called in loops long enough to time
+    reliably (at least ``MIN_LOOP_SECONDS``) and the garbage collector is
+    paused while timing. The best of ``repeat`` loops counts.
+    """
+    number = 1
+    while (elapsed := _timed(fn, number)) < MIN_LOOP_SECONDS:
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        best = min(best, _timed(fn, number) / number)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def run(sizes, repeat: int) -> dict:
+    """Benchmark every stage at every size.
+
+    Returns:
+        ``{stage: {size: {"seconds": ..., "peak_bytes": ...}}}`` with
+        sizes as strings, as stored in the baseline file.
+    """
+    results = {}
+    for size in sizes:
+        for stage, fn in stages(synthetic_features(size)).items():
+            results.setdefault(stage, {})[str(size)] = measure(fn, repeat)
+    return results
+
+
+def compare(
+    results: dict, baseline: dict,
+    time_tolerance: float, memory_tolerance: float,
+) -> list[str]:
+    """Return a message for every measurement that regressed.
+
+    Stages or sizes missing from the baseline are not compared.
+    """
+    regressions = []
+    for stage, by_size in results.items():
+        for size, measured in by_size.items():
+            reference = baseline.get(stage, {}).get(size)
+            if reference is None:
+                continue
+            for key, tolerance in (
+                ("seconds", time_tolerance),
+                ("peak_bytes", memory_tolerance),
+            ):
+                limit = reference[key] * (1 + tolerance)
+                if measured[key] > limit:
+                    regressions.append(
+                        f"{stage}[{size}] {key}: {measured[key]:.6g} > "
+                        f"{reference[key]:.6g} (+{tolerance:.0%} allowed)"
+                    )
+    return regressions
+
+
+def format_table(results: dict, baseline: dict) -> str:
+    lines = [(
+        f"{'stage':<18}{'features':>9}{'ms':>11}{'baseline':>11}"
+        f"{'peak KiB':>11}{'baseline':>11}"
+    )]
+    for stage, by_size in results.items():
+        for size, measured in by_size.items():
+            reference = baseline.get(stage, {}).get(size, {})
+            base_ms = (
+                f"{reference['seconds'] * 1000:.3f}" if reference else "-"
+            )
+            base_kib = (
+                f"{reference['peak_bytes'] / 1024:.1f}" if reference else "-"
+            )
+            lines.append(
+                f"{stage:<18}{size:>9}{measured['seconds'] * 1000:>11.3f}"
+                f"{base_ms:>11}{measured['peak_bytes'] / 1024:>11.1f}"
+                f"{base_kib:>11}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in DEFAULT_SIZES),
+        help="Comma-separated feature counts (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5,
+        help="Timed runs per stage; the best one counts (default: 5).",
+    )
+    parser.add_argument(
+        "--baseline", type=Path, default=BASELINE_PATH,
+        help="Baseline JSON file (default: benchmarks/baseline.json).",
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true",
+        help="Write the results as the new baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--time-tolerance", type=float, default=0.5,
+        help="Allowed slowdown over the baseline (default: 0.5 = 50%%).",
+    )
+    parser.add_argument(
+        "--memory-tolerance", type=float, default=0.2,
+        help="Allowed peak memory growth (default: 0.2 = 20%%).",
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tamaod.settings")
+    import django
+
+    django.setup()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat)
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, indent=2) + "\n")
+        sys.stdout.write(format_table(results, {}) + "\n")
+        sys.stdout.write(f"Baseline written to {args.baseline}\n")
+        return 0
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())["results"]
+    sys.stdout.write(format_table(results, baseline) + "\n")
+
+    regressions = compare(
+        results, baseline, args.time_tolerance, args.memory_tolerance
+    )
+    if regressions:
+        sys.stderr.write("REGRESSIONS:\n")
+        for regression in regressions:
+            sys.stderr.write(f"  {regression}\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""End-to-end load test of /api/analyze/ against stub upstreams.
+
+Starts the Nominatim and GISN stubs of ``benchmarks.stubs``, runs the
+app under gunicorn with the production worker class, pointed at the
+stubs through ``NOMINATIM_URL`` and ``GISN_LAYER_URL``, and drives it
+with concurrent clients. Reports throughput and latency percentiles.
+
+Usage:
+    pdm run loadtest --workers 2 --concurrency 32 --requests 2000
+    pdm run loadtest --gisn-latency 0.4 --gisn-sigma 0.6 --gisn-error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.stubs import (
+    GISN_LAYER_PATH,
+    NOMINATIM_PATH,
+    StubServer,
+    StubUpstreams,
+    UpstreamProfile,
+)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STREETS_PATH = BASE_DIR / "api" / "data" / "streets.json"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(port: int, workers: int, env: dict) -> subprocess.Popen:
+    """Start the app the way deploy/run-gunicorn.sh does, on ``port``."""
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "tamaod.asgi:application",
+            "--worker-class", "uvicorn_worker.UvicornWorker",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--timeout", "120",
+            "--log-level", "warning",
+        ],
+        cwd=BASE_DIR,
+        env={**os.environ, **env},
+    )
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("App server exited during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("App server did not become ready")
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def drive(
+    url: str, requests: int, concurrency: int, payloads,
+) -> tuple[list[float], dict, float]:
+    """Send ``requests`` POSTs from ``concurrency`` clients.
+
+    Returns:
+        (latencies of successful requests in seconds, count per status
+        code, wall time in seconds).
+    """
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def client_loop(client):
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json=next(payloads))
+                status = response.status_code
+            except httpx.TransportError:
+                status = "transport_error"
+            elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(client_loop(client) for _ in range(concurrency))
+        )
+        wall = time.perf_counter() - start
+    return latencies, statuses, wall
+
+
+def payload_stream(house_numbers: int, radius: int, seed: int):
+    """Yield analyze payloads for random listed streets.
+
+    ``house_numbers`` bounds the distinct addresses per street and thereby
+    the geocode cache hit rate.
+    """
+    streets = json.loads(STREETS_PATH.read_text(encoding="utf-8"))[
+        "t_rechov_values"
+    ]
+    rng = random.Random(seed)
+    while True:
+        yield {
+            "street": rng.choice(streets),
+            "houseNumber": rng.randint(1, house_numbers),
+            "radius": radius,
+        }
+
+
+def report(latencies, statuses, wall, stubs: StubUpstreams) -> dict:
+    latencies = sorted(latencies)
+    total = sum(statuses.values())
+    return {
+        "requests": total,
+        "ok": statuses.get(200, 0),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "seconds": wall,
+        "throughput": total / wall if wall else 0.0,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "upstream": {
+            "nominatim_requests": stubs.nominatim.requests,
+            "nominatim_errors": stubs.nominatim.errors,
+            "gisn_requests": stubs.gisn.requests,
+            "gisn_errors": stubs.gisn.errors,
+        },
+    }
+
+
+def format_report(result: dict) -> str:
+    latency = result["latency_ms"]
+    upstream = result["upstream"]
+    lines = [
+        (
+            f"requests     {result['requests']} in {result['seconds']:.2f}s "
+            f"({result['throughput']:.1f} req/s)"
+        ),
+        f"statuses     {result['statuses']}",
+        (
+            f"latency ms   mean {latency['mean']:.1f}  "
+            f"p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+            f"p99 {latency['p99']:.1f}  max {latency['max']:.1f}"
+        ),
+        (
+            f"upstream     nominatim {upstream['nominatim_requests']} "
+            f"({upstream['nominatim_errors']} failed), "
+            f"gisn {upstream['gisn_requests']} "
+            f"({upstream['gisn_errors']} failed)"
+        ),
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--radius", type=int, default=100)
+    parser.add_argument(
+        "--house-numbers", type=int, default=100,
+        help="Distinct house numbers per street (default: 100).",
+    )
+    for upstream, latency in (("nominatim", 0.15), ("gisn", 0.3)):
+        parser.add_argument(
+            f"--{upstream}-latency", type=float, default=latency,
+            help=f"Median {upstream} latency in seconds "
+            "(default: %(default)s).",
+        )
+        parser.add_argument(
+            f"--{upstream}-sigma", type=float, default=0.5,
+            help="Log-normal latency spread (default: %(default)s).",
+        )
+        parser.add_argument(
+            f"--{upstream}-error-rate", type=float, default=0.0,
+            help="Share of requests failing with 503 (default: 0).",
+        )
+    parser.add_argument(
+        "--gisn-features", type=int, default=200,
+        help="Features per GISN response (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE",
+        help="Extra setting for the app, e.g. --env GISN_CACHE_ENABLED=False.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--json", type=Path, help="Also write the report to this file."
+    )
+    args = parser.parse_args(argv)
+
+    stubs = StubUpstreams(
+        nominatim=UpstreamProfile(
+            args.nominatim_latency, args.nominatim_sigma,
+            args.nominatim_error_rate,
+        ),
+        gisn=UpstreamProfile(
+            args.gisn_latency, args.gisn_sigma, args.gisn_error_rate
+        ),
+        gisn_features=args.gisn_features,
+        seed=args.seed,
+    )
+    stub_server = StubServer(stubs)
+    stub_server.start()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as run_dir:
+        env = {
+            "NOMINATIM_URL": f"{stub_server.base_url}{NOMINATIM_PATH}",
+            "GISN_LAYER_URL": f"{stub_server.base_url}{GISN_LAYER_PATH}",
+            "USE_MOCK_NOMINATIVE": "False",
+            "USE_MOCK_GISN": "False",
+            # The stub has no usage policy to respect
+            "NOMINATIM_MIN_INTERVAL": "0",
+            "GEOCODE_CACHE_PATH": str(Path(run_dir) / "geocode.sqlite3"),
+            "ALLOWED_HOSTS": "127.0.0.1,localhost",
+            **dict(item.split("=", 1) for item in args.env),
+        }
+        app = start_app(port, args.workers, env)
+        try:
+            wait_until_ready(f"http://127.0.0.1:{port}/api/stats/", app)
+            latencies, statuses, wall = asyncio.run(drive(
+                f"http://127.0.0.1:{port}/api/analyze/",
+                args.requests,
+                args.concurrency,
+                payload_stream(args.house_numbers, args.radius, args.seed),
+            ))
+        finally:
+            app.terminate()
+            app.wait(timeout=30)
+            stub_server.stop()
+
+    result = report(latencies, statuses, wall, stubs)
+    sys.stdout.write(format_report(result) + "\n")
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
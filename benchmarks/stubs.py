@@ -0,0 +1,168 @@
+"""Local stand-ins for the Nominatim and GISN APIs.
+
+The stubs answer the same URL shapes as the real services, with JSON
+that ``RealNominativeQuery`` and ``RealGISNQuery`` parse. Latency is
+drawn from a log-normal distribution, and a configurable share of
+requests fails with a 503, so load tests see realistic upstream
+behavior without touching the public services.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs
+
+from benchmarks.analyze import CENTER, synthetic_features
+
+NOMINATIM_PATH = "/search"
+GISN_LAYER_PATH = "/arcgis/rest/services/WM/IView2WM/MapServer/772"
+
+
+class UpstreamProfile:
+    """Behavior of one stubbed upstream.
+
+    Args:
+        latency: Median response time in seconds.
+        sigma: Log-normal shape parameter; 0 gives a constant latency,
+            larger values a longer tail.
+        error_rate: Share of requests answered with a 503 (0-1).
+    """
+
+    def __init__(
+        self, latency: float = 0.0, sigma: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self, rng: random.Random) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return self.latency * rng.lognormvariate(0, self.sigma)
+
+    def fails(self, rng: random.Random) -> bool:
+        return rng.random() < self.error_rate
+
+
+class StubUpstreams:
+    """ASGI app serving both stubbed upstreams.
+
+    Args:
+        nominatim: Nominatim behavior.
+        gisn: GISN behavior.
+        gisn_features: Features returned per GISN query; half of them
+            are in a dangerous building stage.
+        seed: Random seed for latencies, errors and coordinates.
+    """
+
+    def __init__(
+        self, nominatim: UpstreamProfile, gisn: UpstreamProfile,
+        gisn_features: int = 200, seed: int = 0,
+    ):
+        self.nominatim = nominatim
+        self.gisn = gisn
+        self.rng = random.Random(seed)
+        features = synthetic_features(gisn_features, seed=seed)
+        # Encoded once: the stub must not be the bottleneck.
+        self.gisn_body = json.dumps({"features": features}).encode()
+        self.gisn_metadata_body = json.dumps({
+            "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+        }).encode()
+        self.gisn_ids_body = json.dumps({
+            "objectIdFieldName": "OBJECTID",
+            "objectIds": [
+                feature["attributes"]["OBJECTID"] for feature in features
+            ],
+        }).encode()
+
+    def _nominatim_body(self) -> bytes:
+        lon = CENTER[0] + self.rng.uniform(-0.01, 0.01)
+        lat = CENTER[1] + self.rng.uniform(-0.01, 0.01)
+        return json.dumps([{"lon": f"{lon:.7f}", "lat": f"{lat:.7f}"}]).encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        path = scope["path"]
+        params = parse_qs(scope["query_string"].decode())
+        if path == NOMINATIM_PATH:
+            profile, body = self.nominatim, self._nominatim_body()
+        elif path == GISN_LAYER_PATH:
+            profile, body = self.gisn, self.gisn_metadata_body
+        elif path == f"{GISN_LAYER_PATH}/query":
+            profile = self.gisn
+            if params.get("returnIdsOnly") == ["true"]:
+                body = self.gisn_ids_body
+            else:
+                body = self.gisn_body
+        else:
+            await self._respond(send, 404, b'{"error": "not found"}')
+            return
+
+        # Drain the request body (GISN pages are POSTed)
+        while (await receive()).get("more_body"):
+            pass
+
+        profile.requests += 1
+        await asyncio.sleep(profile.delay(self.rng))
+        if profile.fails(self.rng):
+            profile.errors += 1
+            await self._respond(send, 503, b'{"error": "unavailable"}')
+            return
+        await self._respond(send, 200, body)
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class StubServer:
+    """Run a StubUpstreams app with uvicorn in a background thread."""
+
+    def __init__(self, app: StubUpstreams, host="127.0.0.1", port=0):
+        import uvicorn
+
+        self.app = app
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, host=host, port=port, log_level="warning",
+            access_log=False, lifespan="on",
+        ))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        socket = self.server.servers[0].sockets[0]
+        host, port = socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout: float = 10.0):
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Stub server did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
@@ -0,0 +1,16 @@
+# Gunicorn settings used by run-gunicorn.sh.
+
+
+def post_worker_init(worker):
+    """Start the worker's GISN layer change poller.
+
+    Runs after the Django application is loaded and before the worker's
+    event loop starts, so that edits made during the warm-up are caught.
+    The poller's GISN requests, including the first poll, run in its own
+    thread and do not hold up the boot. The warm-up itself runs on the event loop, on the ASGI lifespan
+    startup event (see api.warmup.lifespan in tamaod/asgi.py), and the
+    worker only accepts connections once it is done.
+    """
+    from django.apps import apps
+
+    apps.get_app_config("api").start_layer_change_poller()
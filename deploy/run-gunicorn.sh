@@ -6,6 +6,11 @@ export PDM_HOME="/tmp/pdm"
 export HOME="/tmp"
 mkdir -p "$PDM_HOME"
 
-# Run gunicorn via PDM
-exec /usr/local/bin/pdm run gunicorn tamaod.wsgi:application --bind 0.0.0.0:8000 --workers 2 --timeout 120
+# Drop metric files of the previous server's workers (see METRICS_DIR)
+rm -f "${METRICS_DIR:-/app/run/metrics}"/metrics-*.json
+
+# Run gunicorn via PDM, serving the ASGI application with uvicorn workers so
+# that each worker can keep many analyses in flight while waiting on upstreams.
+# Each worker warms up before it accepts requests (see api.warmup.lifespan).
+exec /usr/local/bin/pdm run gunicorn tamaod.asgi:application --config deploy/gunicorn.conf.py --worker-class uvicorn_worker.UvicornWorker --bind 0.0.0.0:8000 --workers 2 --timeout 120
 
@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tamaod.settings')
 
-application = get_asgi_application()
+
+
+def _application():
+    django_application = get_asgi_application()
+    # Imported once the apps are loaded
+    from api.warmup import lifespan
+
+    # Workers warm up on the ASGI lifespan startup event, before they
+    # accept connections
+    return lifespan(django_application)
+
+
+application = _application()
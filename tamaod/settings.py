@@ -80,6 +80,211 @@ ALLOWED_HOSTS = [
 USE_MOCK_NOMINATIVE = get_bool('USE_MOCK_NOMINATIVE', False)
 USE_MOCK_GISN = get_bool('USE_MOCK_GISN', False)
 
+# Persistent geocode cache in front of Nominatim. The SQLite file is shared
+# by all worker processes on the host and survives restarts. Expired
+# geocodes are kept GEOCODE_CACHE_STALE_TTL more seconds and served, marked
+# stale, when Nominatim fails.
+GEOCODE_CACHE_ENABLED = get_bool('GEOCODE_CACHE_ENABLED', True)
+GEOCODE_CACHE_PATH = Path(
+    os.getenv('GEOCODE_CACHE_PATH', BASE_DIR / 'run' / 'geocode_cache.sqlite3')
+)
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '50000'))
+GEOCODE_CACHE_STALE_TTL = int(
+    os.getenv('GEOCODE_CACHE_STALE_TTL', str(30 * 24 * 3600))
+)
+
+# Upstream endpoints. Override to point the real services at stand-ins,
+# e.g. the stub servers of benchmarks/loadtest.py.
+NOMINATIM_URL = os.getenv(
+    'NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search'
+)
+GISN_LAYER_URL = os.getenv(
+    'GISN_LAYER_URL',
+    'https://gisn.tel-aviv.gov.il/arcgis/rest/services/WM/IView2WM/MapServer/772',
+)
+
+# Upstream HTTP connection pools. Each worker keeps one long-lived client per
+# upstream, so the *_MAX_CONNECTIONS values are per-host caps per worker.
+# HTTP/2 is negotiated via ALPN and falls back to HTTP/1.1 when the upstream
+# does not support it.
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', '10')
+)
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+NOMINATIM_MAX_CONNECTIONS = int(os.getenv('NOMINATIM_MAX_CONNECTIONS', '2'))
+NOMINATIM_HTTP2 = get_bool('NOMINATIM_HTTP2', True)
+GISN_MAX_CONNECTIONS = int(os.getenv('GISN_MAX_CONNECTIONS', '20'))
+GISN_HTTP2 = get_bool('GISN_HTTP2', False)
+
+# GISN response size. "display" rounds coordinates and generalizes rings to
+# what the map can show; "full" returns rings at full precision. With
+# GISN_TWO_PHASE, parcels are queried without geometry first and rings are
+# fetched only for the dangerous ones.
+GISN_PAYLOAD_PROFILE = os.getenv('GISN_PAYLOAD_PROFILE', 'display')
+GISN_TWO_PHASE = get_bool('GISN_TWO_PHASE', False)
+# Queries that exceed GISN's transfer limit are re-fetched by object id in
+# pages of GISN_PAGE_SIZE, up to GISN_PAGE_PARALLELISM at a time.
+GISN_PAGE_SIZE = int(os.getenv('GISN_PAGE_SIZE', '1000'))
+GISN_PAGE_PARALLELISM = int(os.getenv('GISN_PAGE_PARALLELISM', '4'))
+
+# Seconds to wait for each GISN request before giving up.
+GISN_TIMEOUT = float(os.getenv('GISN_TIMEOUT', '10'))
+# Seconds to wait for each Nominatim request before giving up.
+NOMINATIM_TIMEOUT = float(os.getenv('NOMINATIM_TIMEOUT', '5'))
+
+# Deadline (seconds) of a whole analysis. Upstream calls get what is left
+# of it, and an analysis that runs out answers 504. Clients may ask for a
+# shorter deadline with an X-Request-Timeout header.
+ANALYZE_TIMEOUT = float(os.getenv('ANALYZE_TIMEOUT', '30'))
+
+# Browser cache lifetime (seconds) of /api/streets/. Clients revalidate
+# with the ETag afterwards, which is answered with 304 until the list
+# changes.
+STREETS_CACHE_MAX_AGE = int(os.getenv('STREETS_CACHE_MAX_AGE', '86400'))
+
+# Cache lifetime (seconds) of GET /api/analyze/ responses, in browsers and
+# in the nginx proxy cache. Stale results are never reused without
+# revalidation.
+ANALYZE_CACHE_MAX_AGE = int(os.getenv('ANALYZE_CACHE_MAX_AGE', '600'))
+
+# Validate analyze requests against api/data/streets.json. Streets are
+# matched to their listed name when their trigram similarity reaches the
+# threshold (0-1), and unknown streets are rejected with a 400. Off by
+# default: the list is incomplete (it lacks e.g. Allenby and HaYarkon), so
+# only enable it with a complete street list.
+STREET_VALIDATION_ENABLED = get_bool('STREET_VALIDATION_ENABLED', False)
+STREET_MATCH_THRESHOLD = float(os.getenv('STREET_MATCH_THRESHOLD', '0.7'))
+
+# Minimum seconds between Nominatim requests from all workers on the host
+# (usage policy is roughly 1 request/second), enforced by a token bucket in
+# a shared SQLite file. Up to NOMINATIM_RATE_LIMIT_BURST requests may go out
+# back to back after idle periods. Requests queue in arrival order and fail
+# with a 503 when their turn is more than NOMINATIM_MAX_QUEUE_WAIT seconds
+# away. Cache hits are not throttled. 0 disables it.
+NOMINATIM_MIN_INTERVAL = float(os.getenv('NOMINATIM_MIN_INTERVAL', '1.0'))
+NOMINATIM_RATE_LIMIT_BURST = int(os.getenv('NOMINATIM_RATE_LIMIT_BURST', '1'))
+NOMINATIM_MAX_QUEUE_WAIT = float(os.getenv('NOMINATIM_MAX_QUEUE_WAIT', '10'))
+NOMINATIM_RATE_LIMIT_PATH = Path(
+    os.getenv(
+        'NOMINATIM_RATE_LIMIT_PATH',
+        BASE_DIR / 'run' / 'nominatim_rate_limit.sqlite3',
+    )
+)
+
+# Batch analysis (/api/analyze/batch/)
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '5000'))
+BATCH_GEOCODE_CONCURRENCY = int(os.getenv('BATCH_GEOCODE_CONCURRENCY', '4'))
+BATCH_GISN_CONCURRENCY = int(os.getenv('BATCH_GISN_CONCURRENCY', '4'))
+# Addresses within the same cell of this size (meters) share a GISN query
+BATCH_CLUSTER_SIZE = int(os.getenv('BATCH_CLUSTER_SIZE', '250'))
+# Deadline (seconds) of a whole batch. By default, long enough to geocode
+# BATCH_MAX_ITEMS uncached addresses at the Nominatim rate limit. Each
+# geocode and GISN query of a batch still gets ANALYZE_TIMEOUT (or the
+# X-Request-Timeout of the request) once it starts.
+BATCH_TIMEOUT = float(os.getenv(
+    'BATCH_TIMEOUT',
+    str(BATCH_MAX_ITEMS * NOMINATIM_MIN_INTERVAL + ANALYZE_TIMEOUT),
+))
+
+# Coalesce concurrent identical Nominatim/GISN requests within a worker into
+# a single upstream call.
+SINGLE_FLIGHT_ENABLED = get_bool('SINGLE_FLIGHT_ENABLED', True)
+
+# Per-worker circuit breakers for Nominatim and GISN. After
+# CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive upstream failures (errors,
+# timeouts, 5xx/429 answers), requests to that upstream fail at once with a
+# 503 for CIRCUIT_BREAKER_RESET_TIMEOUT seconds, then a trial request
+# decides whether to close the circuit again.
+CIRCUIT_BREAKER_ENABLED = get_bool('CIRCUIT_BREAKER_ENABLED', True)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5')
+)
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(
+    os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT', '30')
+)
+
+# In-memory cache of GISN radius queries (per worker). Results are cached per
+# grid cell for a canonical radius bucket and filtered locally, so nearby
+# requests with smaller radii reuse the same upstream query. Expired results
+# are served, marked stale, for up to GISN_CACHE_STALE_TTL more seconds while
+# they are refreshed in the background.
+GISN_CACHE_ENABLED = get_bool('GISN_CACHE_ENABLED', True)
+GISN_CACHE_TTL = int(os.getenv('GISN_CACHE_TTL', '600'))
+GISN_CACHE_STALE_TTL = int(os.getenv('GISN_CACHE_STALE_TTL', '3600'))
+GISN_CACHE_MAX_ENTRIES = int(os.getenv('GISN_CACHE_MAX_ENTRIES', '2000'))
+GISN_CACHE_MAX_BYTES = int(
+    os.getenv('GISN_CACHE_MAX_BYTES', str(64 * 1024 * 1024))
+)
+GISN_CACHE_CELL_SIZE = int(os.getenv('GISN_CACHE_CELL_SIZE', '100'))
+GISN_CACHE_RADIUS_BUCKETS = [
+    int(radius) for radius in os.getenv(
+        'GISN_CACHE_RADIUS_BUCKETS', '100,250,500,1000'
+    ).split(',')
+]
+
+# Map tiles (/api/tiles/<z>/<x>/<y>.json) of zoom TILE_MIN_ZOOM and up. Each
+# tile's GISN envelope query is cached in memory per worker for
+# TILE_CACHE_TTL seconds, and responses may be cached by browsers and nginx
+# for TILE_CACHE_MAX_AGE seconds.
+TILE_MIN_ZOOM = int(os.getenv('TILE_MIN_ZOOM', '15'))
+TILE_CACHE_ENABLED = get_bool('TILE_CACHE_ENABLED', True)
+TILE_CACHE_TTL = int(os.getenv('TILE_CACHE_TTL', '600'))
+TILE_CACHE_MAX_ENTRIES = int(os.getenv('TILE_CACHE_MAX_ENTRIES', '5000'))
+TILE_CACHE_MAX_AGE = int(os.getenv('TILE_CACHE_MAX_AGE', '600'))
+
+# Local replica of GISN layer 772, written by `manage.py sync_gisn_layer`.
+# When enabled, radius queries are answered from an in-memory spatial index
+# and the live GISN API is only used until the replica file exists.
+USE_GISN_REPLICA = get_bool('USE_GISN_REPLICA', False)
+GISN_REPLICA_PATH = Path(
+    os.getenv('GISN_REPLICA_PATH', BASE_DIR / 'run' / 'gisn_layer_772.json')
+)
+
+# Seconds between checks of GISN layer 772's last edit date by each gunicorn
+# worker. When the layer changes, the cached GISN and tile results around the
+# edited parcels are dropped (all of them if parcels were deleted), so
+# GISN_CACHE_TTL and TILE_CACHE_TTL can be raised safely. 0 disables it.
+GISN_CHANGE_POLL_INTERVAL = float(os.getenv('GISN_CHANGE_POLL_INTERVAL', '300'))
+
+# Dangerous parcels around every known address at the standard radii (50,
+# 100, 200 and 500 m), written by `manage.py build_risk_table`. When
+# enabled, analyses of listed addresses are answered from this table
+# without calling Nominatim or GISN; other radii and unknown addresses are
+# analyzed live. The file is reopened when the build job replaces it. It is
+# not used once its replica sync is older than RISK_TABLE_MAX_AGE seconds (0
+# for no limit), nor around layer edits found by the GISN_CHANGE_POLL_INTERVAL
+# poller until a table built from a later sync replaces it.
+RISK_TABLE_ENABLED = get_bool('RISK_TABLE_ENABLED', False)
+RISK_TABLE_PATH = Path(
+    os.getenv('RISK_TABLE_PATH', BASE_DIR / 'run' / 'risk_table.sqlite3')
+)
+RISK_TABLE_MAX_AGE = int(os.getenv('RISK_TABLE_MAX_AGE', str(2 * 24 * 3600)))
+
+# Warm-up of each gunicorn worker before it accepts requests (see
+# api.warmup.lifespan) and of `manage.py warm_caches`. The addresses in
+# WARMUP_ADDRESSES_PATH (one "street number" per line) are geocoded, and
+# GISN is queried at WARMUP_RADIUS around them and around the
+# WARMUP_HISTORY most requested cached geocodes, WARMUP_CONCURRENCY at a
+# time and at most one every WARMUP_INTERVAL seconds. A worker cancels the
+# tasks not finished within WARMUP_TIMEOUT seconds; keep it below the
+# gunicorn worker timeout.
+WARMUP_ENABLED = get_bool('WARMUP_ENABLED', True)
+WARMUP_ADDRESSES_PATH = os.getenv('WARMUP_ADDRESSES_PATH', '')
+WARMUP_HISTORY = int(os.getenv('WARMUP_HISTORY', '200'))
+WARMUP_RADIUS = int(os.getenv('WARMUP_RADIUS', '100'))
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', '4'))
+WARMUP_INTERVAL = float(os.getenv('WARMUP_INTERVAL', '0.05'))
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '60'))
+
+# Prometheus metrics on /metrics. Each worker writes its values to a file in
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, and /metrics sums the
+# files of all workers. Without METRICS_DIR only the answering worker's
+# values are reported.
+METRICS_ENABLED = get_bool('METRICS_ENABLED', True)
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'run' / 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1.0'))
+
 
 # Application definition
 
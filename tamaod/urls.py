@@ -21,10 +21,12 @@ from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.contrib.staticfiles.views import serve as staticfiles_serve
 from django.views.decorators.cache import never_cache
+from api.views import prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', never_cache(prometheus_metrics), name='metrics'),
     path('', include('ui.urls')),
 ]
 
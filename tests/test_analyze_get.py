@@ -0,0 +1,115 @@
+import time
+from urllib.parse import urlencode
+
+import pytest
+from django.test import Client
+
+from api import app_state
+from api.services import (
+    CachedGISNQuery,
+    GISNResultCache,
+    MockGISNQuery,
+    MockNominativeQuery,
+)
+
+CANONICAL = "/api/analyze/?" + urlencode(
+    {"street": "דיזנגוף", "houseNumber": 50, "radius": 100}
+)
+
+
+@pytest.fixture
+def use_gisn():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+
+    def use(gisn):
+        app_state.set_services(MockNominativeQuery(), gisn)
+
+    use(MockGISNQuery())
+    yield use
+    app_state.set_services(*previous)
+
+
+def test_get_redirects_to_canonical_url(use_gisn):
+    response = Client().get(
+        "/api/analyze/", {"radius": "100", "houseNumber": "050",
+                          "street": "דיזנגוף"},
+    )
+
+    assert response.status_code == 301
+    assert response["Location"] == CANONICAL
+    assert "max-age" in response["Cache-Control"]
+
+
+def test_get_defaults_radius_in_canonical_url(use_gisn):
+    response = Client().get(
+        "/api/analyze/", {"street": "דיזנגוף", "houseNumber": 50}
+    )
+
+    assert response["Location"] == CANONICAL
+
+
+def test_get_matches_post(use_gisn, settings):
+    settings.ANALYZE_CACHE_MAX_AGE = 60
+    client = Client()
+
+    response = client.get(CANONICAL)
+    posted = client.post(
+        "/api/analyze/",
+        data={"street": "דיזנגוף", "houseNumber": 50},
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert response.json() == posted.json()
+    assert response["Cache-Control"] == "public, max-age=60"
+    assert response["Vary"] == "Accept-Encoding"
+    assert response["ETag"].startswith('"')
+    assert "ETag" not in posted
+
+
+def test_get_etag_is_deterministic(use_gisn):
+    client = Client()
+
+    assert client.get(CANONICAL)["ETag"] == client.get(CANONICAL)["ETag"]
+
+
+def test_get_not_modified(use_gisn):
+    client = Client()
+    etag = client.get(CANONICAL)["ETag"]
+
+    response = client.get(CANONICAL, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response["ETag"] == etag
+    assert client.get(
+        CANONICAL, headers={"If-None-Match": '"other"'}
+    ).status_code == 200
+
+
+def test_get_validation_errors(use_gisn):
+    response = Client().get("/api/analyze/", {"street": "דיזנגוף"})
+
+    assert response.status_code == 400
+    assert "Cache-Control" not in response
+
+
+def test_get_stale_result_must_be_revalidated(use_gisn):
+    use_gisn(CachedGISNQuery(
+        MockGISNQuery(), GISNResultCache(ttl=0.05, stale_ttl=60)
+    ))
+    client = Client()
+    client.get(CANONICAL)
+    time.sleep(0.06)
+
+    response = client.get(CANONICAL)
+
+    assert response.status_code == 200
+    assert response["Warning"] == '110 - "Response is Stale"'
+    assert response["Cache-Control"] == "no-cache"
+
+
+def test_analyze_rejects_other_methods(use_gisn):
+    assert Client().put("/api/analyze/").status_code == 405
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+import respx
+
+from api import app_state
+from api.services import (
+    MockGISNQuery,
+    MockNominativeQuery,
+    handle_address,
+    handle_address_async,
+)
+from api.services.base import DataRetrievalError
+from api.services.real import RealGISNQuery, RealNominativeQuery
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+GISN_QUERY_URL = ("https://gisn.tel-aviv.gov.il/arcgis/rest/services/"
+                  "WM/IView2WM/MapServer/772/query")
+
+
+@pytest.fixture
+def mock_services():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+    app_state.set_services(MockNominativeQuery(), MockGISNQuery())
+    yield
+    app_state.set_services(*previous)
+
+
+@respx.mock
+def test_nominative_fetch_data_async_success():
+    respx.get(NOMINATIM_URL).mock(
+        return_value=httpx.Response(
+            200, json=[{"lat": "32.0698820", "lon": "34.7735910"}]
+        )
+    )
+
+    result = asyncio.run(RealNominativeQuery().fetch_data_async("Herzl", 10))
+
+    assert result == (34.7735910, 32.0698820)
+
+
+@respx.mock
+def test_nominative_fetch_data_async_http_error():
+    respx.get(NOMINATIM_URL).mock(
+        return_value=httpx.Response(503, text="Service Unavailable")
+    )
+
+    with pytest.raises(DataRetrievalError) as exc_info:
+        asyncio.run(RealNominativeQuery().fetch_data_async("Herzl", 10))
+
+    assert exc_info.value.status_code == 503
+
+
+@respx.mock
+def test_gisn_fetch_data_async_success():
+    features = [{"attributes": {"building_stage": "בבניה"}}]
+    respx.get(GISN_QUERY_URL).mock(
+        return_value=httpx.Response(200, json={"features": features})
+    )
+
+    result = asyncio.run(
+        RealGISNQuery().fetch_data_async((34.77, 32.06), 100)
+    )
+
+    assert result == features
+
+
+@respx.mock
+def test_gisn_fetch_data_async_request_error():
+    respx.get(GISN_QUERY_URL).mock(side_effect=httpx.RequestError("Timeout"))
+
+    with pytest.raises(Exception, match="GISN API request failed: Timeout"):
+        asyncio.run(RealGISNQuery().fetch_data_async((34.77, 32.06), 100))
+
+
+def test_async_requests_overlap():
+    """Concurrent analyses share one worker instead of queueing"""
+    async def slow_upstream(request):
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={"features": []})
+
+    query = RealGISNQuery(
+        async_client=httpx.AsyncClient(
+            transport=httpx.MockTransport(slow_upstream)
+        )
+    )
+
+    async def run_many():
+        await asyncio.gather(*(
+            query.fetch_data_async((34.77, 32.06), 100) for _ in range(50)
+        ))
+
+    start = time.perf_counter()
+    asyncio.run(run_many())
+    assert time.perf_counter() - start < 2
+
+
+def test_handle_address_async_matches_sync(mock_services):
+    expected = handle_address("שדרות רוטשילד", 12, 100)
+
+    result = asyncio.run(handle_address_async("שדרות רוטשילד", 12, 100))
+
+    assert result == expected
+    assert len(result) == 1
+
+
+def test_analyze_view_uses_async_pipeline(client, mock_services):
+    response = client.post(
+        "/api/analyze/",
+        data=json.dumps(
+            {"street": "שדרות רוטשילד", "houseNumber": "12", "radius": 100}
+        ),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert response.json()[0]["attributes"]["building_stage"] == "בבניה"
+
+
+def test_analyze_view_validation(client, mock_services):
+    response = client.post(
+        "/api/analyze/",
+        data=json.dumps({"street": "הרצל", "houseNumber": "abc"}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from api import app_state
+from api.services import MockGISNQuery, MockNominativeQuery
+from api.services.base import (
+    BaseGISNQuery,
+    BaseNominativeQuery,
+    DataRetrievalError,
+)
+from api.services.batch import analyze_batch_async
+from api.services.ratelimit import IntervalRateLimiter
+from api.services.replica import GISNLayerReplica
+from api.services.risk_table import RiskTable
+from api.services.spatial import meters_to_degrees
+
+CENTER = (34.7735910, 32.0698820)
+
+
+def offset(east_meters):
+    lon_step, _ = meters_to_degrees(1, CENTER[1])
+    return (CENTER[0] + east_meters * lon_step, CENTER[1])
+
+
+def parcel(object_id, east_meters):
+    (x0, _), (x1, _) = offset(east_meters), offset(east_meters + 10)
+    _, lat_step = meters_to_degrees(1, CENTER[1])
+    y0, y1 = CENTER[1] - 5 * lat_step, CENTER[1] + 5 * lat_step
+    return {
+        "attributes": {"OBJECTID": object_id, "building_stage": "בבניה"},
+        "geometry": {
+            "rings": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]
+        },
+    }
+
+
+class StreetNumberNominativeQuery(BaseNominativeQuery):
+    """Places house number N at N meters east of CENTER."""
+
+    def __init__(self):
+        self.calls = []
+
+    def fetch_data(self, street, house_number):
+        self.calls.append((street, house_number))
+        if street == "Unknown":
+            raise DataRetrievalError("could not locate address", 500)
+        return offset(house_number)
+
+
+class LayerGISNQuery(BaseGISNQuery):
+    def __init__(self):
+        self.layer = GISNLayerReplica(
+            [parcel(i, east) for i, east in enumerate((0, 30, 60, 2000))]
+        )
+        self.calls = []
+
+    def fetch_data(self, coordinate, radius):
+        self.calls.append((coordinate, radius))
+        return self.layer.query_radius(coordinate, radius)
+
+
+@pytest.fixture
+def services():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+    nominative, gisn = StreetNumberNominativeQuery(), LayerGISNQuery()
+    app_state.set_services(nominative, gisn)
+    yield nominative, gisn
+    app_state.set_services(*previous)
+
+
+def ids(result):
+    return [place["attributes"]["OBJECTID"] for place in result["result"]]
+
+
+def test_duplicate_addresses_geocoded_once(services):
+    nominative, _ = services
+    items = [("הרצל", 1, 10), (" הרצל", 1, 20), ("הרצל", 1, 30)]
+
+    results = asyncio.run(analyze_batch_async(items))
+
+    assert len(nominative.calls) == 1
+    assert [ids(result) for result in results] == [[0], [0], [0, 1]]
+
+
+def test_nearby_addresses_share_gisn_query(services):
+    _, gisn = services
+    items = [("הרצל", 1, 10), ("הרצל", 35, 10), ("הרצל", 60, 5)]
+
+    results = asyncio.run(analyze_batch_async(items, cluster_size=1000))
+
+    assert len(gisn.calls) == 1
+    assert [ids(result) for result in results] == [[0], [1], [2]]
+
+
+def test_distant_addresses_query_separately(services):
+    _, gisn = services
+    items = [("הרצל", 0, 10), ("הרצל", 2000, 10)]
+
+    results = asyncio.run(analyze_batch_async(items, cluster_size=250))
+
+    assert len(gisn.calls) == 2
+    assert [ids(result) for result in results] == [[0], [3]]
+
+
+def test_per_item_errors(services):
+    items = [("Unknown", 1, 100), ("הרצל", 1, 10)]
+
+    results = asyncio.run(analyze_batch_async(items))
+
+    assert results[0] == {
+        "error": "Service error: could not locate address", "status": 500,
+    }
+    assert ids(results[1]) == [0]
+
+
+def test_precomputed_addresses_skip_upstreams(services, tmp_path):
+    nominative, gisn = services
+    path = tmp_path / "risk.sqlite3"
+    RiskTable.build(path, gisn.layer, {"הרצל|1": offset(1)})
+    previous = app_state.get_risk_table()
+    app_state.set_risk_table(RiskTable(path))
+    try:
+        results = asyncio.run(analyze_batch_async(
+            [("הרצל", 1, 50), ("הרצל", 60, 5)]
+        ))
+    finally:
+        app_state.set_risk_table(previous)
+
+    assert nominative.calls == [("הרצל", 60)]
+    assert gisn.calls == [(offset(60), 5)]
+    assert [ids(result) for result in results] == [[0, 1], [2]]
+
+
+def test_features_without_geometry_are_kept(services):
+    _, gisn = services
+    gisn.layer = GISNLayerReplica([parcel(0, 0), parcel(1, 30)])
+    plain = {"attributes": {"OBJECTID": 9, "building_stage": "בבניה"}}
+    query = gisn.fetch_data
+
+    def fetch_data(coordinate, radius):
+        return [*query(coordinate, radius), plain]
+
+    gisn.fetch_data = fetch_data
+    items = [("הרצל", 1, 10), ("הרצל", 35, 10)]
+
+    results = asyncio.run(analyze_batch_async(items, cluster_size=1000))
+
+    # Like single analyses: one query per address, all features kept
+    assert gisn.calls[1:] == [(offset(1), 10), (offset(35), 10)]
+    assert [ids(result) for result in results] == [[0, 9], [1, 9]]
+
+
+def test_batch_deadline(services):
+    _, gisn = services
+
+    async def fetch_data_async(coordinate, radius):
+        await asyncio.sleep(1)
+        return []
+
+    gisn.fetch_data_async = fetch_data_async
+
+    start = time.monotonic()
+    results = asyncio.run(analyze_batch_async(
+        [("Unknown", 1, 10), ("הרצל", 1, 10)], timeout=0.05
+    ))
+
+    assert time.monotonic() - start < 0.5
+    assert results[0]["status"] == 500
+    assert results[1]["status"] == 504
+
+
+def test_batch_outlasts_single_analysis_deadline(services):
+    nominative, _ = services
+    limiter = IntervalRateLimiter(0.03)
+
+    async def fetch_data_async(street, house_number):
+        await limiter.acquire_async()
+        return nominative.fetch_data(street, house_number)
+
+    nominative.fetch_data_async = fetch_data_async
+    # Ten geocodes at the rate limit take longer than one item's budget
+    items = [("הרצל", number, 10) for number in range(10)]
+
+    start = time.monotonic()
+    results = asyncio.run(analyze_batch_async(
+        items, timeout=5, item_timeout=0.1
+    ))
+
+    assert time.monotonic() - start > 0.2
+    assert all("result" in result for result in results)
+
+
+def test_batch_view(client):
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+    app_state.set_services(MockNominativeQuery(), MockGISNQuery())
+    try:
+        response = client.post(
+            "/api/analyze/batch/",
+            data=json.dumps([
+                {"street": "שדרות רוטשילד", "houseNumber": 12},
+                {"street": "שדרות רוטשילד", "houseNumber": "x"},
+                "not an object",
+            ]),
+            content_type="application/json",
+        )
+    finally:
+        app_state.set_services(*previous)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results[0]["result"]) == 1
+    assert results[1]["status"] == 400
+    assert results[2] == {"error": "Invalid item", "status": 400}
+
+
+def test_batch_view_rejects_non_list(client):
+    response = client.post(
+        "/api/analyze/batch/",
+        data=json.dumps({"street": "הרצל"}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+
+
+def test_interval_rate_limiter_spaces_calls():
+    limiter = IntervalRateLimiter(0.05)
+
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+
+    assert time.monotonic() - start >= 0.15
+    assert limiter.stats()["acquired"] == 4
@@ -0,0 +1,42 @@
+from api.services import risk_assessment
+from benchmarks.analyze import compare, run, synthetic_features
+
+
+def test_synthetic_features_are_half_dangerous():
+    features = synthetic_features(10)
+
+    assert len(features) == 10
+    assert len(risk_assessment(features)) == 5
+    ring = features[0]["geometry"]["rings"][0]
+    assert ring[0] == ring[-1]
+
+
+def test_run_measures_every_stage(monkeypatch):
+    monkeypatch.setattr("benchmarks.analyze.MIN_LOOP_SECONDS", 0.001)
+    results = run([10], repeat=1)
+
+    assert set(results) == {
+        "gisn_json_decode", "risk_assessment", "convert_rings",
+        "json_response",
+    }
+    for by_size in results.values():
+        assert by_size["10"]["seconds"] > 0
+        assert by_size["10"]["peak_bytes"] > 0
+
+
+def test_compare_reports_regressions_beyond_tolerance():
+    baseline = {"risk_assessment": {
+        "10": {"seconds": 1.0, "peak_bytes": 100},
+    }}
+    results = {
+        "risk_assessment": {
+            "10": {"seconds": 1.4, "peak_bytes": 130},
+            "100": {"seconds": 9.0, "peak_bytes": 900},
+        },
+    }
+
+    regressions = compare(results, baseline, 0.5, 0.2)
+
+    assert regressions == [
+        "risk_assessment[10] peak_bytes: 130 > 100 (+20% allowed)",
+    ]
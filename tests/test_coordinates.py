@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import pytest
+from django.test import Client
+
+from api import app_state
+from api.services import (
+    MockGISNQuery,
+    MockNominativeQuery,
+    handle_address,
+    handle_coordinate,
+    handle_coordinate_async,
+    in_tel_aviv,
+    stream_coordinate_async,
+)
+from api.services.base import BaseNominativeQuery
+
+CENTER = (34.773591, 32.069882)
+
+
+class NoGeocoding(BaseNominativeQuery):
+    def fetch_data(self, street, house_number):
+        pytest.fail("coordinate analyses must not be geocoded")
+
+
+@pytest.fixture
+def no_geocoding():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+    app_state.set_services(NoGeocoding(), MockGISNQuery())
+    yield
+    app_state.set_services(*previous)
+
+
+def post(path, payload):
+    return Client().post(
+        path, data=json.dumps(payload), content_type="application/json"
+    )
+
+
+def test_in_tel_aviv():
+    assert in_tel_aviv(CENTER)
+    assert not in_tel_aviv((34.79, 31.25))  # Beersheba latitude
+    assert not in_tel_aviv((32.07, 34.77))  # lat and lon swapped
+    assert not in_tel_aviv((float("nan"), 32.07))
+
+
+def test_handle_coordinate_matches_handle_address(no_geocoding):
+    app_state.set_services(MockNominativeQuery(), MockGISNQuery())
+    coordinate = MockNominativeQuery().fetch_data("רוטשילד", 12)
+    expected = handle_address("רוטשילד", 12, 100)
+
+    assert handle_coordinate(coordinate, 100) == expected
+    assert asyncio.run(handle_coordinate_async(coordinate, 100)) == expected
+
+
+def test_analyze_coordinate_skips_geocoding(no_geocoding):
+    response = post(
+        "/api/analyze/", {"lat": CENTER[1], "lon": CENTER[0], "radius": 50}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == handle_coordinate(CENTER, 50)
+
+
+@pytest.mark.parametrize("payload, error", [
+    ({"lat": 32.07}, "Missing 'lon' field"),
+    ({"lat": "north", "lon": 34.77}, "Invalid 'lat' - must be a number"),
+    ({"lat": 31.25, "lon": 34.79}, "Coordinate is outside Tel Aviv"),
+    ({"lat": 32.07, "lon": 34.77, "radius": "far"},
+     "Invalid 'radius' - must be a number"),
+])
+def test_analyze_coordinate_validation(no_geocoding, payload, error):
+    response = post("/api/analyze/", payload)
+
+    assert response.status_code == 400
+    assert response.json()["error"] == error
+
+
+def test_stream_coordinate(no_geocoding):
+    async def collect():
+        return [
+            event async for event in stream_coordinate_async(CENTER, 100)
+        ]
+
+    events = asyncio.run(collect())
+
+    assert events[0] == {
+        "type": "coordinate", "lon": CENTER[0], "lat": CENTER[1],
+        "radius": 100,
+    }
+    assert events[-1]["type"] == "done"
+
+
+def test_stream_view_accepts_coordinates(no_geocoding):
+    response = post("/api/analyze/stream/", {"lat": 32.07, "lon": 34.77})
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+
+
+def test_get_coordinate_canonical_url(no_geocoding):
+    client = Client()
+
+    redirect = client.get(
+        "/api/analyze/", {"lon": "34.7735910001", "lat": "32.069882"}
+    )
+    assert redirect.status_code == 301
+    assert redirect["Location"] == (
+        "/api/analyze/?lat=32.069882&lon=34.773591&radius=100"
+    )
+
+    response = client.get(redirect["Location"])
+    assert response.status_code == 200
+    assert "ETag" in response
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from django.test import Client
+
+from api import app_state
+from api.services import (
+    CircuitBreaker,
+    DeadlineExceededError,
+    MockNominativeQuery,
+    RealGISNQuery,
+    SharedTokenBucket,
+    deadline,
+    handle_address,
+    handle_address_async,
+)
+from api.services.base import BaseGISNQuery
+from api.services.breaker import CLOSED
+from api.services.deadline import (
+    CONNECT_TIMEOUT,
+    enforce,
+    remaining,
+    upstream_timeout,
+)
+
+
+class SlowGISNQuery(BaseGISNQuery):
+    """Fake upstream that answers after ``delay`` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def fetch_data(self, coordinate, radius):
+        time.sleep(self.delay)
+        return []
+
+    async def fetch_data_async(self, coordinate, radius):
+        await asyncio.sleep(self.delay)
+        return []
+
+
+@pytest.fixture
+def use_gisn():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+
+    def use(gisn):
+        app_state.set_services(MockNominativeQuery(), gisn)
+
+    yield use
+    app_state.set_services(*previous)
+
+
+def analyze(**headers):
+    return Client().post(
+        "/api/analyze/",
+        data=json.dumps({"street": "דיזנגוף", "houseNumber": 50}),
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+def test_nested_deadlines_only_shorten_the_budget():
+    assert remaining() is None
+    with deadline(1):
+        with deadline(10):
+            assert remaining() <= 1
+        with deadline(0.5):
+            assert remaining() <= 0.5
+        with deadline(None):
+            assert 0.5 < remaining() <= 1
+    assert remaining() is None
+
+
+def test_upstream_timeout_follows_the_budget():
+    assert upstream_timeout(5).read == 5
+    with deadline(2):
+        timeout = upstream_timeout(5)
+    assert 1.9 < timeout.read <= 2
+    assert timeout.connect <= CONNECT_TIMEOUT
+
+    with deadline(0), pytest.raises(DeadlineExceededError) as excinfo:
+        upstream_timeout(5)
+    assert excinfo.value.status_code == 504
+
+
+def test_enforce_cancels_at_the_deadline():
+    async def slow():
+        with deadline(0.05):
+            async with enforce():
+                await asyncio.sleep(1)
+
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(slow())
+    assert time.perf_counter() - start < 0.5
+
+
+def test_handle_address_async_gives_up_on_slow_gisn(use_gisn):
+    use_gisn(SlowGISNQuery(1))
+
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(handle_address_async("דיזנגוף", 50, 100, timeout=0.1))
+    assert time.perf_counter() - start < 0.5
+
+
+def test_handle_address_checks_deadline_between_stages(use_gisn):
+    class SlowNominativeQuery(MockNominativeQuery):
+        def fetch_data(self, street, house_number):
+            time.sleep(0.1)
+            return super().fetch_data(street, house_number)
+
+    gisn = SlowGISNQuery(0)
+    gisn.fetch_data = pytest.fail
+    app_state.set_services(SlowNominativeQuery(), gisn)
+
+    with pytest.raises(DeadlineExceededError):
+        handle_address("דיזנגוף", 50, 100, timeout=0.05)
+
+
+def test_analyze_returns_504_past_the_deadline(use_gisn, settings):
+    settings.ANALYZE_TIMEOUT = 0.1
+    use_gisn(SlowGISNQuery(1))
+
+    response = analyze()
+
+    assert response.status_code == 504
+
+
+def test_client_can_only_shorten_the_deadline(use_gisn, settings):
+    settings.ANALYZE_TIMEOUT = 0.3
+    use_gisn(SlowGISNQuery(0.2))
+
+    assert analyze(X_Request_Timeout="60").status_code == 200
+    assert analyze(X_Request_Timeout="0.1").status_code == 504
+    assert analyze(X_Request_Timeout="soon").status_code == 400
+
+
+def test_rate_limit_wait_is_bounded_by_the_deadline(tmp_path):
+    bucket = SharedTokenBucket(tmp_path / "bucket.sqlite3", rate=1)
+    bucket.acquire()
+
+    with deadline(0.1), pytest.raises(DeadlineExceededError):
+        bucket.acquire()
+    assert bucket.stats()["rejected"] == 1
+
+
+def test_deadline_does_not_trip_the_breaker():
+    breaker = CircuitBreaker("gisn", failure_threshold=1)
+
+    with pytest.raises(DeadlineExceededError), breaker.call():
+        raise DeadlineExceededError()
+
+    assert breaker.state == CLOSED
+
+
+def test_timeout_past_the_deadline_is_reported_as_504():
+    def timeout(request):
+        time.sleep(request.extensions["timeout"]["read"])
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    service = RealGISNQuery(
+        client=httpx.Client(transport=httpx.MockTransport(timeout))
+    )
+    with deadline(0.05), pytest.raises(DeadlineExceededError) as excinfo:
+        service.fetch_data((34.77, 32.07), 100)
+    assert "deadline" in excinfo.value.message
@@ -0,0 +1,157 @@
+import time
+
+import pytest
+
+from api.services.base import (
+    BaseNominativeQuery,
+    DataRetrievalError,
+    UpstreamError,
+    track_staleness,
+)
+from api.services.geocode_cache import (
+    CachedNominativeQuery,
+    GeocodeCache,
+    normalize_address,
+    normalize_street,
+)
+
+
+class CountingNominativeQuery(BaseNominativeQuery):
+    """Fake geocoder that records every upstream call."""
+
+    def __init__(self, coordinate=(34.7735910, 32.0698820)):
+        self.coordinate = coordinate
+        self.calls = []
+
+    def fetch_data(self, street, house_number):
+        self.calls.append((street, house_number))
+        return self.coordinate
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeocodeCache(tmp_path / "geocode.sqlite3", ttl=60, max_entries=3)
+
+
+@pytest.mark.parametrize("variant", [
+    "שדרות רוטשילד",
+    "  שדרות   רוטשילד ",
+    "שְׂדֵרוֹת רוֹטשִׁילְד",
+    "שדרות רוטשילד",
+    "\u200fשדרות רוטשילד\u200f",
+    "שדרות-רוטשילד",
+    "שדרות־רוטשילד",
+    "שדרות, רוטשילד.",
+])
+def test_normalize_street_variants(variant):
+    """Whitespace, niqqud and punctuation variants share one key"""
+    assert normalize_street(variant) == "שדרות רוטשילד"
+
+
+def test_normalize_street_drops_geresh():
+    assert normalize_street("ז'בוטינסקי") == normalize_street("ז׳בוטינסקי")
+    assert normalize_street("ז׳בוטינסקי") == "זבוטינסקי"
+
+
+def test_normalize_address_includes_house_number():
+    assert normalize_address("הרצל", 5) != normalize_address("הרצל", 7)
+    assert normalize_address(" הרצל", 5) == normalize_address("הרצל ", 5)
+
+
+def test_cache_hit_skips_upstream(cache):
+    inner = CountingNominativeQuery()
+    service = CachedNominativeQuery(inner, cache)
+
+    first = service.fetch_data("שדרות רוטשילד", 12)
+    second = service.fetch_data("שְׂדֵרוֹת  רוטשילד", 12)
+
+    assert first == second == (34.7735910, 32.0698820)
+    assert len(inner.calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_is_shared_between_instances(tmp_path):
+    path = tmp_path / "geocode.sqlite3"
+    GeocodeCache(path).set("הרצל|5", (34.1, 32.1))
+
+    assert GeocodeCache(path).get("הרצל|5") == (34.1, 32.1)
+
+
+def test_cache_expires_entries(cache):
+    cache.set("הרצל|5", (34.1, 32.1))
+    cache.ttl = 0
+    time.sleep(0.01)
+
+    assert cache.get("הרצל|5") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_evicts_least_recently_used(cache, monkeypatch):
+    monkeypatch.setattr(GeocodeCache, "EVICTION_CHECK_INTERVAL", 1)
+    for number in range(3):
+        cache.set(f"הרצל|{number}", (34.0, 32.0 + number))
+    cache.get("הרצל|0")
+    cache.set("הרצל|3", (34.0, 32.3))
+
+    assert cache.stats()["size"] == 3
+    assert cache.get("הרצל|0") is not None
+    assert cache.get("הרצל|1") is None
+
+
+def test_cache_checks_size_periodically(cache, monkeypatch):
+    monkeypatch.setattr(GeocodeCache, "EVICTION_CHECK_INTERVAL", 5)
+    for number in range(4):
+        cache.set(f"הרצל|{number}", (34.0, 32.0 + number))
+
+    assert cache.stats()["size"] == 4
+    cache.set("הרצל|4", (34.0, 32.4))
+    assert cache.stats()["size"] == 3
+
+
+def test_refresh_keeps_hit_count(cache):
+    cache.set("הרצל|1", (34.0, 32.1))
+    cache.set("הרצל|2", (34.0, 32.2))
+    cache.get("הרצל|1")
+    cache.get("הרצל|1")
+    cache.get("הרצל|2")
+
+    cache.set("הרצל|1", (34.0, 32.15))
+
+    assert cache.popular(2) == [
+        ("הרצל|1", (34.0, 32.15)), ("הרצל|2", (34.0, 32.2)),
+    ]
+
+
+def test_cache_does_not_store_failures(cache):
+    class FailingNominativeQuery(BaseNominativeQuery):
+        def fetch_data(self, street, house_number):
+            raise DataRetrievalError("could not locate address", 500)
+
+    service = CachedNominativeQuery(FailingNominativeQuery(), cache)
+
+    with pytest.raises(DataRetrievalError):
+        service.fetch_data("FakeStreet", 1)
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_serves_stale_entry_when_upstream_fails(tmp_path):
+    class FailingNominativeQuery(BaseNominativeQuery):
+        def fetch_data(self, street, house_number):
+            raise UpstreamError("Nominatim request failed", 500)
+
+    cache = GeocodeCache(tmp_path / "geocode.sqlite3", ttl=0, stale_ttl=60)
+    cache.set(normalize_address("הרצל", 5), (34.1, 32.1))
+    time.sleep(0.01)
+    service = CachedNominativeQuery(FailingNominativeQuery(), cache)
+
+    with track_staleness() as staleness:
+        assert service.fetch_data("הרצל", 5) == (34.1, 32.1)
+
+    assert staleness["stale"] is True
+    assert cache.stats()["stale_hits"] == 1
+    with pytest.raises(UpstreamError):
+        service.fetch_data("הרצל", 7)
+    cache.stale_ttl = 0
+    with pytest.raises(UpstreamError):
+        service.fetch_data("הרצל", 5)
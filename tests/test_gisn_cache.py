@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from api.services.base import BaseGISNQuery
+from api.services.gisn_cache import CachedGISNQuery, GISNResultCache
+from api.services.replica import GISNLayerReplica
+from api.services.spatial import meters_to_degrees
+
+CENTER = (34.7735910, 32.0698820)
+
+
+def offset(coordinate, east_meters=0, north_meters=0):
+    lon_step, lat_step = meters_to_degrees(1, coordinate[1])
+    return (
+        coordinate[0] + east_meters * lon_step,
+        coordinate[1] + north_meters * lat_step,
+    )
+
+
+def parcel(object_id, east_meters):
+    """10 m square parcel whose west edge is ``east_meters`` from CENTER."""
+    x0, y0 = offset(CENTER, east_meters, -5)
+    x1, y1 = offset(CENTER, east_meters + 10, 5)
+    return {
+        "attributes": {"OBJECTID": object_id, "building_stage": "בבניה"},
+        "geometry": {
+            "rings": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]
+        },
+    }
+
+
+class LayerGISNQuery(BaseGISNQuery):
+    """Fake upstream answering from a fixed layer and counting calls."""
+
+    def __init__(self):
+        self.layer = GISNLayerReplica(
+            [parcel(i, east) for i, east in enumerate((-5, 40, 90, 300))]
+        )
+        self.calls = []
+
+    def fetch_data(self, coordinate, radius):
+        self.calls.append((coordinate, radius))
+        return self.layer.query_radius(coordinate, radius)
+
+
+def ids(features):
+    return [feature["attributes"]["OBJECTID"] for feature in features]
+
+
+@pytest.fixture
+def upstream():
+    return LayerGISNQuery()
+
+
+@pytest.fixture
+def service(upstream):
+    return CachedGISNQuery(upstream, GISNResultCache(cell_size=100))
+
+
+def test_repeat_query_hits_cache(service, upstream):
+    first = service.fetch_data(CENTER, 100)
+    second = service.fetch_data(CENTER, 100)
+
+    assert ids(first) == ids(second) == ids(upstream.layer.query_radius(
+        CENTER, 100
+    ))
+    assert len(upstream.calls) == 1
+    assert service.stats()["gisn_cache"]["hits"] == 1
+
+
+def test_smaller_radius_nearby_is_filtered_from_superset(service, upstream):
+    service.fetch_data(CENTER, 100)
+    nearby = offset(CENTER, east_meters=20)
+
+    result = service.fetch_data(nearby, 30)
+
+    assert len(upstream.calls) == 1
+    assert ids(result) == ids(upstream.layer.query_radius(nearby, 30))
+
+
+def test_larger_bucket_refetches(service, upstream):
+    service.fetch_data(CENTER, 100)
+    result = service.fetch_data(CENTER, 400)
+
+    assert len(upstream.calls) == 2
+    assert ids(result) == [0, 1, 2, 3]
+
+
+def test_radius_above_buckets_bypasses_cache(upstream):
+    service = CachedGISNQuery(
+        upstream, GISNResultCache(radius_buckets=(100,))
+    )
+
+    service.fetch_data(CENTER, 500)
+    service.fetch_data(CENTER, 500)
+
+    assert upstream.calls == [(CENTER, 500), (CENTER, 500)]
+
+
+def test_entries_expire(upstream):
+    service = CachedGISNQuery(upstream, GISNResultCache(ttl=0))
+
+    service.fetch_data(CENTER, 100)
+    service.fetch_data(CENTER, 100)
+
+    assert len(upstream.calls) == 2
+
+
+def test_entry_and_byte_bounds(upstream):
+    cache = GISNResultCache(max_entries=2)
+    service = CachedGISNQuery(upstream, cache)
+
+    for north in (0, 1000, 2000):
+        service.fetch_data(offset(CENTER, north_meters=north), 100)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get(CENTER, 100) is None
+
+
+def test_byte_bound_evicts_oldest():
+    entry = [parcel(1, 0)]
+    cache = GISNResultCache()
+    cache.set(CENTER, 100, entry)
+    cache.max_bytes = cache.stats()["bytes"] * 3 // 2
+
+    cache.set(offset(CENTER, north_meters=1000), 100, entry)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.get(CENTER, 10) is None
+
+
+def test_async_path_shares_cache(service, upstream):
+    asyncio.run(service.fetch_data_async(CENTER, 100))
+    result = asyncio.run(service.fetch_data_async(CENTER, 50))
+
+    assert len(upstream.calls) == 1
+    assert ids(result) == ids(upstream.layer.query_radius(CENTER, 50))
@@ -0,0 +1,148 @@
+import httpx
+import pytest
+import respx
+from django.core.management import call_command
+
+from api.services.base import BaseGISNQuery, DataRetrievalError
+from api.services.real import RealGISNQuery
+from api.services.replica import GISNLayerReplica, ReplicaGISNQuery
+from api.services.spatial import (
+    GridIndex,
+    meters_to_degrees,
+    polygon_distance_meters,
+)
+
+GISN_LAYER_URL = ("https://gisn.tel-aviv.gov.il/arcgis/rest/services/"
+                  "WM/IView2WM/MapServer/772")
+CENTER = (34.7735910, 32.0698820)
+
+
+def square(center, east_meters, size_meters=10):
+    """Closed square ring whose west edge is ``east_meters`` from center."""
+    lon_step, lat_step = meters_to_degrees(1, center[1])
+    x0 = center[0] + east_meters * lon_step
+    x1 = x0 + size_meters * lon_step
+    y0 = center[1] - size_meters / 2 * lat_step
+    y1 = center[1] + size_meters / 2 * lat_step
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def parcel(object_id, east_meters, stage="בבניה"):
+    return {
+        "attributes": {
+            "OBJECTID": object_id,
+            "addresses": f"הרצל {object_id}",
+            "building_stage": stage,
+            "sw_tama_38": "לא",
+        },
+        "geometry": {"rings": [square(CENTER, east_meters)]},
+    }
+
+
+@pytest.fixture
+def replica():
+    return GISNLayerReplica(
+        [parcel(1, -5), parcel(2, 50), parcel(3, 150), parcel(4, 400)]
+    )
+
+
+def test_polygon_distance_inside_is_zero():
+    assert polygon_distance_meters(CENTER, [square(CENTER, -5)]) == 0
+
+
+def test_polygon_distance_outside():
+    distance = polygon_distance_meters(CENTER, [square(CENTER, 50)])
+    assert distance == pytest.approx(50, abs=0.5)
+
+
+def test_grid_index_query():
+    index = GridIndex(cell_size=1)
+    index.insert("a", (0.1, 0.1, 0.2, 0.2))
+    index.insert("b", (1.5, 1.5, 2.5, 2.5))
+
+    assert index.query((0, 0, 0.15, 0.15)) == ["a"]
+    assert sorted(index.query((0, 0, 3, 3))) == ["a", "b"]
+    assert index.query((0.3, 0.3, 0.4, 0.4)) == []
+
+
+@pytest.mark.parametrize(("radius", "expected"), [
+    (0, [1]),
+    (49, [1]),
+    (51, [1, 2]),
+    (200, [1, 2, 3]),
+    (1000, [1, 2, 3, 4]),
+])
+def test_query_radius(replica, radius, expected):
+    result = replica.query_radius(CENTER, radius)
+    assert [f["attributes"]["OBJECTID"] for f in result] == expected
+
+
+def test_save_and_load(replica, tmp_path):
+    path = tmp_path / "layer.json"
+    replica.save(path)
+
+    loaded = GISNLayerReplica.load(path)
+
+    assert len(loaded) == 4
+    assert loaded.query_radius(CENTER, 51) == replica.query_radius(CENTER, 51)
+
+
+def test_replica_service_reads_file(replica, tmp_path):
+    path = tmp_path / "layer.json"
+    replica.save(path)
+
+    result = ReplicaGISNQuery(path).fetch_data(CENTER, 51)
+
+    assert len(result) == 2
+
+
+def test_replica_service_falls_back_without_file(tmp_path):
+    class LiveGISNQuery(BaseGISNQuery):
+        def fetch_data(self, coordinate, radius):
+            return ["live"]
+
+    service = ReplicaGISNQuery(tmp_path / "missing.json", LiveGISNQuery())
+
+    assert service.fetch_data(CENTER, 100) == ["live"]
+    assert service.stats()["gisn_replica"]["loaded"] is False
+
+
+def test_replica_service_without_fallback(tmp_path):
+    service = ReplicaGISNQuery(tmp_path / "missing.json")
+
+    with pytest.raises(DataRetrievalError) as exc_info:
+        service.fetch_data(CENTER, 100)
+    assert exc_info.value.status_code == 503
+
+
+def paged_layer(request):
+    offset = int(request.url.params["resultOffset"])
+    count = int(request.url.params["resultRecordCount"])
+    features = [parcel(i, 10 * i) for i in range(5)][offset:offset + count]
+    return httpx.Response(200, json={
+        "features": features,
+        "exceededTransferLimit": offset + count < 5,
+    })
+
+
+@respx.mock
+def test_fetch_layer_pages_through_layer():
+    route = respx.get(f"{GISN_LAYER_URL}/query").mock(side_effect=paged_layer)
+
+    features = list(RealGISNQuery().fetch_layer("OBJECTID", page_size=2))
+
+    assert [f["attributes"]["OBJECTID"] for f in features] == [0, 1, 2, 3, 4]
+    assert route.call_count == 3
+
+
+@respx.mock
+def test_sync_gisn_layer_command(tmp_path):
+    respx.get(GISN_LAYER_URL).mock(return_value=httpx.Response(200, json={
+        "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+    }))
+    respx.get(f"{GISN_LAYER_URL}/query").mock(side_effect=paged_layer)
+    path = tmp_path / "layer.json"
+
+    call_command("sync_gisn_layer", "--page-size", "2", "--output", str(path))
+
+    assert len(GISNLayerReplica.load(path)) == 5
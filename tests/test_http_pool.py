@@ -0,0 +1,131 @@
+import asyncio
+
+import httpx
+import respx
+
+from api.services.http import (
+    LoopLocalAsyncClient,
+    pool_stats,
+    upstream_client_options,
+)
+from api.services.real import RealGISNQuery, RealNominativeQuery
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+
+def test_upstream_client_options_from_settings(settings):
+    settings.GISN_MAX_CONNECTIONS = 7
+    settings.HTTP_MAX_KEEPALIVE_CONNECTIONS = 3
+    settings.HTTP_KEEPALIVE_EXPIRY = 12.5
+    settings.GISN_HTTP2 = False
+
+    options = upstream_client_options("gisn")
+
+    assert options["limits"] == httpx.Limits(
+        max_connections=7,
+        max_keepalive_connections=3,
+        keepalive_expiry=12.5,
+    )
+    assert options["http2"] is False
+
+
+def test_keepalive_connections_capped_by_max_connections(settings):
+    settings.NOMINATIM_MAX_CONNECTIONS = 2
+    settings.HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+
+    options = upstream_client_options("nominatim")
+
+    assert options["limits"].max_keepalive_connections == 2
+
+
+@respx.mock
+def test_service_reuses_its_client():
+    """Every request goes through the same long-lived client"""
+    route = respx.get(NOMINATIM_URL).mock(
+        return_value=httpx.Response(
+            200, json=[{"lat": "32.06", "lon": "34.77"}]
+        )
+    )
+    client = httpx.Client()
+    query = RealNominativeQuery(client=client)
+
+    query.fetch_data("Herzl", 1)
+    query.fetch_data("Herzl", 2)
+
+    assert query.client is client
+    assert route.call_count == 2
+
+
+def test_pool_stats_and_close():
+    query = RealGISNQuery(client=httpx.Client(
+        limits=httpx.Limits(max_connections=5, max_keepalive_connections=2)
+    ))
+
+    stats = query.stats()["gisn_pool"]
+    assert stats["connections"] == 0
+    assert stats["max_connections"] == 5
+    assert stats["max_keepalive_connections"] == 2
+
+    query.close()
+    assert query.client.is_closed
+
+
+def test_pool_stats_without_transport_pool():
+    client = httpx.Client(transport=httpx.MockTransport(httpx.Response))
+
+    assert pool_stats(client) == {
+        "connections": 0, "active": 0, "idle": 0, "http2": 0,
+    }
+
+
+def test_pool_stats_with_unknown_pool_layout():
+    class Pool:
+        def __init__(self):
+            self.connections = [object()]
+
+    client = httpx.Client()
+    client._transport._pool = Pool()
+
+    assert pool_stats(client) == {
+        "connections": 0, "active": 0, "idle": 0, "http2": 0,
+    }
+
+
+def test_async_clients_close_with_their_loop():
+    clients = LoopLocalAsyncClient("gisn")
+
+    async def use():
+        return clients.get()
+
+    client = asyncio.run(use())
+
+    assert client.is_closed
+    assert clients.stats()["clients"] == 0
+
+
+def test_async_clients_aclose():
+    clients = LoopLocalAsyncClient("gisn")
+
+    async def use():
+        client = clients.get()
+        await clients.aclose()
+        assert client.is_closed
+        return clients.get()
+
+    assert asyncio.run(use()) is not None
+
+
+def test_service_close_closes_async_clients():
+    query = RealGISNQuery(client=httpx.Client())
+    loop = asyncio.new_event_loop()
+
+    async def use():
+        return query.async_clients.get()
+
+    client = loop.run_until_complete(use())
+    query.close()
+    loop.run_until_complete(asyncio.sleep(0.01))
+    loop.close()
+
+    assert client.is_closed
+    assert query.async_clients.stats()["clients"] == 0
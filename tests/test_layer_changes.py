@@ -0,0 +1,374 @@
+import threading
+import time
+
+import httpx
+import respx
+from django.apps import apps
+from django.core.management import call_command
+
+from api.services import (
+    CachedGISNQuery,
+    CachedTileGISNQuery,
+    GISNLayerReplica,
+    GISNResultCache,
+    LayerChangeDetector,
+    LayerChangePoller,
+    RealGISNQuery,
+    ReplicaGISNQuery,
+    TileCache,
+)
+from api.services.base import BaseGISNQuery
+from api.services.deadline import deadline
+from api.services.layer_changes import edited_since
+from api.services.real import GISN_LAYER_URL
+from api.services.spatial import GridIndex, meters_to_degrees, rings_envelope
+
+CENTER = (34.7735910, 32.0698820)
+EDITED_AT = 1_700_000_000_000
+
+
+def parcel(object_id, east_meters, stage="בבניה"):
+    lon_step, lat_step = meters_to_degrees(1, CENTER[1])
+    x0 = CENTER[0] + east_meters * lon_step
+    x1 = x0 + 10 * lon_step
+    y0 = CENTER[1] - 5 * lat_step
+    y1 = CENTER[1] + 5 * lat_step
+    return {
+        "attributes": {
+            "OBJECTID": object_id, "addresses": f"הרצל {object_id}",
+            "building_stage": stage, "sw_tama_38": "לא",
+        },
+        "geometry": {"rings": [
+            [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]],
+        ]},
+    }
+
+
+class FakeLayer:
+    """In-memory stand-in for the RealGISNQuery layer methods."""
+
+    def __init__(self, features, edited_at=EDITED_AT, edit_field="edited"):
+        self.features = {f["attributes"]["OBJECTID"]: f for f in features}
+        self.edited_at = edited_at
+        self.edit_field = edit_field
+        self.edited = set()
+        self.wheres = []
+
+    def edit(self, feature):
+        object_id = feature["attributes"]["OBJECTID"]
+        self.features[object_id] = feature
+        self.edited.add(object_id)
+        self.edited_at += 1000
+
+    def delete(self, object_id):
+        del self.features[object_id]
+        self.edited.discard(object_id)
+        self.edited_at += 1000
+
+    def fetch_layer_metadata(self):
+        metadata = {
+            "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+            "editingInfo": {"lastEditDate": self.edited_at},
+        }
+        if self.edit_field:
+            metadata["editFieldsInfo"] = {"editDateField": self.edit_field}
+        return metadata
+
+    def fetch_object_ids(self, object_id_field, where="1=1"):
+        self.wheres.append(where)
+        if where == "1=1":
+            return sorted(self.features)
+        return sorted(self.edited)
+
+    def fetch_features(self, object_id_field, object_ids):
+        return [self.features[object_id] for object_id in object_ids]
+
+    def fetch_layer(self, object_id_field, page_size=1000):
+        return list(self.features.values())
+
+
+class RecordingGISNQuery(BaseGISNQuery):
+    def __init__(self):
+        self.invalidated = []
+
+    def fetch_data(self, coordinate, radius):
+        return []
+
+    def invalidate(self, envelopes=None):
+        self.invalidated.append(envelopes)
+
+
+def test_grid_index_remove_and_move():
+    index = GridIndex(cell_size=1)
+    index.insert("a", (0.1, 0.1, 0.2, 0.2))
+    index.insert("a", (5.1, 5.1, 5.2, 5.2))
+
+    assert index.query((0, 0, 1, 1)) == []
+    assert index.query((5, 5, 6, 6)) == ["a"]
+    assert index.remove("a")
+    assert not index.remove("a")
+    assert index.query((5, 5, 6, 6)) == []
+    assert len(index) == 0
+
+
+def test_edited_since():
+    assert edited_since("last_edited_date", EDITED_AT) == (
+        "last_edited_date >= timestamp '2023-11-14 22:13:20'"
+    )
+
+
+def test_detector_reports_edited_parcels():
+    layer = FakeLayer([parcel(1, 0), parcel(2, 100)])
+    detector = LayerChangeDetector(layer)
+
+    assert detector.poll() == []
+    assert detector.poll() == []
+    layer.edit(parcel(2, 100, stage="קיים היתר"))
+    layer.edit(parcel(3, 300))
+
+    assert detector.poll() == [
+        rings_envelope(parcel(2, 100)["geometry"]["rings"]),
+        rings_envelope(parcel(3, 300)["geometry"]["rings"]),
+    ]
+    assert layer.wheres[-1].startswith("edited >= timestamp")
+
+
+def test_detector_cannot_locate_deletions():
+    layer = FakeLayer([parcel(1, 0), parcel(2, 100)])
+    detector = LayerChangeDetector(layer)
+    detector.poll()
+
+    layer.delete(2)
+
+    assert detector.poll() is None
+
+
+def test_detector_without_edit_times():
+    layer = FakeLayer([parcel(1, 0)], edit_field=None)
+    detector = LayerChangeDetector(layer)
+    detector.poll()
+    layer.edit(parcel(1, 0, stage="קיים היתר"))
+
+    assert detector.poll() is None
+
+
+def test_detector_without_edit_info():
+    layer = FakeLayer([parcel(1, 0)], edited_at=None)
+    detector = LayerChangeDetector(layer)
+
+    assert detector.poll() == []
+    assert detector.supported is False
+
+
+def test_poller_invalidates_service():
+    layer = FakeLayer([parcel(1, 0)])
+    service, risk_table = RecordingGISNQuery(), RecordingGISNQuery()
+    poller = LayerChangePoller(
+        LayerChangeDetector(layer), service, 60, risk_table=risk_table
+    )
+    poller.poll_once()
+    layer.edit(parcel(1, 0, stage="קיים היתר"))
+
+    poller.poll_once()
+    layer.delete(1)
+    poller.poll_once()
+
+    assert service.invalidated == [
+        [rings_envelope(parcel(1, 0)["geometry"]["rings"])], None,
+    ]
+    assert risk_table.invalidated == service.invalidated
+    assert poller.stats()["invalidations"] == 1
+    assert poller.stats()["full_invalidations"] == 1
+
+
+def test_poller_refreshes_replica(tmp_path):
+    layer = FakeLayer([parcel(1, 0), parcel(2, 100)])
+    path = tmp_path / "layer.json"
+    GISNLayerReplica.sync(layer).save(path)
+    replica = ReplicaGISNQuery(path, fallback=RecordingGISNQuery())
+    poller = LayerChangePoller(
+        LayerChangeDetector(layer), replica, 60, replica=replica
+    )
+    poller.poll_once()
+    before = replica.replica
+    layer.edit(parcel(1, 400))
+
+    poller.poll_once()
+
+    assert replica.replica is not before
+    assert sorted(before.features) == [1, 2]
+    assert [
+        f["attributes"]["OBJECTID"] for f in replica.fetch_data(CENTER, 150)
+    ] == [2]
+    assert poller.stats()["replica_updates"] == 1
+    assert replica.replica.edited_at == layer.edited_at
+
+
+def test_replica_refresh_without_feature_changes_moves_edit_time(tmp_path):
+    layer = FakeLayer([parcel(1, 0)])
+    path = tmp_path / "layer.json"
+    GISNLayerReplica.sync(layer).save(path)
+    replica = ReplicaGISNQuery(path)
+    replica.fetch_data(CENTER, 10)
+    # An edit that lists no features, e.g. one undone before the poll
+    layer.edited_at += 1000
+
+    assert replica.refresh(layer) == 0
+    assert replica.replica.edited_at == layer.edited_at
+    wheres = len(layer.wheres)
+    assert replica.refresh(layer, edited_at=layer.edited_at) == 0
+    assert len(layer.wheres) == wheres
+
+
+def test_poller_start_does_not_block():
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowLayer(FakeLayer):
+        def fetch_layer_metadata(self):
+            started.set()
+            release.wait(1)
+            return super().fetch_layer_metadata()
+
+    poller = LayerChangePoller(
+        LayerChangeDetector(SlowLayer([parcel(1, 0)])),
+        RecordingGISNQuery(), 60,
+    )
+
+    start = time.monotonic()
+    poller.start()
+
+    assert time.monotonic() - start < 0.5
+    assert started.wait(1)
+    release.set()
+
+
+def test_poller_survives_failures():
+    class BrokenLayer(FakeLayer):
+        def fetch_layer_metadata(self):
+            raise ValueError("broken")
+
+    poller = LayerChangePoller(
+        LayerChangeDetector(BrokenLayer([])), RecordingGISNQuery(), 60
+    )
+
+    poller.poll_once()
+
+    assert poller.stats()["failures"] == 1
+
+
+def test_caches_drop_entries_near_changes():
+    upstream = RecordingGISNQuery()
+    far = (CENTER[0] + 0.05, CENTER[1])
+    result_cache = GISNResultCache(ttl=600)
+    result_cache.set(CENTER, 150, [])
+    result_cache.set(far, 150, [])
+    tile_cache = TileCache()
+    tile_cache.set((34.77, 32.06, 34.78, 32.07), [])
+    tile_cache.set((34.80, 32.06, 34.81, 32.07), [])
+    service = CachedTileGISNQuery(
+        CachedGISNQuery(upstream, result_cache), tile_cache
+    )
+    envelope = rings_envelope(parcel(1, 20)["geometry"]["rings"])
+
+    service.invalidate([envelope])
+
+    assert result_cache.get(CENTER, 100) is None
+    assert result_cache.get(far, 100) == []
+    assert tile_cache.get((34.77, 32.06, 34.78, 32.07)) is None
+    assert tile_cache.get((34.80, 32.06, 34.81, 32.07)) == []
+    assert upstream.invalidated == [[envelope]]
+
+    service.invalidate()
+
+    assert result_cache.get(far, 100) is None
+    assert tile_cache.get((34.80, 32.06, 34.81, 32.07)) is None
+
+
+def test_replica_refresh_applies_edits():
+    layer = FakeLayer([parcel(1, 0), parcel(2, 100), parcel(3, 200)])
+    replica = GISNLayerReplica.sync(layer)
+    layer.edit(parcel(1, 400))
+    layer.delete(3)
+
+    assert replica.refresh(layer) == 2
+    assert replica.edited_at == layer.edited_at
+    assert sorted(replica.features) == [1, 2]
+    # The edited parcel moved in the index too
+    assert [
+        f["attributes"]["OBJECTID"] for f in replica.query_radius(CENTER, 150)
+    ] == [2]
+    assert replica.refresh(layer) == 0
+
+
+def test_replica_refresh_needs_edit_info():
+    layer = FakeLayer([parcel(1, 0)], edit_field=None)
+    replica = GISNLayerReplica.sync(layer)
+    layer.edit(parcel(1, 0, stage="קיים היתר"))
+
+    assert replica.refresh(layer) is None
+    assert GISNLayerReplica([parcel(1, 0)]).refresh(layer) is None
+
+
+@respx.mock
+def test_real_change_queries():
+    ids = respx.get(f"{GISN_LAYER_URL}/query").mock(
+        return_value=httpx.Response(200, json={"objectIds": [1, 2]})
+    )
+    pages = respx.post(f"{GISN_LAYER_URL}/query").mock(
+        return_value=httpx.Response(200, json={"features": [parcel(1, 0)]})
+    )
+    service = RealGISNQuery(client=httpx.Client())
+
+    assert service.fetch_object_ids("OBJECTID", "edited > 0") == [1, 2]
+    assert service.fetch_features("OBJECTID", [1]) == [parcel(1, 0)]
+
+    params = ids.calls.last.request.url.params
+    assert params["where"] == "edited > 0"
+    assert params["returnIdsOnly"] == "true"
+    assert b"objectIds=1" in pages.calls.last.request.content
+
+
+@respx.mock
+def test_layer_metadata_request_respects_deadline():
+    route = respx.get(GISN_LAYER_URL).mock(
+        return_value=httpx.Response(200, json={})
+    )
+    service = RealGISNQuery(client=httpx.Client(), timeout=10)
+
+    with deadline(2):
+        service.fetch_layer_metadata()
+
+    assert route.calls.last.request.extensions["timeout"]["read"] <= 2
+
+
+@respx.mock
+def test_sync_gisn_layer_incremental(tmp_path):
+    path = tmp_path / "layer.json"
+    GISNLayerReplica(
+        [parcel(1, 0), parcel(2, 100)], edited_at=EDITED_AT
+    ).save(path)
+    respx.get(GISN_LAYER_URL).mock(return_value=httpx.Response(200, json={
+        "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+        "editingInfo": {"lastEditDate": EDITED_AT + 1000},
+        "editFieldsInfo": {"editDateField": "edited"},
+    }))
+    respx.get(f"{GISN_LAYER_URL}/query").mock(
+        return_value=httpx.Response(200, json={"objectIds": [1]})
+    )
+    respx.post(f"{GISN_LAYER_URL}/query").mock(return_value=httpx.Response(
+        200, json={"features": [parcel(1, 0, stage="קיים היתר")]},
+    ))
+
+    call_command("sync_gisn_layer", "--incremental", "--output", str(path))
+
+    replica = GISNLayerReplica.load(path)
+    assert sorted(replica.features) == [1]
+    assert replica.features[1]["attributes"]["building_stage"] == "קיים היתר"
+    assert replica.edited_at == EDITED_AT + 1000
+
+
+def test_poller_disabled(settings):
+    settings.GISN_CHANGE_POLL_INTERVAL = 0
+
+    assert apps.get_app_config("api").start_layer_change_poller() is None
@@ -0,0 +1,55 @@
+import httpx
+import pytest
+
+from api.services.real import RealGISNQuery, RealNominativeQuery
+from benchmarks.loadtest import percentile
+from benchmarks.stubs import (
+    GISN_LAYER_PATH,
+    NOMINATIM_PATH,
+    StubServer,
+    StubUpstreams,
+    UpstreamProfile,
+)
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer(StubUpstreams(
+        UpstreamProfile(), UpstreamProfile(), gisn_features=10
+    ))
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_real_services_parse_stub_responses(stub_server):
+    nominative = RealNominativeQuery(
+        url=f"{stub_server.base_url}{NOMINATIM_PATH}"
+    )
+    gisn = RealGISNQuery(
+        layer_url=f"{stub_server.base_url}{GISN_LAYER_PATH}"
+    )
+
+    coordinate = nominative.fetch_data("הרצל", 1)
+    features = gisn.fetch_data(coordinate, 100)
+
+    assert len(features) == 10
+    assert stub_server.app.nominatim.requests == 1
+    assert stub_server.app.gisn.requests == 1
+
+
+def test_stub_error_rate(stub_server):
+    stub_server.app.gisn.error_rate = 1.0
+
+    response = httpx.get(f"{stub_server.base_url}{GISN_LAYER_PATH}/query")
+
+    assert response.status_code == 503
+    assert stub_server.app.gisn.errors == 1
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) == 0.0
@@ -0,0 +1,192 @@
+import json
+import os
+
+import httpx
+import pytest
+import respx
+from django.test import Client
+
+from api import app_state, metrics
+from api.metrics import MetricsRegistry
+from api.services import (
+    DataRetrievalError,
+    MockGISNQuery,
+    MockNominativeQuery,
+)
+from api.services.real import NOMINATIM_URL, RealNominativeQuery
+
+# Far above any real pid, so never alive
+DEAD_PID = 2 ** 22 + 1
+
+
+def sample(text, line_prefix):
+    """Return the value of the sample line starting with ``line_prefix``."""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} not in output")
+
+
+def test_render_counter_gauge_and_histogram():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ["status"])
+    in_flight = registry.gauge("in_flight", "In flight.")
+    latency = registry.histogram(
+        "latency_seconds", "Latency.", ["stage"], buckets=(0.1, 1.0)
+    )
+
+    requests.inc(status="200")
+    requests.inc(2, status="200")
+    requests.inc(status="503")
+    in_flight.inc()
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, stage="gisn")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert "# HELP latency_seconds Latency." in text
+    assert sample(text, 'requests_total{status="200"}') == 3
+    assert sample(text, 'requests_total{status="503"}') == 1
+    assert sample(text, "in_flight") == 1
+    assert sample(text, 'latency_seconds_bucket{stage="gisn",le="0.1"}') == 1
+    assert sample(text, 'latency_seconds_bucket{stage="gisn",le="1"}') == 2
+    assert sample(text, 'latency_seconds_bucket{stage="gisn",le="+Inf"}') == 3
+    assert sample(text, 'latency_seconds_count{stage="gisn"}') == 3
+    assert sample(text, 'latency_seconds_sum{stage="gisn"}') == 5.55
+
+
+def test_labels_must_match():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ["status"])
+
+    with pytest.raises(ValueError):
+        requests.inc()
+
+
+def test_track_inprogress_and_time():
+    registry = MetricsRegistry()
+    in_flight = registry.gauge("in_flight", "In flight.", ["endpoint"])
+    latency = registry.histogram("latency_seconds", "Latency.")
+
+    with in_flight.track_inprogress(endpoint="analyze"), latency.time():
+        assert sample(registry.render(), 'in_flight{endpoint="analyze"}') == 1
+
+    text = registry.render()
+    assert sample(text, 'in_flight{endpoint="analyze"}') == 0
+    assert sample(text, "latency_seconds_count") == 1
+
+
+def test_flush_writes_snapshot(tmp_path):
+    registry = MetricsRegistry(tmp_path)
+    registry.counter("requests_total", "Requests.").inc(4)
+
+    registry.flush()
+
+    snapshot = json.loads(
+        (tmp_path / f"metrics-{os.getpid()}.json").read_text()
+    )
+    assert snapshot == {"requests_total": [[[], 4]]}
+
+
+def test_collect_merges_other_workers(tmp_path):
+    registry = MetricsRegistry(tmp_path)
+    requests = registry.counter("requests_total", "Requests.", ["status"])
+    in_flight = registry.gauge("in_flight", "In flight.")
+    latency = registry.histogram(
+        "latency_seconds", "Latency.", buckets=(0.1, 1.0)
+    )
+    requests.inc(status="200")
+    in_flight.inc()
+    latency.observe(0.05)
+
+    # A live worker (our parent) and a worker that has exited
+    for pid in (os.getppid(), DEAD_PID):
+        (tmp_path / f"metrics-{pid}.json").write_text(json.dumps({
+            "requests_total": [[["200"], 2], [["503"], 1]],
+            "in_flight": [[[], 3]],
+            "latency_seconds": [[[], [0, 1, 1, 5.5]]],
+            "unknown_metric": [[[], 7]],
+        }))
+
+    text = registry.render()
+    assert sample(text, 'requests_total{status="200"}') == 5
+    assert sample(text, 'requests_total{status="503"}') == 2
+    # Gauges of exited workers are dropped
+    assert sample(text, "in_flight") == 4
+    assert sample(text, 'latency_seconds_bucket{le="0.1"}') == 1
+    assert sample(text, 'latency_seconds_bucket{le="+Inf"}') == 5
+    assert sample(text, "latency_seconds_sum") == 11.05
+    assert "unknown_metric" not in text
+
+
+def test_unreadable_snapshot_is_skipped(tmp_path):
+    registry = MetricsRegistry(tmp_path)
+    registry.counter("requests_total", "Requests.").inc()
+    (tmp_path / f"metrics-{DEAD_PID}.json").write_text("{not json")
+
+    assert sample(registry.render(), "requests_total") == 1
+
+
+@pytest.fixture
+def mock_services():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+    app_state.set_services(MockNominativeQuery(), MockGISNQuery())
+    yield
+    app_state.set_services(*previous)
+
+
+def test_metrics_endpoint_reports_analyze_stages(mock_services):
+    client = Client()
+    before = client.get("/metrics").content.decode()
+
+    response = client.post(
+        "/api/analyze/",
+        data=json.dumps({"street": "דיזנגוף", "houseNumber": 50}),
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    text = response.content.decode()
+    for stage in ("geocode", "gisn", "risk_assessment", "serialize"):
+        name = f'tamaod_stage_duration_seconds_count{{stage="{stage}"}}'
+        previous = sample(before, name) if name in before else 0
+        assert sample(text, name) == previous + 1
+    assert 'tamaod_request_duration_seconds_count{endpoint="analyze"}' in text
+    assert 'tamaod_response_size_bytes_sum{endpoint="analyze"}' in text
+    assert sample(text, 'tamaod_in_flight_requests{endpoint="analyze"}') == 0
+
+
+def test_metrics_endpoint_disabled(settings):
+    settings.METRICS_ENABLED = False
+
+    assert Client().get("/metrics").status_code == 404
+
+
+@respx.mock
+def test_upstream_status_codes_are_counted():
+    def count(status):
+        values = metrics.registry.collect()["tamaod_upstream_requests_total"]
+        return values.get(("nominatim", status), 0)
+
+    before = {status: count(status) for status in ("200", "503", "error")}
+    route = respx.get(NOMINATIM_URL)
+    service = RealNominativeQuery(client=httpx.Client())
+
+    route.mock(return_value=httpx.Response(
+        200, json=[{"lon": "34.77", "lat": "32.07"}]
+    ))
+    service.fetch_data("דיזנגוף", 50)
+    route.mock(return_value=httpx.Response(503))
+    with pytest.raises(DataRetrievalError):
+        service.fetch_data("דיזנגוף", 50)
+    route.mock(side_effect=httpx.ConnectError("refused"))
+    with pytest.raises(DataRetrievalError):
+        service.fetch_data("דיזנגוף", 50)
+
+    for status in ("200", "503", "error"):
+        assert count(status) == before[status] + 1, status
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+import respx
+
+from api.services import (
+    DataRetrievalError,
+    MockNominativeQuery,
+    RateLimitedNominativeQuery,
+    RealNominativeQuery,
+    SharedTokenBucket,
+)
+from api.services.real import NOMINATIM_URL
+
+
+@pytest.fixture
+def bucket_path(tmp_path):
+    return tmp_path / "rate_limit.sqlite3"
+
+
+def test_shared_bucket_spaces_calls(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate=20)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[0] == 0
+    assert waits == sorted(waits)
+    assert waits[-1] == pytest.approx(0.15, abs=0.01)
+    assert bucket.stats()["acquired"] == 4
+
+
+def test_shared_bucket_allows_burst(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate=10, burst=3)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == pytest.approx(0.1, abs=0.01)
+
+
+def test_shared_bucket_is_shared_between_instances(bucket_path):
+    # Two instances on one file behave like two workers on one host
+    first = SharedTokenBucket(bucket_path, rate=10)
+    second = SharedTokenBucket(bucket_path, rate=10)
+
+    assert first.reserve() == 0
+    assert second.reserve() == pytest.approx(0.1, abs=0.01)
+    assert first.reserve() == pytest.approx(0.2, abs=0.01)
+    assert second.stats()["queue_depth"] == 2
+
+
+def test_shared_bucket_rejects_beyond_max_wait(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate=10, max_wait=0.25)
+
+    for _ in range(3):
+        bucket.reserve()
+    with pytest.raises(DataRetrievalError) as excinfo:
+        bucket.reserve()
+
+    assert excinfo.value.status_code == 503
+    stats = bucket.stats()
+    assert stats["acquired"] == 3
+    assert stats["rejected"] == 1
+
+
+def test_shared_bucket_backoff(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate=100)
+
+    bucket.backoff(0.5)
+
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.02)
+
+
+def test_shared_bucket_acquire_async_keeps_order(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate=20)
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire_async() for _ in range(4)))
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.14
+    stats = bucket.stats()
+    assert stats["acquired"] == 4
+    assert stats["waiting"] == 0
+    assert stats["average_wait"] > 0
+
+
+@respx.mock
+def test_rate_limited_query_backs_off_on_429(bucket_path):
+    bucket = SharedTokenBucket(bucket_path, rate=100)
+    respx.get(NOMINATIM_URL).mock(return_value=httpx.Response(
+        429, headers={"Retry-After": "2"}
+    ))
+    service = RateLimitedNominativeQuery(
+        RealNominativeQuery(client=httpx.Client()), bucket
+    )
+
+    with pytest.raises(DataRetrievalError) as excinfo:
+        service.fetch_data("דיזנגוף", 50)
+
+    assert excinfo.value.status_code == 429
+    assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_rate_limited_query_reports_limiter_stats(bucket_path):
+    service = RateLimitedNominativeQuery(
+        MockNominativeQuery(), SharedTokenBucket(bucket_path, rate=100)
+    )
+
+    service.fetch_data("דיזנגוף", 50)
+
+    assert service.stats()["nominatim_rate_limit"]["acquired"] == 1
@@ -1,9 +1,11 @@
+import asyncio
 import pytest
 import respx
 import httpx
 from api.services.real import RealNominativeQuery, RealGISNQuery
 from api.services.base import DataRetrievalError
 import os
+from urllib.parse import parse_qsl
 
 # Set env vars required by headers
 os.environ['USER_AGENT'] = 'test-agent'
@@ -89,6 +91,13 @@ def gisn_response_example():
 NOIMNATIVE_URL = "https://nominatim.openstreetmap.org/search"
 GISN_QUERY_URL = ("https://gisn.tel-aviv.gov.il/arcgis/rest/services/"
                   "WM/IView2WM/MapServer/772/query")
+GISN_LAYER_URL = GISN_QUERY_URL.removesuffix("/query")
+
+
+def mock_layer_metadata(oid_field="OBJECTID"):
+    return respx.get(GISN_LAYER_URL).mock(return_value=httpx.Response(
+        200, json={"fields": [{"name": oid_field, "type": "esriFieldTypeOID"}]},
+    ))
 
 
 # Nominative Query Tests
@@ -327,3 +336,163 @@ def test_gisn_missing_features_key():
     # Should return empty list when 'features' key is missing
     assert isinstance(result, list)
     assert result == []
+
+
+@respx.mock
+def test_gisn_display_profile_limits_precision():
+    """Test that the display profile asks GISN for rounded, generalized rings"""
+    route = respx.get(GISN_QUERY_URL).mock(
+        return_value=httpx.Response(200, json={"features": []})
+    )
+
+    RealGISNQuery(payload_profile="display").fetch_data(
+        (34.7735910, 32.0698820), 100
+    )
+
+    params = route.calls.last.request.url.params
+    assert params["geometryPrecision"] == "6"
+    assert params["maxAllowableOffset"] == "0.000005"
+
+
+def test_gisn_unknown_payload_profile():
+    """Test that an unknown payload profile is rejected"""
+    with pytest.raises(ValueError):
+        RealGISNQuery(payload_profile="tiny")
+
+
+@respx.mock
+def test_gisn_two_phase_fetches_geometry_for_dangerous_parcels_only():
+    """Test that two-phase mode fetches rings only for dangerous parcels"""
+    parcels = [
+        {"attributes": {"OBJECTID": 1, "building_stage": "בבניה"}},
+        {"attributes": {"OBJECTID": 2, "building_stage": "קיים"}},
+        {"attributes": {"OBJECTID": 3, "building_stage": "בבניה"}},
+    ]
+    with_geometry = gisn_response_example()
+    mock_layer_metadata()
+    attributes_route = respx.get(GISN_QUERY_URL).mock(
+        return_value=httpx.Response(200, json={"features": parcels})
+    )
+    geometry_route = respx.post(GISN_QUERY_URL).mock(
+        return_value=httpx.Response(200, json=with_geometry)
+    )
+
+    query = RealGISNQuery(two_phase=True)
+    result = query.fetch_data((34.7735910, 32.0698820), 100)
+
+    assert result == with_geometry["features"]
+    first = attributes_route.calls.last.request.url.params
+    second = form_params(geometry_route.calls.last.request)
+    assert first["returnGeometry"] == "false"
+    assert "OBJECTID" in first["outFields"].split(",")
+    assert second["objectIds"] == "1,3"
+    assert second["returnGeometry"] == "true"
+    assert second["geometry"] == ""
+    # The layer metadata, the attributes and the geometry
+    assert query.stats()["gisn_payload"]["responses"] == 3
+
+
+@respx.mock
+def test_gisn_two_phase_uses_layer_object_id_field():
+    """Test that two-phase mode keys parcels by the layer's OID field"""
+    mock_layer_metadata("FID")
+    attributes_route = respx.get(GISN_QUERY_URL).mock(
+        return_value=httpx.Response(200, json={"features": [
+            {"attributes": {"FID": 7, "building_stage": "בבניה"}},
+            {"attributes": {"building_stage": "בבניה"}},
+        ]})
+    )
+    geometry_route = respx.post(GISN_QUERY_URL).mock(
+        return_value=httpx.Response(200, json={"features": []})
+    )
+
+    query = RealGISNQuery(two_phase=True)
+    query.fetch_data((34.7735910, 32.0698820), 100)
+
+    first = attributes_route.calls.last.request.url.params
+    assert "FID" in first["outFields"].split(",")
+    assert form_params(geometry_route.calls.last.request)["objectIds"] == "7"
+    assert query.object_id_field == "FID"
+
+
+@respx.mock
+def test_gisn_two_phase_skips_geometry_without_dangerous_parcels():
+    """Test that two-phase mode stops after one query when nothing matches"""
+    mock_layer_metadata()
+    route = respx.get(GISN_QUERY_URL).mock(return_value=httpx.Response(
+        200,
+        json={"features": [
+            {"attributes": {"OBJECTID": 2, "building_stage": "קיים"}},
+        ]},
+    ))
+
+    result = asyncio.run(
+        RealGISNQuery(two_phase=True).fetch_data_async(
+            (34.7735910, 32.0698820), 100
+        )
+    )
+
+    assert result == []
+    assert route.call_count == 1
+
+
+def form_params(request):
+    return dict(parse_qsl(request.content.decode(), keep_blank_values=True))
+
+
+def paged_gisn_routes(object_ids):
+    """Mock a GISN query that exceeds the transfer limit.
+
+    The first page only holds a single feature; the full result is
+    served by object id, one POST per page.
+    """
+    def query(request):
+        if request.url.params["returnIdsOnly"] == "true":
+            return httpx.Response(200, json={
+                "objectIdFieldName": "OBJECTID", "objectIds": object_ids,
+            })
+        return httpx.Response(200, json={
+            "features": [{"attributes": {"OBJECTID": object_ids[0]}}],
+            "exceededTransferLimit": True,
+        })
+
+    def page(request):
+        ids = form_params(request)["objectIds"].split(",")
+        return httpx.Response(200, json={"features": [
+            {"attributes": {"OBJECTID": int(object_id)}} for object_id in ids
+        ]})
+
+    return (
+        respx.get(GISN_QUERY_URL).mock(side_effect=query),
+        respx.post(GISN_QUERY_URL).mock(side_effect=page),
+    )
+
+
+@respx.mock
+def test_gisn_pages_truncated_query():
+    """Test that a truncated GISN query is completed page by page"""
+    object_ids = list(range(100, 125))
+    _, page_route = paged_gisn_routes(object_ids)
+
+    query = RealGISNQuery(page_size=10, page_parallelism=3)
+    result = query.fetch_data((34.7735910, 32.0698820), 1000)
+
+    assert [f["attributes"]["OBJECTID"] for f in result] == object_ids
+    assert page_route.call_count == 3
+    assert form_params(page_route.calls[0].request)["geometry"] == ""
+    assert query.stats()["gisn_payload"]["paged_queries"] == 1
+
+
+@respx.mock
+def test_gisn_pages_truncated_query_async():
+    """Test that async paging merges concurrent pages in order"""
+    object_ids = list(range(100, 125))
+    _, page_route = paged_gisn_routes(object_ids)
+
+    query = RealGISNQuery(page_size=10, page_parallelism=2)
+    result = asyncio.run(
+        query.fetch_data_async((34.7735910, 32.0698820), 1000)
+    )
+
+    assert [f["attributes"]["OBJECTID"] for f in result] == object_ids
+    assert page_route.call_count == 3
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+import respx
+from django.test import Client
+
+from api import app_state
+from api.services import (
+    CircuitBreaker,
+    CircuitBreakerGISNQuery,
+    CircuitOpenError,
+    DataRetrievalError,
+    MockNominativeQuery,
+    RealGISNQuery,
+    UpstreamError,
+    track_staleness,
+)
+from api.services.base import BaseGISNQuery
+from api.services.breaker import CLOSED, HALF_OPEN, OPEN, is_upstream_failure
+from api.services.deadline import deadline, remaining
+from api.services.gisn_cache import CachedGISNQuery, GISNResultCache
+from api.services.real import GISN_LAYER_URL
+
+CENTER = (34.7735910, 32.0698820)
+X, Y = CENTER
+PLACE = {
+    "attributes": {"addresses": "דיזנגוף 50", "building_stage": "בבניה"},
+    "geometry": {"rings": [[
+        [X, Y], [X + 0.0001, Y], [X + 0.0001, Y + 0.0001], [X, Y],
+    ]]},
+}
+
+
+class FlakyGISNQuery(BaseGISNQuery):
+    """Fake upstream that fails while ``failing`` is set."""
+
+    def __init__(self):
+        self.failing = False
+        self.calls = 0
+        self.called = threading.Event()
+
+    def fetch_data(self, coordinate, radius):
+        self.calls += 1
+        self.called.set()
+        if self.failing:
+            raise UpstreamError("GISN API error: 502 Bad Gateway", 502)
+        return [PLACE]
+
+
+def fail(breaker, error=None):
+    with pytest.raises(DataRetrievalError), breaker.call():
+        raise error or UpstreamError("boom", status_code=502)
+
+
+def test_is_upstream_failure():
+    assert is_upstream_failure(UpstreamError("timeout"))
+    assert is_upstream_failure(UpstreamError("busy", status_code=503))
+    assert is_upstream_failure(UpstreamError("slow down", status_code=429))
+    assert not is_upstream_failure(UpstreamError("missing", status_code=404))
+    assert not is_upstream_failure(
+        DataRetrievalError("could not locate address", status_code=500)
+    )
+    assert not is_upstream_failure(ValueError("bad coordinate"))
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("gisn", failure_threshold=3)
+
+    fail(breaker)
+    fail(breaker)
+    with breaker.call():
+        pass
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state == CLOSED
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    start = time.perf_counter()
+    with pytest.raises(CircuitOpenError) as excinfo, breaker.call():
+        pytest.fail("call admitted while open")
+    assert time.perf_counter() - start < 0.01
+    assert excinfo.value.status_code == 503
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_ignores_non_upstream_errors():
+    breaker = CircuitBreaker("nominatim", failure_threshold=1)
+
+    fail(breaker, DataRetrievalError("could not locate address", 500))
+
+    assert breaker.state == CLOSED
+
+
+def test_breaker_non_upstream_error_keeps_half_open():
+    breaker = CircuitBreaker("nominatim", failure_threshold=1, reset_timeout=0)
+    fail(breaker)
+
+    # A full rate limit queue never reached the upstream
+    fail(breaker, DataRetrievalError("queue is full", status_code=503))
+
+    assert breaker.state == HALF_OPEN
+    fail(breaker, UpstreamError("missing", status_code=404))
+    assert breaker.state == CLOSED
+
+
+@respx.mock
+def test_malformed_gisn_body_is_upstream_failure():
+    respx.get(f"{GISN_LAYER_URL}/query").mock(
+        return_value=httpx.Response(200, content=b"<html>")
+    )
+    breaker = CircuitBreaker("gisn", failure_threshold=1)
+    service = CircuitBreakerGISNQuery(
+        RealGISNQuery(client=httpx.Client()), breaker
+    )
+
+    with pytest.raises(UpstreamError):
+        service.fetch_data(CENTER, 100)
+
+    assert breaker.state == OPEN
+
+
+def test_breaker_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker("gisn", failure_threshold=1, reset_timeout=0.05)
+    fail(breaker)
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+
+    # A failed trial reopens the circuit at once
+    fail(breaker)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    breaker.before_call()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["opened"] == 2
+
+
+def test_breaker_releases_cancelled_trial():
+    breaker = CircuitBreaker("gisn", failure_threshold=1, reset_timeout=0)
+    fail(breaker)
+
+    with pytest.raises(KeyboardInterrupt), breaker.call():
+        raise KeyboardInterrupt
+
+    assert breaker.state == HALF_OPEN
+    with breaker.call():
+        pass
+    assert breaker.state == CLOSED
+
+
+@respx.mock
+def test_breaker_fails_fast_on_gisn_outage():
+    route = respx.get(f"{GISN_LAYER_URL}/query").mock(
+        return_value=httpx.Response(503, text="Service Unavailable")
+    )
+    service = CircuitBreakerGISNQuery(
+        RealGISNQuery(client=httpx.Client()),
+        CircuitBreaker("gisn", failure_threshold=2),
+    )
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            service.fetch_data(CENTER, 100)
+    with pytest.raises(CircuitOpenError):
+        service.fetch_data(CENTER, 100)
+
+    assert route.call_count == 2
+    assert service.stats()["gisn_circuit"]["state"] == OPEN
+
+
+def test_gisn_requests_have_a_timeout():
+    request = RealGISNQuery(client=httpx.Client(), timeout=3)._request(
+        CENTER, 100
+    )
+
+    assert request["timeout"].read == 3
+
+
+def stale_service(upstream):
+    cache = GISNResultCache(ttl=0.05, stale_ttl=60)
+    return CachedGISNQuery(upstream, cache)
+
+
+def test_stale_entry_is_served_and_refreshed():
+    upstream = FlakyGISNQuery()
+    service = stale_service(upstream)
+    service.fetch_data(CENTER, 100)
+    time.sleep(0.06)
+    upstream.called.clear()
+
+    with track_staleness() as staleness:
+        assert service.fetch_data(CENTER, 100) == [PLACE]
+
+    assert staleness["stale"]
+    assert upstream.called.wait(1)
+    deadline = time.monotonic() + 1
+    while service.stats()["gisn_cache"]["refreshes"] < 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    with track_staleness() as staleness:
+        service.fetch_data(CENTER, 100)
+    assert not staleness["stale"]
+    assert upstream.calls == 2
+
+
+def test_stale_entry_survives_failed_refresh():
+    upstream = FlakyGISNQuery()
+    service = stale_service(upstream)
+    service.fetch_data(CENTER, 100)
+    time.sleep(0.06)
+    upstream.failing = True
+
+    async def serve_twice():
+        first = await service.fetch_data_async(CENTER, 100)
+        # Let the background refresh fail
+        while service.stats()["gisn_cache"]["refreshing"]:
+            await asyncio.sleep(0.01)
+        return first, await service.fetch_data_async(CENTER, 100)
+
+    with track_staleness() as staleness:
+        first, second = asyncio.run(serve_twice())
+
+    assert first == second == [PLACE]
+    assert staleness["stale"]
+    stats = service.stats()["gisn_cache"]
+    assert stats["refresh_failures"] >= 1
+    assert stats["stale_hits"] == 2
+
+
+def test_unexpected_refresh_error_frees_the_cell():
+    upstream = FlakyGISNQuery()
+    service = stale_service(upstream)
+    service.fetch_data(CENTER, 100)
+    time.sleep(0.06)
+
+    def broken(coordinate, radius):
+        raise ValueError("bug")
+
+    upstream.fetch_data = broken
+    _, refresh = service._serve(service.cache.lookup(CENTER, 100))
+
+    with pytest.raises(ValueError, match="bug"):
+        service._refresh(*refresh)
+
+    stats = service.stats()["gisn_cache"]
+    assert stats["refreshing"] == 0
+    assert stats["refresh_failures"] == 1
+
+
+def test_async_refresh_outlives_request_deadline():
+    upstream = FlakyGISNQuery()
+    service = stale_service(upstream)
+    service.fetch_data(CENTER, 100)
+    time.sleep(0.06)
+    budgets = []
+
+    async def slow_fetch(coordinate, radius):
+        budgets.append(remaining())
+        await asyncio.sleep(0.1)
+        return [PLACE]
+
+    upstream.fetch_data_async = slow_fetch
+
+    async def serve():
+        with deadline(0.02):
+            await service.fetch_data_async(CENTER, 100)
+        while service.stats()["gisn_cache"]["refreshing"]:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(serve())
+
+    assert budgets == [None]
+    stats = service.stats()["gisn_cache"]
+    assert stats["refreshes"] == 1
+    assert stats["refresh_failures"] == 0
+
+
+def test_concurrent_stale_hits_refresh_once():
+    upstream = FlakyGISNQuery()
+    service = stale_service(upstream)
+    service.fetch_data(CENTER, 100)
+    time.sleep(0.06)
+
+    async def serve():
+        await asyncio.gather(
+            *(service.fetch_data_async(CENTER, 100) for _ in range(5))
+        )
+        while service.stats()["gisn_cache"]["refreshing"]:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(serve())
+
+    assert upstream.calls == 2
+
+
+def test_expired_stale_entry_is_a_miss():
+    cache = GISNResultCache(ttl=0, stale_ttl=0)
+    center, radius = cache.canonical_query(CENTER, 100)
+    cache.set(center, radius, [PLACE])
+
+    assert cache.lookup(CENTER, 100) is None
+
+
+@pytest.fixture
+def use_gisn():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+
+    def use(gisn):
+        app_state.set_services(MockNominativeQuery(), gisn)
+
+    yield use
+    app_state.set_services(*previous)
+
+
+def analyze():
+    return Client().post(
+        "/api/analyze/",
+        data=json.dumps({"street": "דיזנגוף", "houseNumber": 50}),
+        content_type="application/json",
+    )
+
+
+def test_analyze_marks_stale_responses(use_gisn):
+    service = stale_service(FlakyGISNQuery())
+    use_gisn(service)
+
+    fresh = analyze()
+    assert fresh.status_code == 200
+    assert "Warning" not in fresh
+    time.sleep(0.06)
+
+    stale = analyze()
+    assert stale.status_code == 200
+    assert stale["Warning"] == '110 - "Response is Stale"'
+    assert stale.json() == fresh.json()
+
+
+def test_analyze_returns_503_while_circuit_is_open(use_gisn):
+    upstream = FlakyGISNQuery()
+    upstream.failing = True
+    use_gisn(CircuitBreakerGISNQuery(
+        upstream, CircuitBreaker("gisn", failure_threshold=1)
+    ))
+
+    assert analyze().status_code == 500
+    response = analyze()
+
+    assert response.status_code == 503
+    assert upstream.calls == 1
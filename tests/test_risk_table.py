@@ -0,0 +1,227 @@
+import asyncio
+import json
+import time
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.test import Client
+
+from api import app_state
+from api.services import (
+    GeocodeCache,
+    GISNLayerReplica,
+    MockGISNQuery,
+    RiskTable,
+    handle_address,
+    handle_address_async,
+    normalize_address,
+    stream_address_async,
+)
+from api.services.base import BaseGISNQuery, BaseNominativeQuery
+from api.services.risk_table import parse_addresses
+from api.services.spatial import meters_to_degrees
+
+CENTER = (34.7735910, 32.0698820)
+
+
+def square(east_meters, size_meters=10):
+    lon_step, lat_step = meters_to_degrees(1, CENTER[1])
+    x0 = CENTER[0] + east_meters * lon_step
+    x1 = x0 + size_meters * lon_step
+    y0 = CENTER[1] - size_meters / 2 * lat_step
+    y1 = CENTER[1] + size_meters / 2 * lat_step
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+
+
+def parcel(object_id, east_meters, stage="בבניה", addresses=""):
+    return {
+        "attributes": {
+            "OBJECTID": object_id, "addresses": addresses,
+            "building_stage": stage, "sw_tama_38": "לא",
+        },
+        "geometry": {"rings": [square(east_meters)]},
+    }
+
+
+@pytest.fixture
+def replica():
+    return GISNLayerReplica([
+        parcel(1, -5, stage="קיים היתר", addresses="הרצל 1, הרצל 3"),
+        parcel(2, 30),
+        parcel(3, 150),
+        parcel(4, 400),
+        parcel(5, 40, stage="קיים היתר"),
+    ])
+
+
+class FailingNominativeQuery(BaseNominativeQuery):
+    def fetch_data(self, street, house_number):
+        raise AssertionError("geocoded a precomputed address")
+
+
+class FailingGISNQuery(BaseGISNQuery):
+    def fetch_data(self, coordinate, radius):
+        raise AssertionError("queried GISN for a precomputed address")
+
+
+@pytest.fixture
+def use_table(tmp_path, replica):
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service(),
+        app_state.get_risk_table(),
+    )
+    path = tmp_path / "risk.sqlite3"
+    RiskTable.build(path, replica, {"הרצל|1": CENTER})
+    table = RiskTable(path)
+    app_state.set_services(FailingNominativeQuery(), FailingGISNQuery())
+    app_state.set_risk_table(table)
+    yield table
+    app_state.set_services(*previous[:2])
+    app_state.set_risk_table(previous[2])
+
+
+def object_ids(places):
+    return [place["attributes"]["OBJECTID"] for place in places]
+
+
+def test_parse_addresses():
+    assert parse_addresses("הרצל 1, שדרות רוטשילד 16,הרצל 10א, הרצל") == [
+        ("הרצל", 1), ("שדרות רוטשילד", 16),
+    ]
+    assert parse_addresses(None) == []
+
+
+def test_lookup_buckets_parcels_by_radius(use_table):
+    assert object_ids(use_table.lookup("הרצל", 1, 50)[1]) == [2]
+    assert object_ids(use_table.lookup("הרצל", 1, 200)[1]) == [2, 3]
+    coordinate, places = use_table.lookup("הרצל", 1, 500)
+    assert coordinate == pytest.approx(CENTER)
+    assert object_ids(places) == [2, 3, 4]
+
+
+def test_lookup_misses(use_table):
+    assert use_table.lookup("הרצל", 3, 100) is None
+    # Non-standard radii are not counted, they never reach the table
+    assert use_table.lookup("הרצל", 1, 150) is None
+
+    assert use_table.stats()["misses"] == 1
+
+
+def test_missing_table_misses(tmp_path):
+    table = RiskTable(tmp_path / "missing.sqlite3")
+
+    assert table.lookup("הרצל", 1, 100) is None
+
+
+def test_table_is_reopened_after_rebuild(use_table, replica, monkeypatch):
+    monkeypatch.setattr(RiskTable, "RELOAD_CHECK_INTERVAL", 0)
+    assert use_table.lookup("הרצל", 3, 100) is None
+
+    RiskTable.build(use_table.path, replica, {"הרצל|3": CENTER})
+
+    assert object_ids(use_table.lookup("הרצל", 3, 100)[1]) == [2]
+
+
+def test_lookup_uses_built_radii(tmp_path, replica):
+    table = RiskTable(tmp_path / "risk.sqlite3")
+    RiskTable.build(table.path, replica, {"הרצל|1": CENTER}, radii=(150,))
+
+    assert object_ids(table.lookup("הרצל", 1, 150)[1]) == [2, 3]
+    assert table.lookup("הרצל", 1, 100) is None
+
+
+def test_outdated_table_misses(use_table, monkeypatch):
+    use_table.max_age = 60
+    real_time = time.time
+    monkeypatch.setattr(time, "time", lambda: real_time() + 61)
+
+    assert use_table.lookup("הרצל", 1, 100) is None
+    assert use_table.stats()["stale"] == 1
+
+
+def test_layer_edits_invalidate_nearby_entries(use_table, replica, monkeypatch):
+    monkeypatch.setattr(RiskTable, "RELOAD_CHECK_INTERVAL", 0)
+    lon_step, _ = meters_to_degrees(1, CENTER[1])
+    edited = (CENTER[0] + 300 * lon_step, CENTER[1] - 0.0001)
+    use_table.invalidate([(*edited, edited[0] + 0.0001, CENTER[1] + 0.0001)])
+
+    assert use_table.lookup("הרצל", 1, 200) is not None
+    assert use_table.lookup("הרצל", 1, 500) is None
+
+    use_table.invalidate()
+    assert use_table.lookup("הרצל", 1, 200) is None
+
+    # A table built afterwards is served again
+    RiskTable.build(use_table.path, replica, {"הרצל|1": CENTER})
+    assert use_table.lookup("הרצל", 1, 500) is not None
+
+
+def test_handle_address_uses_table(use_table):
+    assert object_ids(handle_address("הרצל", 1, 200)) == [2, 3]
+    assert object_ids(
+        asyncio.run(handle_address_async("הרצל", 1, 200))
+    ) == [2, 3]
+    assert use_table.stats()["hits"] == 2
+
+
+def test_handle_address_falls_back_to_live_queries(use_table):
+    app_state.set_services(
+        app_state.get_nominative_service(), MockGISNQuery()
+    )
+    # A miss reaches the geocoder
+    with pytest.raises(AssertionError, match="geocoded"):
+        handle_address("הרצל", 1, 150)
+
+
+def test_stream_address_uses_table(use_table):
+    async def collect():
+        return [
+            event async for event in stream_address_async("הרצל", 1, 100)
+        ]
+
+    events = asyncio.run(collect())
+
+    assert events[0]["type"] == "coordinate"
+    assert events[0]["radius"] == 100
+    assert [event["type"] for event in events[1:]] == ["feature", "done"]
+    assert events[-1] == {"type": "done", "count": 1, "stale": False}
+
+
+def test_analyze_view_uses_table(use_table):
+    response = Client().post(
+        "/api/analyze/",
+        data=json.dumps({"street": "הרצל", "houseNumber": 1, "radius": 50}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert object_ids(response.json()) == [2]
+
+
+def test_build_risk_table_command(tmp_path, replica):
+    replica.save(tmp_path / "replica.json")
+    cache = GeocodeCache(tmp_path / "geocode.sqlite3")
+    cache.set(normalize_address("הרצל", 3), CENTER)
+    cache.set(normalize_address("no such street", 1), CENTER)
+    output = tmp_path / "risk.sqlite3"
+
+    call_command(
+        "build_risk_table",
+        "--replica", str(tmp_path / "replica.json"),
+        "--geocode-cache", str(tmp_path / "geocode.sqlite3"),
+        "--output", str(output),
+    )
+
+    table = RiskTable(output)
+    # Parcel addresses are placed at the parcel's center
+    assert object_ids(table.lookup("הרצל", 1, 50)[1]) == [2]
+    assert table.lookup("הרצל", 3, 50)[0] == pytest.approx(CENTER)
+    assert table.lookup("no such street", 1, 50) is None
+
+
+def test_build_risk_table_requires_replica(tmp_path):
+    with pytest.raises(CommandError, match="sync_gisn_layer"):
+        call_command(
+            "build_risk_table", "--replica", str(tmp_path / "missing.json"),
+            "--output", str(tmp_path / "risk.sqlite3"),
+        )
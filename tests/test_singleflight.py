@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.services.base import (
+    BaseGISNQuery,
+    BaseNominativeQuery,
+    mark_stale,
+    track_staleness,
+)
+from api.services.deadline import DeadlineExceededError, deadline, remaining
+from api.services.singleflight import (
+    SingleFlight,
+    SingleFlightGISNQuery,
+    SingleFlightNominativeQuery,
+)
+
+
+class SlowNominativeQuery(BaseNominativeQuery):
+    def __init__(self):
+        self.calls = 0
+
+    def fetch_data(self, street, house_number):
+        self.calls += 1
+        time.sleep(0.1)
+        return (34.77, 32.06)
+
+    async def fetch_data_async(self, street, house_number):
+        self.calls += 1
+        await asyncio.sleep(0.1)
+        return (34.77, 32.06)
+
+
+class SlowGISNQuery(BaseGISNQuery):
+    def __init__(self):
+        self.calls = 0
+
+    async def fetch_data_async(self, coordinate, radius):
+        self.calls += 1
+        await asyncio.sleep(0.1)
+        return [{"attributes": {"radius": radius}}]
+
+    def fetch_data(self, coordinate, radius):
+        raise AssertionError("sync path not expected")
+
+
+def run_in_threads(count, fn):
+    results = [None] * count
+    errors = []
+
+    def worker(index):
+        try:
+            results[index] = fn()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=worker, args=(i,)) for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_threads_share_one_call():
+    inner = SlowNominativeQuery()
+    service = SingleFlightNominativeQuery(inner)
+
+    results, errors = run_in_threads(
+        10, lambda: service.fetch_data("שדרות רוטשילד", 12)
+    )
+
+    assert errors == []
+    assert results == [(34.77, 32.06)] * 10
+    assert inner.calls == 1
+    stats = service.stats()["nominatim_singleflight"]
+    assert stats == {"executed": 1, "coalesced": 9, "in_flight": 0}
+
+
+def test_normalized_addresses_coalesce():
+    inner = SlowNominativeQuery()
+    service = SingleFlightNominativeQuery(inner)
+    streets = ["שדרות רוטשילד", " שדרות  רוטשילד", "שדרות-רוטשילד"] * 2
+
+    run_in_threads(6, lambda: service.fetch_data(streets.pop(), 12))
+
+    assert inner.calls == 1
+
+
+def test_sequential_calls_are_not_coalesced():
+    inner = SlowNominativeQuery()
+    service = SingleFlightNominativeQuery(inner)
+
+    service.fetch_data("הרצל", 1)
+    service.fetch_data("הרצל", 1)
+
+    assert inner.calls == 2
+
+
+def test_errors_are_shared_with_waiters():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError("upstream down")
+
+    _, errors = run_in_threads(5, lambda: flight.do("key", failing))
+
+    assert len(errors) == 5
+    assert all(str(e) == "upstream down" for e in errors)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_async_callers_share_one_call():
+    inner = SlowGISNQuery()
+    service = SingleFlightGISNQuery(inner)
+
+    async def run():
+        return await asyncio.gather(*(
+            service.fetch_data_async((34.77, 32.06), 100) for _ in range(20)
+        ))
+
+    results = asyncio.run(run())
+
+    assert inner.calls == 1
+    assert all(result is results[0] for result in results)
+    assert service.stats()["gisn_singleflight"]["coalesced"] == 19
+
+
+def test_async_different_keys_run_separately():
+    inner = SlowGISNQuery()
+    service = SingleFlightGISNQuery(inner)
+
+    async def run():
+        await asyncio.gather(
+            service.fetch_data_async((34.77, 32.06), 100),
+            service.fetch_data_async((34.77, 32.06), 200),
+        )
+
+    asyncio.run(run())
+
+    assert inner.calls == 2
+
+
+def test_cancelled_async_caller_does_not_cancel_shared_call():
+    flight = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def run():
+        first = asyncio.ensure_future(flight.do_async("key", upstream))
+        second = asyncio.ensure_future(flight.do_async("key", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "result"
+
+
+def test_async_errors_propagate():
+    flight = SingleFlight()
+
+    async def upstream():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError, match="upstream down"):
+        asyncio.run(flight.do_async("key", upstream))
+
+
+def test_shared_async_call_outlives_leader_deadline():
+    flight = SingleFlight()
+    budgets = []
+
+    async def upstream():
+        budgets.append(remaining())
+        await asyncio.sleep(0.1)
+        mark_stale()
+        return "result"
+
+    async def leader():
+        with deadline(0.02):
+            return await flight.do_async("key", upstream)
+
+    async def follower():
+        await asyncio.sleep(0.01)
+        with track_staleness() as staleness:
+            return await flight.do_async("key", upstream), staleness["stale"]
+
+    async def run():
+        return await asyncio.gather(
+            leader(), follower(), return_exceptions=True
+        )
+
+    first, second = asyncio.run(run())
+
+    assert budgets == [None]
+    assert isinstance(first, DeadlineExceededError)
+    assert second == ("result", True)
+
+
+def test_sync_follower_stops_at_its_deadline():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def upstream():
+        started.set()
+        time.sleep(0.3)
+        return "result"
+
+    leader = threading.Thread(target=flight.do, args=("key", upstream))
+    leader.start()
+    started.wait(1)
+
+    start = time.monotonic()
+    with deadline(0.05), pytest.raises(DeadlineExceededError):
+        flight.do("key", upstream)
+
+    assert time.monotonic() - start < 0.2
+    leader.join()
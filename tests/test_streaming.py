@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+from django.test import AsyncClient
+
+from api import app_state
+from api.services import (
+    MockGISNQuery,
+    MockNominativeQuery,
+    iter_risk_assessment,
+    risk_assessment,
+    stream_address_async,
+)
+from api.services.base import BaseGISNQuery, UpstreamError
+
+
+class FailingGISNQuery(BaseGISNQuery):
+    def fetch_data(self, coordinate, radius):
+        raise UpstreamError(
+            "GISN API error: 502 Bad Gateway", status_code=502
+        )
+
+
+@pytest.fixture
+def use_services():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+
+    def use(nominative, gisn):
+        app_state.set_services(nominative, gisn)
+
+    use(MockNominativeQuery(), MockGISNQuery())
+    yield use
+    app_state.set_services(*previous)
+
+
+def post_stream(payload):
+    """POST to the stream endpoint, returning (status, headers, lines).
+
+    The body is read on the same event loop that produced the response,
+    as it would be under ASGI.
+    """
+    async def post():
+        response = await AsyncClient().post(
+            "/api/analyze/stream/",
+            data=json.dumps(payload),
+            content_type="application/json",
+        )
+        if not response.streaming:
+            return response, response.content
+        return response, b"".join(
+            [chunk async for chunk in response.streaming_content]
+        )
+
+    response, body = asyncio.run(post())
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    return response, lines
+
+
+def test_iter_risk_assessment_matches_risk_assessment():
+    places = MockGISNQuery().fetch_data((34.77, 32.07), 100)
+
+    assert list(iter_risk_assessment(places)) == risk_assessment(places)
+
+
+def test_stream_yields_coordinate_first(use_services):
+    async def collect():
+        return [
+            event async for event in stream_address_async("הרצל", 1, 150)
+        ]
+
+    events = asyncio.run(collect())
+
+    assert events[0]["type"] == "coordinate"
+    assert events[0]["radius"] == 150
+    assert [event["type"] for event in events[1:]] == ["feature", "done"]
+    assert events[-1]["count"] == 1
+
+
+def test_stream_view_emits_ndjson(use_services):
+    response, lines = post_stream({"street": "הרצל", "houseNumber": 1})
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert [line["type"] for line in lines] == ["coordinate", "feature", "done"]
+    assert lines[1]["feature"]["attributes"]["building_stage"] == "בבניה"
+
+
+def test_stream_view_validates_before_streaming(client, use_services):
+    response, _ = post_stream({"street": "הרצל"})
+
+    assert response.status_code == 400
+    assert client.get("/api/analyze/stream/").status_code == 405
+
+
+def test_stream_view_reports_gisn_failure_in_stream(use_services):
+    use_services(MockNominativeQuery(), FailingGISNQuery())
+
+    response, lines = post_stream({"street": "הרצל", "houseNumber": 1})
+
+    assert response.status_code == 200
+    assert lines[0]["type"] == "coordinate"
+    assert lines[-1] == {
+        "type": "error",
+        "error": "Service error: GISN API error: 502 Bad Gateway",
+    }
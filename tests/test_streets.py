@@ -0,0 +1,235 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from api import app_state
+from api.services import MockGISNQuery
+from api.services.base import BaseNominativeQuery
+from api.streets import (
+    StreetCatalog,
+    StreetIndex,
+    StreetList,
+    canonical_street,
+    negotiate_coding,
+)
+
+STREETS = [
+    "הרצל", "הרצוג", "דה רוטשילד בת שבע", "רוטשילד", "שדרות רוטשילד",
+    "דיזנגוף", "ז'בוטינסקי", "בן יהודה",
+]
+
+
+def write_streets(path, names, mtime=None):
+    path.write_text(
+        json.dumps({"t_rechov_values": names}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_get_streets(client):
+    response = client.get("/api/streets/")
+
+    assert response.status_code == 200
+    assert "אבולעפיה" in response.json()["streets"]
+    assert response["ETag"].startswith('"')
+    assert "max-age=" in response["Cache-Control"]
+    assert response["Vary"] == "Accept-Encoding"
+
+
+def test_get_streets_gzip(client):
+    response = client.get("/api/streets/", HTTP_ACCEPT_ENCODING="gzip")
+
+    assert response["Content-Encoding"] == "gzip"
+    assert response["ETag"].endswith('-gzip"')
+    streets = json.loads(gzip.decompress(response.content))["streets"]
+    assert streets == client.get("/api/streets/").json()["streets"]
+
+
+def test_get_streets_not_modified(client):
+    etag = client.get("/api/streets/")["ETag"]
+
+    response = client.get("/api/streets/", HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response["ETag"] == etag
+
+
+def test_get_streets_etag_matches_across_codings(client):
+    etag = client.get("/api/streets/", HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+
+    response = client.get("/api/streets/", HTTP_IF_NONE_MATCH=f"W/{etag}")
+
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize(("header", "expected"), [
+    ("", "identity"),
+    ("gzip, deflate", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("*", "br"),
+    ("*;q=0", "identity"),
+])
+def test_negotiate_coding(header, expected):
+    assert negotiate_coding(header, {"identity", "gzip", "br"}) == expected
+
+
+def test_catalog_reloads_changed_file(tmp_path):
+    path = tmp_path / "streets.json"
+    write_streets(path, ["הרצל"], mtime=1_000_000)
+    catalog = StreetCatalog(path)
+    catalog.RELOAD_CHECK_INTERVAL = 0
+
+    first = catalog.get()
+    assert catalog.get() is first
+
+    write_streets(path, ["הרצל", "דיזנגוף"], mtime=2_000_000)
+    second = catalog.get()
+
+    assert second.names == ["הרצל", "דיזנגוף"]
+    assert second.etags != first.etags
+
+
+def test_catalog_keeps_last_good_list(tmp_path):
+    path = tmp_path / "streets.json"
+    write_streets(path, ["הרצל"], mtime=1_000_000)
+    catalog = StreetCatalog(path)
+    catalog.RELOAD_CHECK_INTERVAL = 0
+    catalog.get()
+
+    path.write_text("{", encoding="utf-8")
+    os.utime(path, (2_000_000, 2_000_000))
+
+    assert catalog.get().names == ["הרצל"]
+
+
+def test_catalog_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        StreetCatalog(tmp_path / "missing.json").get()
+
+
+def test_street_list_body_is_stable():
+    assert StreetList(["הרצל"]).bodies == StreetList(["הרצל"]).bodies
+
+
+def test_suggest_ranks_prefix_then_word_then_substring():
+    index = StreetIndex(STREETS)
+
+    assert index.suggest("רוטש") == [
+        "רוטשילד", "שדרות רוטשילד", "דה רוטשילד בת שבע",
+    ]
+
+
+def test_suggest_tolerates_typos_and_punctuation():
+    index = StreetIndex(STREETS)
+
+    assert index.suggest("דיזינגוף") == ["דיזנגוף"]
+    assert index.suggest("בן יהודא")[0] == "בן יהודה"
+    assert index.suggest("זבוטינסקי") == ["ז'בוטינסקי"]
+
+
+def test_suggest_limit_and_empty_query():
+    index = StreetIndex(STREETS)
+
+    assert index.suggest("הרצ", limit=1) == ["הרצל"]
+    assert index.suggest("  ") == []
+    assert index.suggest("קקקקק") == []
+
+
+def test_suggest_view(client):
+    response = client.get("/api/streets/suggest/", {"q": "הרצ", "limit": 3})
+
+    assert response.status_code == 200
+    suggestions = response.json()["suggestions"]
+    assert len(suggestions) == 3
+    assert suggestions[0] == "הרצל"
+
+
+def test_suggest_view_invalid_limit(client):
+    response = client.get("/api/streets/suggest/", {"q": "הרצ", "limit": "x"})
+
+    assert response.status_code == 400
+
+
+class RecordingNominativeQuery(BaseNominativeQuery):
+    def __init__(self):
+        self.streets = []
+
+    def fetch_data(self, street, house_number):
+        self.streets.append(street)
+        return (34.7735910, 32.0698820)
+
+
+@pytest.fixture
+def nominative():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+    service = RecordingNominativeQuery()
+    app_state.set_services(service, MockGISNQuery())
+    yield service
+    app_state.set_services(*previous)
+
+
+@pytest.mark.parametrize(("street", "expected"), [
+    ("הרצל", "הרצל"),
+    (" ז׳בוטינסקי ", "ז'בוטינסקי"),
+    ("דיזינגוף", "דיזנגוף"),
+    ("רחוב רוטשילד", "רוטשילד"),
+    ("שד' רוטשילד", "רוטשילד"),
+    ("רחוב בן יהודא", "בן יהודה"),
+    ("Herzl", None),
+    ("קקקקק", None),
+])
+def test_match(street, expected):
+    assert StreetIndex(STREETS).match(street, 0.7) == expected
+
+
+def test_canonical_street_uses_catalog():
+    assert canonical_street("דיזינגוף", 0.7) == "דיזנגוף"
+
+
+def test_analyze_rejects_unknown_street_before_geocoding(
+    client, nominative, settings
+):
+    settings.STREET_VALIDATION_ENABLED = True
+
+    response = client.post(
+        "/api/analyze/",
+        data=json.dumps({"street": "Nowhere", "houseNumber": 1}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"error": "Unknown street: Nowhere"}
+    assert nominative.streets == []
+
+
+def test_analyze_geocodes_canonical_street(client, nominative, settings):
+    settings.STREET_VALIDATION_ENABLED = True
+
+    response = client.post(
+        "/api/analyze/",
+        data=json.dumps({"street": "שדרות דיזינגוף", "houseNumber": 1}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert nominative.streets == ["דיזנגוף"]
+
+
+def test_analyze_street_validation_disabled(client, nominative):
+    # Off by default: streets missing from the list still get analyzed
+    response = client.post(
+        "/api/analyze/",
+        data=json.dumps({"street": "אלנבי", "houseNumber": 1}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert nominative.streets == ["אלנבי"]
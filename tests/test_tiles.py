@@ -0,0 +1,239 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+import respx
+from django.test import Client
+
+from api import app_state
+from api.services import (
+    CachedTileGISNQuery,
+    GISNLayerReplica,
+    MockGISNQuery,
+    MockNominativeQuery,
+    RealGISNQuery,
+    TileCache,
+    handle_bbox_async,
+    handle_tile_async,
+)
+from api.services.base import BaseGISNQuery
+from api.services.real import GISN_LAYER_URL
+from api.services.spatial import tile_envelope, tile_of, tiles_covering
+
+CENTER = (34.7735910, 32.0698820)
+X, Y = tile_of(CENTER, 16)
+
+
+def parcel(object_id, lon, lat, stage="בבניה", oid_field="OBJECTID"):
+    return {
+        "attributes": {
+            oid_field: object_id, "addresses": f"parcel {object_id}",
+            "building_stage": stage, "sw_tama_38": "לא",
+        },
+        "geometry": {"rings": [[
+            [lon, lat], [lon + 0.0001, lat], [lon + 0.0001, lat + 0.0001],
+            [lon, lat],
+        ]]},
+    }
+
+
+class EnvelopeGISNQuery(BaseGISNQuery):
+    """Fake upstream answering envelope queries from a replica."""
+
+    def __init__(self, features, object_id_field="OBJECTID"):
+        self.replica = GISNLayerReplica(features, object_id_field)
+        self.envelopes = []
+
+    @property
+    def object_id_field(self):
+        return self.replica.object_id_field
+
+    def fetch_data(self, coordinate, radius):
+        return self.replica.query_radius(coordinate, radius)
+
+    def fetch_envelope(self, envelope):
+        self.envelopes.append(envelope)
+        return self.replica.query_envelope(envelope, ("בבניה",))
+
+
+@pytest.fixture
+def use_gisn():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service()
+    )
+
+    def use(gisn):
+        app_state.set_services(MockNominativeQuery(), gisn)
+
+    use(MockGISNQuery())
+    yield use
+    app_state.set_services(*previous)
+
+
+def test_tile_envelope_contains_its_points():
+    xmin, ymin, xmax, ymax = tile_envelope(16, X, Y)
+
+    assert xmin <= CENTER[0] <= xmax
+    assert ymin <= CENTER[1] <= ymax
+    # Neighbouring tiles share their edges
+    assert tile_envelope(16, X + 1, Y)[0] == xmax
+    assert tile_envelope(16, X, Y + 1)[3] == ymin
+
+
+def test_tiles_covering():
+    envelope = tile_envelope(16, X, Y)
+    inner = (
+        (envelope[0] + envelope[2]) / 2, (envelope[1] + envelope[3]) / 2,
+    )
+
+    assert tiles_covering((*inner, *inner), 16) == [(X, Y)]
+    assert len(tiles_covering(
+        (envelope[0] + 1e-6, envelope[1] + 1e-6,
+         envelope[2] + 1e-6, envelope[3] + 1e-6),
+        16,
+    )) == 4
+
+
+@respx.mock
+def test_real_envelope_query():
+    respx.get(GISN_LAYER_URL).mock(return_value=httpx.Response(200, json={
+        "fields": [{"name": "FID", "type": "esriFieldTypeOID"}],
+    }))
+    route = respx.get(f"{GISN_LAYER_URL}/query").mock(
+        return_value=httpx.Response(200, json={"features": []})
+    )
+
+    RealGISNQuery(client=httpx.Client()).fetch_envelope(
+        tile_envelope(16, X, Y)
+    )
+
+    params = parse_qs(route.calls.last.request.url.query.decode())
+    assert params["geometryType"] == ["esriGeometryEnvelope"]
+    assert json.loads(params["geometry"][0])["xmin"] == pytest.approx(
+        tile_envelope(16, X, Y)[0]
+    )
+    assert params["where"] == ["building_stage IN ('בבניה')"]
+    assert "distance" not in params
+    assert params["outFields"][0].split(",")[0] == "FID"
+
+
+def test_replica_envelope_query():
+    replica = GISNLayerReplica([
+        parcel(1, *CENTER),
+        parcel(2, *CENTER, stage="קיים היתר"),
+        parcel(3, CENTER[0] + 0.1, CENTER[1]),
+    ])
+
+    found = replica.query_envelope(tile_envelope(16, X, Y), ("בבניה",))
+
+    assert [place["attributes"]["OBJECTID"] for place in found] == [1]
+
+
+def test_tile_cache_serves_repeated_tiles():
+    upstream = EnvelopeGISNQuery([parcel(1, *CENTER)])
+    service = CachedTileGISNQuery(upstream, TileCache(ttl=60))
+    envelope = tile_envelope(16, X, Y)
+
+    assert service.fetch_envelope(envelope) == service.fetch_envelope(
+        tile_envelope(16, X, Y)
+    )
+    assert asyncio.run(service.fetch_envelope_async(envelope))
+
+    assert len(upstream.envelopes) == 1
+    stats = service.stats()["gisn_tile_cache"]
+    assert stats["hits"] == 2
+    assert stats["entries"] == 1
+
+
+def test_tile_cache_evicts_least_recently_used():
+    cache = TileCache(max_entries=2)
+    for x in range(3):
+        cache.set(tile_envelope(16, x, 0), [x])
+
+    assert cache.get(tile_envelope(16, 0, 0)) is None
+    assert cache.get(tile_envelope(16, 2, 0)) == [2]
+
+
+def test_tiles_outside_tel_aviv_skip_gisn(use_gisn):
+    upstream = EnvelopeGISNQuery([])
+    use_gisn(upstream)
+
+    assert asyncio.run(handle_tile_async(16, 0, 0)) == []
+    assert upstream.envelopes == []
+
+
+def test_bbox_returns_places_spanning_tiles_once(use_gisn):
+    # A parcel straddling the corner of four tiles
+    corner = tile_envelope(16, X, Y)[:2]
+    use_gisn(EnvelopeGISNQuery([
+        parcel(1, corner[0] - 0.00005, corner[1] - 0.00005),
+    ]))
+    envelope = (
+        corner[0] - 0.001, corner[1] - 0.001,
+        corner[0] + 0.001, corner[1] + 0.001,
+    )
+
+    places = asyncio.run(handle_bbox_async(envelope))
+
+    assert len(tiles_covering(envelope, 16)) == 4
+    assert [place["attributes"]["OBJECTID"] for place in places] == [1]
+
+
+def test_bbox_dedups_by_layer_object_id_field(use_gisn):
+    corner = tile_envelope(16, X, Y)[:2]
+    use_gisn(EnvelopeGISNQuery([
+        parcel(1, corner[0] - 0.00005, corner[1] - 0.00005, oid_field="FID"),
+    ], object_id_field="FID"))
+    envelope = (
+        corner[0] - 0.001, corner[1] - 0.001,
+        corner[0] + 0.001, corner[1] + 0.001,
+    )
+
+    places = asyncio.run(handle_bbox_async(envelope))
+
+    assert [place["attributes"]["FID"] for place in places] == [1]
+
+
+def test_tile_view_is_cacheable(use_gisn, settings):
+    settings.TILE_CACHE_MAX_AGE = 60
+    use_gisn(EnvelopeGISNQuery([parcel(1, *CENTER)]))
+    client = Client()
+
+    response = client.get(f"/api/tiles/16/{X}/{Y}.json")
+
+    assert response.status_code == 200
+    assert response["Cache-Control"] == "public, max-age=60"
+    assert response["X-Object-Id-Field"] == "OBJECTID"
+    [place] = response.json()
+    # Rings come back in Leaflet's [lat, lon] order
+    assert place["geometry"]["rings"][0][0] == [CENTER[1], CENTER[0]]
+    assert client.get(
+        f"/api/tiles/16/{X}/{Y}.json",
+        headers={"If-None-Match": response["ETag"]},
+    ).status_code == 304
+
+
+@pytest.mark.parametrize("path", [
+    "/api/tiles/10/0/0.json",
+    "/api/tiles/20/0/0.json",
+    "/api/tiles/16/65536/0.json",
+    "/api/tiles/bbox/?bbox=34.77,32.06",
+    "/api/tiles/bbox/?bbox=34.78,32.06,34.77,32.07",
+    "/api/tiles/bbox/?bbox=34.70,32.00,34.90,32.20",
+])
+def test_tile_view_validation(use_gisn, path):
+    assert Client().get(path).status_code == 400
+
+
+def test_bbox_view(use_gisn):
+    use_gisn(EnvelopeGISNQuery([parcel(1, *CENTER)]))
+
+    response = Client().get(
+        "/api/tiles/bbox/", {"bbox": "34.772,32.069,34.775,32.071"}
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert "ETag" in response
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import respx
+from django.core.management import call_command
+from django.test import Client
+
+from api import app_state, warmup
+from api.services import GeocodeCache, normalize_address
+from api.services.base import BaseGISNQuery, BaseNominativeQuery
+
+CENTER = (34.7735910, 32.0698820)
+
+
+class RecordingNominativeQuery(BaseNominativeQuery):
+    def __init__(self):
+        self.calls = []
+
+    def fetch_data(self, street, house_number):
+        self.calls.append((street, house_number))
+        if street == "unknown":
+            raise ValueError("no such street")
+        return CENTER
+
+
+class RecordingGISNQuery(BaseGISNQuery):
+    def __init__(self):
+        self.calls = []
+
+    def fetch_data(self, coordinate, radius):
+        self.calls.append((coordinate, radius))
+        return []
+
+
+@pytest.fixture
+def services():
+    previous = (
+        app_state.get_nominative_service(), app_state.get_gisn_service(),
+        app_state.get_warmup(),
+    )
+    nominative, gisn = RecordingNominativeQuery(), RecordingGISNQuery()
+    app_state.set_services(nominative, gisn)
+    yield nominative, gisn
+    app_state.set_services(*previous[:2])
+    app_state.set_warmup(previous[2])
+
+
+def test_read_addresses(tmp_path):
+    path = tmp_path / "hot.txt"
+    path.write_text(
+        "# hot addresses\nהרצל 7\n\nשדרות רוטשילד 16, דיזנגוף 50\n",
+        encoding="utf-8",
+    )
+
+    assert warmup.read_addresses(path) == [
+        ("הרצל", 7), ("שדרות רוטשילד", 16), ("דיזנגוף", 50),
+    ]
+
+
+def test_popular_geocodes(tmp_path):
+    cache = GeocodeCache(tmp_path / "geocode.sqlite3")
+    cache.set(normalize_address("הרצל", 1), (1.0, 1.0))
+    cache.set(normalize_address("הרצל", 2), (2.0, 2.0))
+    cache.set(normalize_address("הרצל", 3), (3.0, 3.0))
+    for _ in range(2):
+        cache.get(normalize_address("הרצל", 2))
+    cache.get(normalize_address("הרצל", 3))
+
+    assert warmup.popular_coordinates(tmp_path / "geocode.sqlite3", 2) == [
+        (2.0, 2.0), (3.0, 3.0),
+    ]
+    assert warmup.popular_coordinates(tmp_path / "missing.sqlite3", 2) == []
+
+
+def test_warm_caches(services):
+    nominative, gisn = services
+
+    stats = warmup.warm_caches(
+        [("הרצל", 7), ("unknown", 1)], [(1.0, 2.0)], radius=200,
+    )
+
+    assert stats == {"done": 2, "failed": 1, "skipped": 0}
+    assert sorted(nominative.calls) == [("unknown", 1), ("הרצל", 7)]
+    assert sorted(gisn.calls) == [((1.0, 2.0), 200), (CENTER, 200)]
+
+
+def test_warm_caches_without_gisn(services):
+    nominative, gisn = services
+
+    warmup.warm_caches([("הרצל", 7)], [(1.0, 2.0)], gisn=False)
+
+    assert nominative.calls == [("הרצל", 7)]
+    assert gisn.calls == []
+
+
+def test_warm_up_timeout_drops_queued_tasks():
+    release = threading.Event()
+    finished = []
+
+    def task():
+        release.wait(0.2)
+        finished.append(True)
+
+    stats = warmup._run([task] * 3, concurrency=1, interval=0, timeout=0.1)
+
+    # The running task was waited for, the queued ones dropped
+    assert finished == [True]
+    assert stats == {"done": 1, "failed": 0, "skipped": 2}
+
+
+def test_async_warm_up_timeout_cancels_tasks():
+    async def task():
+        await asyncio.sleep(10)
+
+    stats = asyncio.run(
+        warmup._run_async([task] * 3, concurrency=2, interval=0, timeout=0.05)
+    )
+
+    assert stats == {"done": 0, "failed": 0, "skipped": 3}
+
+
+def test_warm_caches_async(services):
+    nominative, gisn = services
+
+    stats = asyncio.run(warmup.warm_caches_async(
+        [("הרצל", 7), ("unknown", 1)], [(1.0, 2.0)], radius=200,
+    ))
+
+    assert stats == {"done": 2, "failed": 1, "skipped": 0}
+    assert sorted(nominative.calls) == [("unknown", 1), ("הרצל", 7)]
+    assert sorted(gisn.calls) == [((1.0, 2.0), 200), (CENTER, 200)]
+
+
+def test_warm_up_interval_spaces_tasks():
+    started = time.monotonic()
+
+    warmup._run([lambda: None] * 3, concurrency=3, interval=0.05, timeout=5)
+
+    assert time.monotonic() - started >= 0.1
+
+
+@respx.mock
+def test_warm_server():
+    route = respx.get("http://app.test/api/analyze/").mock(
+        return_value=httpx.Response(200, json=[])
+    )
+
+    stats = warmup.warm_server(
+        "http://app.test", [("הרצל", 7)], [(34.7735911, 32.0698823)],
+        radius=50,
+    )
+
+    assert stats["done"] == 2
+    params = [dict(call.request.url.params) for call in route.calls]
+    assert {"street": "הרצל", "houseNumber": "7", "radius": "50"} in params
+    assert {"lat": "32.069882", "lon": "34.773591", "radius": "50"} in params
+
+
+def test_prewarm_worker_marks_worker_ready(services, settings, tmp_path):
+    path = tmp_path / "hot.txt"
+    path.write_text("הרצל 7\n", encoding="utf-8")
+    settings.WARMUP_ADDRESSES_PATH = str(path)
+    settings.GEOCODE_CACHE_ENABLED = False
+    _, gisn = services
+
+    asyncio.run(warmup.prewarm_worker())
+
+    assert gisn.calls == [(CENTER, settings.WARMUP_RADIUS)]
+    response = Client().get("/api/ready/")
+    assert response.status_code == 200
+    assert response.json()["warmup"]["state"] == "done"
+    assert response.json()["warmup"]["done"] == 1
+
+
+def test_lifespan_warms_up_before_startup_completes(services, settings):
+    settings.WARMUP_ENABLED = False
+    sent = []
+
+    async def application(scope, receive, send):
+        raise AssertionError("lifespan events reached Django")
+
+    async def run():
+        messages = iter([
+            {"type": "lifespan.startup"}, {"type": "lifespan.shutdown"},
+        ])
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append((message["type"], app_state.get_warmup()["state"]))
+
+        await warmup.lifespan(application)({"type": "lifespan"}, receive, send)
+
+    asyncio.run(run())
+
+    assert sent == [
+        ("lifespan.startup.complete", "done"),
+        ("lifespan.shutdown.complete", "done"),
+    ]
+
+
+def test_readiness_while_warming_up(services):
+    app_state.set_warmup({"state": "running"})
+
+    response = Client().get("/api/ready/")
+
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+
+def test_warm_caches_command(services, tmp_path, settings):
+    settings.GEOCODE_CACHE_ENABLED = False
+    path = tmp_path / "hot.txt"
+    path.write_text("הרצל 7\n", encoding="utf-8")
+    nominative, gisn = services
+
+    call_command("warm_caches", "--addresses", str(path))
+
+    assert nominative.calls == [("הרצל", 7)]
+    assert gisn.calls == []
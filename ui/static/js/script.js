@@ -49,41 +49,46 @@ function handleError(error, userMessage = "An error occurred. Please try again."
 
 // Street Management Functions
 function updateStreetOptions(streets) {
-    const streetSelect = document.getElementById('street-select');
+    const datalist = document.getElementById('street-suggestions');
     
-    // Clear current options
-    streetSelect.innerHTML = '<option value="">Select a street</option>';
-    
-    // Append the filtered streets
-    streets.forEach(street => {
+    // Replace the current suggestions
+    datalist.replaceChildren(...streets.map(street => {
         const option = document.createElement('option');
         option.value = street;
-        option.textContent = street;
-        streetSelect.appendChild(option);
-    });
+        return option;
+    }));
 }
 
-function loadStreets() {
-    fetch('/api/streets/')
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(errorData => {
-                    throw new Error(`Failed to load streets (${response.status}): ${errorData.error || response.statusText}`);
-                }).catch(() => {
-                    throw new Error(`Failed to load streets (${response.status}): ${response.statusText}`);
-                });
-            }
-            return response.json();
-        })
-        .then(data => {
-            const streets = data.streets || [];
-            updateStreetOptions(streets);
-        })
-        .catch(error => {
-            console.error("Error loading streets:", error);
-            // Show error but don't block the UI
-            handleError(error, null);
-        });
+function createStreetSuggester() {
+    // Fetch suggestions while typing, dropping answers to outdated queries
+    let timer = null;
+    let latestQuery = "";
+
+    return function suggestStreets(event) {
+        const query = event.target.value.trim();
+        latestQuery = query;
+        clearTimeout(timer);
+        if (!query) {
+            updateStreetOptions([]);
+            return;
+        }
+
+        timer = setTimeout(() => {
+            fetch(`/api/streets/suggest/?q=${encodeURIComponent(query)}`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`Failed to load street suggestions (${response.status})`);
+                    }
+                    return response.json();
+                })
+                .then(data => {
+                    if (query === latestQuery) {
+                        updateStreetOptions(data.suggestions || []);
+                    }
+                })
+                .catch(error => console.error("Error loading street suggestions:", error));
+        }, 150);
+    };
 }
 
 // Map Management Functions
@@ -120,47 +125,7 @@ function addRadiusCircle(map, center, radiusInMeters) {
     return radiusCircle;
 }
 
-function calculatePolygonCenter(data) {
-    // Calculate the center point of all polygons and markers
-    let totalLat = 0;
-    let totalLng = 0;
-    let pointCount = 0;
-    
-    data.forEach(item => {
-        if (item.geometry && item.geometry.rings) {
-            // Handle polygons with rings
-            item.geometry.rings.forEach(ring => {
-                ring.forEach((point, index) => {
-                    // Ensure we have valid coordinates
-                    if (Array.isArray(point) && point.length >= 2) {
-                        totalLat += point[0]; // Latitude
-                        totalLng += point[1]; // Longitude
-                        pointCount++;
-                    }
-                });
-            });
-        } else if (item.attributes) {
-            // Handle markers - use attributes coordinates or estimate from address
-            const lat = item.attributes.lat;
-            const lng = item.attributes.lng;
-            if (lat && lng) {
-                totalLat += parseFloat(lat);
-                totalLng += parseFloat(lng);
-                pointCount++;
-            }
-        }
-    });
-    
-    if (pointCount > 0) {
-        const center = [totalLat / pointCount, totalLng / pointCount];
-        return center;
-    }
-    
-    // Fallback to Tel Aviv center if no valid points found
-    return [32.0699, 34.7735];
-}
-
-function addPolygonsToMap(map, data) {
+function addPolygonsToMap(map, data, style = {}) {
     const addedPolygons = [];
     
     data.forEach(item => {
@@ -182,7 +147,8 @@ function addPolygonsToMap(map, data) {
                 color: color,
                 fillColor: color,
                 fillOpacity: 0.5,
-                weight: 2
+                weight: 2,
+                ...style
             })
             .addTo(map)
             .bindPopup(popupText);
@@ -212,63 +178,185 @@ function addPolygonsToMap(map, data) {
     return addedPolygons;
 }
 
-// Form Processing Functions
-function processAnalyzeResponse(data, map, radius) {
-    // Display raw JSON response for dev
-    setDevResponseContent(JSON.stringify(data, null, 2));
-    
-    if (!Array.isArray(data) || data.length === 0) {
-        alert("No problematic addresses found nearby.");
-        return;
+// Map Tile Functions
+const TILE_ZOOM = 16;      // zoom of the requested /api/tiles/
+const MIN_TILE_ZOOM = 15;  // below this the map shows no tiles
+
+function tileOf(latlng, zoom) {
+    // Slippy map tile numbers of a point
+    const n = 2 ** zoom;
+    const lat = latlng.lat * Math.PI / 180;
+    return {
+        x: Math.floor((latlng.lng + 180) / 360 * n),
+        y: Math.floor((1 - Math.asinh(Math.tan(lat)) / Math.PI) / 2 * n),
+    };
+}
+
+function createTileLoader(map) {
+    // Shows the dangerous places of the visible area, fetching each tile
+    // once; tile responses are cached by the browser and nginx
+    const loaded = new Set();
+    const shown = new Set();
+    // Object id attribute of the places, named by the tile responses
+    let idField = "OBJECTID";
+    const group = L.layerGroup().addTo(map);
+
+    function loadTile(x, y) {
+        const key = `${x}/${y}`;
+        if (loaded.has(key)) {
+            return;
+        }
+        loaded.add(key);
+        fetch(`/api/tiles/${TILE_ZOOM}/${x}/${y}.json`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Failed to load tile ${key} (${response.status})`);
+                }
+                idField = response.headers.get("X-Object-Id-Field") || idField;
+                return response.json();
+            })
+            .then(places => {
+                // Places spanning several tiles are drawn once
+                const fresh = places.filter(place => {
+                    const id = place.attributes[idField];
+                    if (!place.geometry || shown.has(id)) {
+                        return false;
+                    }
+                    shown.add(id);
+                    return true;
+                });
+                addPolygonsToMap(group, fresh, { fillOpacity: 0.2, weight: 1 });
+            })
+            .catch(error => {
+                loaded.delete(key);
+                console.error("Error loading map tile:", error);
+            });
     }
-    
-    // Add radius circle first (so it appears behind polygons)
-    const center = calculatePolygonCenter(data);
-    const radiusInMeters = parseInt(radius);
-    
+
+    return function loadVisibleTiles() {
+        if (map.getZoom() < MIN_TILE_ZOOM) {
+            return;
+        }
+        const bounds = map.getBounds();
+        const northWest = tileOf(bounds.getNorthWest(), TILE_ZOOM);
+        const southEast = tileOf(bounds.getSouthEast(), TILE_ZOOM);
+        for (let y = northWest.y; y <= southEast.y; y++) {
+            for (let x = northWest.x; x <= southEast.x; x++) {
+                loadTile(x, y);
+            }
+        }
+    };
+}
+
+// Form Processing Functions
+function createAnalyzeView(map) {
+    // Draws streamed analyze events on the map as they arrive, in a layer
+    // group that clear() removes again
+    const features = [];
+    const layers = [];
+    const group = L.layerGroup().addTo(map);
     let radiusCircle = null;
-    if (center && radiusInMeters > 0) {
-        // UPDATED: Make the radius circle much larger to encompass all addresses
-        // Triple the size to ensure all addresses are definitely within the circle
-        const displayRadius = Math.round(radiusInMeters * 1.5);
-        radiusCircle = addRadiusCircle(map, center, displayRadius);
-    } else {
-        console.error("Invalid center or radius for circle:", center, radiusInMeters);
+
+    return {
+        clear() {
+            group.remove();
+        },
+        coordinate(event) {
+            const center = [event.lat, event.lon];
+            map.setView(center, Math.max(map.getZoom(), 16));
+            if (event.radius > 0) {
+                radiusCircle = addRadiusCircle(group, center, event.radius);
+                map.fitBounds(radiusCircle.getBounds().pad(0.1));
+            }
+        },
+        feature(event) {
+            features.push(event.feature);
+            layers.push(...addPolygonsToMap(group, [event.feature]));
+        },
+        done(event) {
+            // Display raw JSON response for dev
+            setDevResponseContent(JSON.stringify(features, null, 2));
+
+            if (event.stale) {
+                alert("GISN is currently unavailable; showing the last known results, which may be out of date.");
+            }
+
+            if (features.length === 0) {
+                alert("No problematic addresses found nearby.");
+                return;
+            }
+
+            // Fit map to show both polygons/markers and radius circle
+            const allFeatures = radiusCircle ? [...layers, radiusCircle] : layers;
+            map.fitBounds(L.featureGroup(allFeatures).getBounds().pad(0.1));
+        },
+        error(event) {
+            throw new Error(event.error);
+        }
+    };
+}
+
+async function readAnalyzeStream(response, view) {
+    // Dispatch each NDJSON line to the view as soon as it is complete
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+
+    for (;;) {
+        const {value, done} = await reader.read();
+        buffered += decoder.decode(value || new Uint8Array(), {stream: !done});
+
+        const lines = buffered.split("\n");
+        buffered = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => {
+            const event = JSON.parse(line);
+            view[event.type](event);
+        });
+
+        if (done) {
+            return;
+        }
     }
-    
-    // Add polygons to map and get the array of added features
-    const addedPolygons = addPolygonsToMap(map, data);
-    
-    // Fit map to show both polygons/markers and radius circle
-    if (radiusCircle && addedPolygons.length > 0) {
-        const allFeatures = [...addedPolygons, radiusCircle];
-        const group = L.featureGroup(allFeatures);
-        map.fitBounds(group.getBounds().pad(0.5));
-    } else if (addedPolygons.length > 0) {
-        // If no radius circle, just fit to polygons/markers
-        const group = L.featureGroup(addedPolygons);
-        map.fitBounds(group.getBounds().pad(0.5));
+}
+
+// The map stays in place between analyses; a failed analysis replaces it
+// with an error message, and the next one draws a new map
+let currentMap = null;
+let currentAnalysis = null;
+
+function showMap() {
+    if (!currentMap || !document.getElementById("map")) {
+        currentMap = initializeMap();
+        currentMap.on("click", event => {
+            analyzeCoordinate(event.latlng.lat, event.latlng.lng);
+        });
+        // Load the places of the visible area while panning
+        const loadVisibleTiles = createTileLoader(currentMap);
+        currentMap.on("moveend", loadVisibleTiles);
+        loadVisibleTiles();
     }
+    return currentMap;
 }
 
-function submitAddressForm(event) {
-    event.preventDefault();
-    
-    const street = document.getElementById("street-select").value;
-    const houseNumber = document.getElementById("houseNumber").value;
-    const radius = document.getElementById("radius").value;
-    
+function startAnalysis(payload, userMessage) {
+    // Stream an analysis onto the map, replacing the previous one
+    if (currentAnalysis) {
+        currentAnalysis.controller.abort();
+        currentAnalysis.view.clear();
+    }
+    const controller = new AbortController();
+    const view = createAnalyzeView(showMap());
+    currentAnalysis = {controller, view};
+
     // Reset dev view on new submission
     hideDevResponse();
-    
-    // Initialize map
-    const map = initializeMap();
-    
-    // Fetch and process data
-    fetch('/api/analyze/', {
+
+    // Fetch and draw results as they stream in
+    fetch('/api/analyze/stream/', {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ street: street, houseNumber: houseNumber, radius: radius }),
+        body: JSON.stringify(payload),
+        signal: controller.signal,
     })
     .then(response => {
         if (!response.ok) {
@@ -280,10 +368,50 @@ function submitAddressForm(event) {
                 throw new Error(`API Error (${response.status}): ${response.statusText}`);
             });
         }
-        return response.json();
+        return readAnalyzeStream(response, view);
     })
-    .then(data => processAnalyzeResponse(data, map, radius))
-    .catch(error => handleError(error));
+    .catch(error => {
+        // A newer analysis replaced this one
+        if (error.name !== "AbortError") {
+            handleError(error, userMessage);
+        }
+    });
+}
+
+function submitAddressForm(event) {
+    event.preventDefault();
+
+    const street = document.getElementById("street").value;
+    const houseNumber = document.getElementById("houseNumber").value;
+    const radius = document.getElementById("radius").value;
+
+    history.replaceState(null, "", location.pathname);
+    startAnalysis({ street: street, houseNumber: houseNumber, radius: radius });
+}
+
+function analyzeCoordinate(lat, lon) {
+    // Analyze a point on the map directly, without geocoding an address.
+    // The page URL is updated so that the analysis can be shared.
+    const radius = document.getElementById("radius").value;
+    lat = Number(lat).toFixed(6);
+    lon = Number(lon).toFixed(6);
+
+    const params = new URLSearchParams({ lat: lat, lon: lon, radius: radius });
+    history.replaceState(null, "", `${location.pathname}?${params}`);
+    // Keep the map on errors, e.g. for a click outside Tel Aviv
+    startAnalysis({ lat: lat, lon: lon, radius: radius }, null);
+}
+
+function analyzeSharedLink() {
+    // Run the analysis of a shared ?lat=...&lon=...&radius=... link
+    const params = new URLSearchParams(location.search);
+    if (!params.has("lat") || !params.has("lon")) {
+        return;
+    }
+    if (params.has("radius")) {
+        document.getElementById("radius").value = params.get("radius");
+    }
+    analyzeCoordinate(params.get("lat"), params.get("lon"));
 }
 
 // Main Initialization
@@ -296,9 +424,13 @@ document.addEventListener("DOMContentLoaded", function () {
     // Set up dev view toggle
     toggleDevViewButton.addEventListener("click", toggleDevResponse);
     
-    // Load streets
-    loadStreets();
+    // Suggest streets while typing
+    document.getElementById("street").addEventListener("input", createStreetSuggester());
     
     // Set up form submission
     document.getElementById("addressForm").addEventListener("submit", submitAddressForm);
+
+    // Clicks on the map analyze the clicked point
+    showMap();
+    analyzeSharedLink();
 });
\ No newline at end of file